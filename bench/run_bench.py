@@ -0,0 +1,304 @@
+"""run_bench.py - 同期処理のエンドツーエンド・ベンチマーク
+
+合成ワールドを生成し、ローカルフォルダをDriveに見立てたrcloneリモート
+（alias -> ローカルディレクトリ）に対して world_sync の各操作を実行する。
+シナリオごとに所要時間・転送量・プロセス起動数・ピークメモリを表示する。
+
+使い方（リポジトリのルートで）:
+    python bench/run_bench.py --rclone /path/to/rclone --size-mb 64
+    python bench/run_bench.py --backend subprocess --option region_delta=true
+    python bench/run_bench.py --json result.json
+
+rclone本体が必要（Driveには接続しない）。
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil  # noqa: E402
+
+from bench import worldgen  # noqa: E402
+from modules import config_mgr, rclone_rc, transfer_progress, world_sync  # noqa: E402
+
+REMOTE_NAME = "bench"
+WORLD_NAME = "bench_world"
+
+
+# -- 計測 --
+
+class _Counters:
+    """シナリオ実行中の rclone 起動数と転送量を数える"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spawns = 0
+        self.events = {}
+
+    def reset(self) -> None:
+        with self.lock:
+            self.spawns = 0
+            self.events = {}
+
+    def bytes_moved(self) -> int:
+        with self.lock:
+            return sum(event.bytes_done for event in self.events.values())
+
+
+_counters = _Counters()
+
+
+class _CountingPopen(subprocess.Popen):
+    def __init__(self, *args, **kwargs):
+        with _counters.lock:
+            _counters.spawns += 1
+        super().__init__(*args, **kwargs)
+
+
+def _install_hooks() -> None:
+    # subprocess.run も内部で Popen を使うため、これで全ての起動を数えられる
+    subprocess.Popen = _CountingPopen
+    update_event = transfer_progress.update_event
+
+    def counting_update(event, stats):
+        update_event(event, stats)
+        with _counters.lock:
+            # イベントの参照を保持しておけば id が再利用されることはない
+            _counters.events[id(event)] = event
+
+    transfer_progress.update_event = counting_update
+
+
+class _RssSampler:
+    """自プロセスと子プロセス（rclone）の合計RSSの最大値を記録する"""
+
+    def __init__(self, interval: float = 0.05):
+        self._interval = interval
+        self._proc = psutil.Process()
+        self._stop = threading.Event()
+        self.peak = 0
+
+    def _sample(self) -> int:
+        total = 0
+        try:
+            procs = [self._proc, *self._proc.children(recursive=True)]
+        except psutil.Error:
+            return 0
+        for proc in procs:
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+
+    def __enter__(self):
+        self.peak = self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._sample())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self.peak = max(self.peak, self._sample())
+
+
+def measure(name: str, func, log) -> dict:
+    _counters.reset()
+    tracemalloc.reset_peak()
+    with _RssSampler() as rss, contextlib.redirect_stdout(log):
+        print(f"\n===== {name} =====")
+        started = time.perf_counter()
+        try:
+            ok = func()
+            ok = True if ok is None else bool(ok)
+        except Exception as e:
+            print(f"[bench] 例外: {e!r}")
+            ok = False
+        wall = time.perf_counter() - started
+    _current, py_peak = tracemalloc.get_traced_memory()
+    result = {
+        "scenario": name,
+        "ok": ok,
+        "wall_s": round(wall, 3),
+        "bytes_moved": _counters.bytes_moved(),
+        "spawns": _counters.spawns,
+        "py_peak_mb": round(py_peak / 1024 / 1024, 1),
+        "rss_peak_mb": round(rss.peak / 1024 / 1024, 1),
+    }
+    print(f"  {name:<26} {'OK ' if ok else 'NG '}"
+          f"{result['wall_s']:>8.2f}s {result['bytes_moved'] / 1024 / 1024:>9.1f}MB "
+          f"{result['spawns']:>6} {result['py_peak_mb']:>9.1f} {result['rss_peak_mb']:>9.1f}")
+    return result
+
+
+# -- 環境の準備 --
+
+def _parse_option(text: str) -> tuple[str, object]:
+    key, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"key=value 形式で指定してください: {text}")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def _make_config(root: str, rclone: str, instance: str, options: dict) -> dict:
+    config = {
+        "rclone_exe_path": rclone,
+        "rclone_config_path": os.path.join(root, "rclone.conf"),
+        "rclone_drive_folder_id": "bench",
+        "rclone_remote_name": REMOTE_NAME,
+        "world_name": WORLD_NAME,
+        "curseforge_instance_path": instance,
+        "player_name": "bench",
+        "backup_generations": 5,
+        "gas_url": "",
+        "lock_timeout_hours": 8,
+        # 過去の実績による自動調整は結果を揺らすため既定で無効
+        "adaptive_tuning": False,
+    }
+    config.update(options)
+    return config
+
+
+def _setup(root: str, rclone: str, options: dict) -> tuple[dict, dict]:
+    remote_dir = os.path.join(root, "remote")
+    os.makedirs(remote_dir)
+    with open(os.path.join(root, "rclone.conf"), "w", encoding="utf-8") as f:
+        f.write(f"[{REMOTE_NAME}]\ntype = alias\nremote = {remote_dir}\n")
+    # 学習データ・ログ（data/）もベンチ用フォルダに向ける
+    os.makedirs(os.path.join(root, "app"))
+    config_mgr._find_base = lambda: os.path.join(root, "app")
+    host = _make_config(root, rclone, os.path.join(root, "host"), options)
+    guest = _make_config(root, rclone, os.path.join(root, "guest"), options)
+    return host, guest
+
+
+def _world_path(config: dict) -> str:
+    return os.path.join(config["curseforge_instance_path"], "saves",
+                        config["world_name"])
+
+
+# -- シナリオ --
+
+def run_scenarios(host: dict, guest: dict, args, log) -> list[dict]:
+    results = []
+    host_world = _world_path(host)
+
+    def run(name, func):
+        results.append(measure(name, func, log))
+
+    info = worldgen.make_world(host_world, args.size_mb, args.small_files, args.seed)
+    print(f"[bench] 合成ワールド: {info['bytes'] / 1024 / 1024:.1f} MB, "
+          f"{info['files']}ファイル")
+    print(f"  {'scenario':<26} {'':3}{'wall':>9} {'moved':>11} {'spawns':>6} "
+          f"{'py_peak':>9} {'rss_peak':>9}")
+
+    run("upload_initial", lambda: world_sync.upload_world(host))
+    run("upload_noop", lambda: world_sync.upload_world(host))
+    worldgen.mutate_world(host_world, seed=args.seed + 1, tick=2000)
+    run("upload_incremental", lambda: world_sync.upload_world(host))
+
+    run("download_fresh", lambda: world_sync.download_world(guest))
+    worldgen.mutate_world(host_world, seed=args.seed + 2, tick=3000)
+    with contextlib.redirect_stdout(log):
+        world_sync.upload_world(host)
+    run("download_incremental", lambda: world_sync.download_world(guest))
+
+    dedup = dict(host, backup_mode="dedup")
+    run("backup_dedup_initial", lambda: world_sync.create_backup(dedup))
+    worldgen.mutate_world(host_world, seed=args.seed + 3, tick=4000)
+    run("backup_dedup_incremental", lambda: world_sync.create_backup(dedup))
+
+    # コピー方式: 世代名が秒単位のため、1秒以上空けて複数世代を作る
+    copy = dict(host, backup_mode="copy", backup_generations=99)
+    run("backup_copy", lambda: world_sync.create_backup(copy))
+    for _ in range(2):
+        time.sleep(1.1)
+        with contextlib.redirect_stdout(log):
+            world_sync.create_backup(copy)
+    run("cleanup_old_backups", lambda: world_sync._cleanup_old_backups(copy, 1))
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="world_sync ベンチマーク")
+    parser.add_argument("--rclone", default=shutil.which("rclone"),
+                        help="rclone実行ファイル（既定: PATH上のrclone）")
+    parser.add_argument("--backend", choices=("rcd", "subprocess"), default="rcd",
+                        help="rcloneの呼び出し方式（既定: rcd）")
+    parser.add_argument("--size-mb", type=float, default=64,
+                        help="合成ワールドのリージョン合計サイズ（既定: 64）")
+    parser.add_argument("--small-files", type=int, default=400,
+                        help="小さなデータファイルの数（既定: 400）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--option", type=_parse_option, action="append", default=[],
+                        metavar="KEY=VALUE",
+                        help="設定を上書き（値はJSONとして解釈。例: region_delta=true）")
+    parser.add_argument("--json", metavar="PATH", help="結果をJSONで保存")
+    parser.add_argument("--keep", action="store_true",
+                        help="作業フォルダを削除せずに残す")
+    args = parser.parse_args()
+
+    if not args.rclone or not os.path.isfile(args.rclone):
+        print("[bench] rcloneが見つかりません。--rclone で指定してください。")
+        return 2
+
+    root = tempfile.mkdtemp(prefix="mcmd_bench_")
+    options = dict(args.option)
+    host, guest = _setup(root, args.rclone, options)
+    log_path = os.path.join(root, "bench.log")
+    print(f"[bench] 作業フォルダ: {root}")
+
+    _install_hooks()
+    tracemalloc.start()
+    try:
+        if args.backend == "rcd" and not rclone_rc.start_daemon(
+                args.rclone, host["rclone_config_path"], host["rclone_drive_folder_id"]):
+            print("[bench] rcdを起動できません。サブプロセス方式で実行します。")
+        with open(log_path, "w", encoding="utf-8") as log:
+            results = run_scenarios(host, guest, args, log)
+    finally:
+        rclone_rc.stop_daemon()
+        tracemalloc.stop()
+
+    report = {
+        "backend": "rcd" if args.backend == "rcd" else "subprocess",
+        "size_mb": args.size_mb,
+        "small_files": args.small_files,
+        "seed": args.seed,
+        "options": options,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[bench] 結果を保存しました: {args.json}")
+    if args.keep:
+        print(f"[bench] 作業フォルダを残しました（ログ: {log_path}）")
+    else:
+        shutil.rmtree(root, ignore_errors=True)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""worldgen.py - ベンチマーク用の合成ワールド生成
+
+実際のワールドに近い構成（チャンクNBT入りのリージョン・エンティティ・POI、
+多数の小さなデータファイル、level.dat / playerdata）を、シード固定で生成する。
+"""
+
+import io
+import json
+import os
+import random
+import struct
+import zlib
+
+import nbtlib
+from nbtlib.tag import (
+    Byte, Compound, Double, Int, List, Long, LongArray, String,
+)
+
+from modules import region_delta
+
+_BLOCKS = [
+    "minecraft:stone", "minecraft:deepslate", "minecraft:dirt",
+    "minecraft:grass_block", "minecraft:water", "minecraft:air",
+    "minecraft:andesite", "minecraft:coal_ore", "minecraft:iron_ore",
+    "minecraft:gravel",
+]
+_BIOMES = ["minecraft:plains", "minecraft:forest", "minecraft:river"]
+_DATA_VERSION = 3953
+
+
+def _packed_longs(rnd: random.Random, n: int, noise: float) -> LongArray:
+    # 大半は規則的なパターン、一部だけランダム（実際の地形の圧縮率に近づける）
+    patterns = [rnd.getrandbits(64) for _ in range(6)]
+    values = [
+        rnd.getrandbits(64) if rnd.random() < noise else rnd.choice(patterns)
+        for _ in range(n)
+    ]
+    return LongArray([v - (1 << 64) if v >= 1 << 63 else v for v in values])
+
+
+def chunk_nbt(rnd: random.Random, cx: int, cz: int, tick: int) -> bytes:
+    sections = []
+    for y in range(-4, 20):
+        palette = rnd.sample(_BLOCKS, rnd.randint(1, 6))
+        section = {
+            "Y": Byte(y),
+            "block_states": Compound({
+                "palette": List[Compound](
+                    [Compound({"Name": String(name)}) for name in palette]),
+            }),
+            "biomes": Compound({
+                "palette": List[String]([String(rnd.choice(_BIOMES))]),
+            }),
+        }
+        if len(palette) > 1:
+            section["block_states"]["data"] = _packed_longs(rnd, 256, 0.15)
+        sections.append(Compound(section))
+    root = Compound({
+        "DataVersion": Int(_DATA_VERSION),
+        "xPos": Int(cx),
+        "zPos": Int(cz),
+        "yPos": Int(-4),
+        "Status": String("minecraft:full"),
+        "LastUpdate": Long(tick),
+        "InhabitedTime": Long(rnd.randint(0, 200000)),
+        "sections": List[Compound](sections),
+        "Heightmaps": Compound({
+            name: _packed_longs(rnd, 37, 0.5)
+            for name in ("MOTION_BLOCKING", "OCEAN_FLOOR", "WORLD_SURFACE")
+        }),
+        "block_entities": List[Compound](),
+    })
+    buf = io.BytesIO()
+    nbtlib.File(root, gzipped=False).write(buf)
+    return buf.getvalue()
+
+
+def make_region(path: str, rx: int, rz: int, fill: float, seed: int,
+                tick: int = 1000) -> None:
+    rnd = random.Random(seed)
+    chunks = {}
+    for i in range(region_delta.CHUNKS_PER_REGION):
+        if rnd.random() >= fill:
+            continue
+        cx, cz = rx * 32 + i % 32, rz * 32 + i // 32
+        payload = zlib.compress(chunk_nbt(rnd, cx, cz, tick))
+        chunks[i] = (tick, b"\x02" + payload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    region_delta.write_region(path, chunks)
+
+
+def touch_region(path: str, fraction: float, seed: int, tick: int) -> int:
+    """リージョン内のチャンクの一部を書き換える（プレイによる変更の再現）"""
+    rnd = random.Random(seed)
+    chunks = region_delta.read_chunks(path)
+    changed = 0
+    for i in list(chunks):
+        if rnd.random() < fraction:
+            rx, rz = _region_coords(path)
+            cx, cz = rx * 32 + i % 32, rz * 32 + i // 32
+            chunks[i] = (tick, b"\x02" + zlib.compress(chunk_nbt(rnd, cx, cz, tick)))
+            changed += 1
+    region_delta.write_region(path, chunks)
+    return changed
+
+
+def _region_coords(path: str) -> tuple[int, int]:
+    _r, x, z, _ext = os.path.basename(path).split(".")
+    return int(x), int(z)
+
+
+def _player_dat(rnd: random.Random) -> bytes:
+    root = Compound({
+        "DataVersion": Int(_DATA_VERSION),
+        "Pos": List[Double]([Double(rnd.uniform(-500, 500)), Double(64.0),
+                             Double(rnd.uniform(-500, 500))]),
+        "Dimension": String("minecraft:overworld"),
+        "Inventory": List[Compound]([
+            Compound({"id": String(rnd.choice(_BLOCKS)), "count": Int(64),
+                      "Slot": Byte(slot)})
+            for slot in range(rnd.randint(5, 36))
+        ]),
+    })
+    buf = io.BytesIO()
+    nbtlib.File(root, gzipped=True).write(buf)
+    return buf.getvalue()
+
+
+def make_world(root: str, size_mb: float = 64, small_files: int = 400,
+               seed: int = 0) -> dict:
+    """合成ワールドを生成し、{"regions": 件数, "files": 件数, "bytes": 合計} を返す"""
+    rnd = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+
+    level = Compound({"Data": Compound({
+        "LevelName": String("bench"),
+        "SpawnX": Int(0), "SpawnY": Int(64), "SpawnZ": Int(0),
+        "DataVersion": Int(_DATA_VERSION),
+    })})
+    nbtlib.File(level, gzipped=True).save(os.path.join(root, "level.dat"))
+
+    # リージョン: 目標サイズに達するまで、スポーンから渦巻き状に配置
+    target = size_mb * 1024 * 1024
+    total = 0
+    n = 0
+    dims = ["", "", "", "DIM-1/", "DIM1/"]
+    while total < target:
+        ring = int((n ** 0.5) // 2)
+        rx, rz = rnd.randint(-ring, ring), rnd.randint(-ring, ring)
+        dim = dims[n % len(dims)]
+        path = os.path.join(root, *f"{dim}region/r.{rx}.{rz}.mca".split("/"))
+        n += 1
+        if os.path.exists(path):
+            continue
+        make_region(path, rx, rz, fill=rnd.uniform(0.2, 0.9), seed=seed * 7919 + n)
+        total += os.path.getsize(path)
+        for kind in ("entities", "poi"):
+            small = os.path.join(root, *f"{dim}{kind}/r.{rx}.{rz}.mca".split("/"))
+            make_region(small, rx, rz, fill=0.05, seed=seed * 104729 + n)
+            total += os.path.getsize(small)
+
+    # 小さなデータファイル
+    folders = ["playerdata", "advancements", "stats", "data"]
+    for i in range(small_files):
+        folder = folders[i % len(folders)]
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+        uid = f"{rnd.getrandbits(128):032x}"
+        if folder == "playerdata":
+            path = os.path.join(root, folder, f"{uid}.dat")
+            data = _player_dat(rnd)
+        elif folder == "data":
+            path = os.path.join(root, folder, f"map_{i}.dat")
+            data = zlib.compress(os.urandom(64) * rnd.randint(8, 256))
+        else:
+            path = os.path.join(root, folder, f"{uid}.json")
+            data = json.dumps({
+                f"minecraft:{rnd.choice(_BLOCKS)[10:]}_{k}": rnd.randint(0, 9999)
+                for k in range(rnd.randint(10, 200))
+            }).encode()
+        with open(path, "wb") as f:
+            f.write(data)
+        total += len(data)
+
+    files = sum(len(names) for _root, _dirs, names in os.walk(root))
+    return {"regions": n, "files": files, "bytes": total}
+
+
+def mutate_world(root: str, fraction: float = 0.05, seed: int = 1,
+                 tick: int = 2000) -> int:
+    """プレイ相当の変更を加え、書き換えたチャンク数を返す"""
+    rnd = random.Random(seed)
+    changed = 0
+    for dirpath, _dirs, names in os.walk(root):
+        for name in sorted(names):
+            path = os.path.join(dirpath, name)
+            if name.endswith(".mca") and os.path.basename(dirpath) == "region":
+                if rnd.random() < 0.3:
+                    changed += touch_region(path, fraction, rnd.getrandbits(32), tick)
+            elif name.endswith((".dat", ".json")) and rnd.random() < fraction * 4:
+                with open(path, "ab") as f:
+                    f.write(struct.pack(">Q", tick))
+    return changed
@@ -3,7 +3,7 @@ chcp 65001 >nul 2>&1
 echo === MC MultiDrive Build ===
 echo.
 
-pip install pyinstaller FreeSimpleGUI requests nbtlib psutil pyperclip
+pip install pyinstaller FreeSimpleGUI requests nbtlib psutil pyperclip zstandard
 
 pyinstaller --onefile --noconsole --name MCMultiDrive main.py --hidden-import=nbtlib --hidden-import=FreeSimpleGUI
 
@@ -7,20 +7,125 @@
  *   C: host
  *   D: domain
  *   E: lock_timestamp (UTC ISO8601)
+ *   F: version (status version of the last write to this row)
+ *   G: lease_expires (UTC ISO8601; the host renews it with "heartbeat")
+ *
+ * Script property "status_version" is incremented on every write, so
+ * clients can ask list_worlds for the rows changed since their version.
+ *
+ * A world -> row index is kept in the script cache so an action reads only
+ * its own row; writes to a row are a single setValues under the script lock.
+ *
+ * The host lock is a lease: set_online grants it for "lease" seconds and the
+ * host extends it with heartbeats. Once it lapses, another host may take
+ * over. Rows locked before leases existed, and locks taken by old clients
+ * that send no "lease" (and never heartbeat), expire LEGACY_LOCK_HOURS after
+ * their lock_timestamp.
  */
 
+var COLUMNS = 7;
+var DEFAULT_LEASE = 300;
+var MAX_LEASE = 3600;
+var LEGACY_LOCK_HOURS = 8;
+var INDEX_KEY = "row_index";
+var INDEX_TTL = 21600;  // CacheService maximum (6 h)
+
 function getSheet() {
   return SpreadsheetApp.getActiveSpreadsheet().getSheetByName("status");
 }
 
-function findRow(sheet, worldName) {
-  var data = sheet.getDataRange().getValues();
-  for (var i = 0; i < data.length; i++) {
-    if (data[i][0] === worldName) {
-      return i + 1;
+// --- Row index ---
+
+function buildIndex(sheet) {
+  var index = {};
+  var lastRow = sheet.getLastRow();
+  if (lastRow > 0) {
+    var names = sheet.getRange(1, 1, lastRow, 1).getValues();
+    for (var i = 0; i < names.length; i++) {
+      if (names[i][0]) index[names[i][0]] = i + 1;
     }
   }
-  return -1;
+  CacheService.getScriptCache().put(INDEX_KEY, JSON.stringify(index), INDEX_TTL);
+  return index;
+}
+
+function cachedIndex(sheet) {
+  var cached = CacheService.getScriptCache().get(INDEX_KEY);
+  return cached ? JSON.parse(cached) : buildIndex(sheet);
+}
+
+function dropIndex() {
+  CacheService.getScriptCache().remove(INDEX_KEY);
+}
+
+// Returns {row, values} for the world, or null. The cached row is checked
+// against column A, so a stale index (rows edited by hand) is rebuilt.
+function locate(sheet, worldName) {
+  if (!worldName) return null;
+  var row = cachedIndex(sheet)[worldName];
+  if (row) {
+    var values = sheet.getRange(row, 1, 1, COLUMNS).getValues()[0];
+    if (values[0] === worldName) return {row: row, values: values};
+  }
+  row = buildIndex(sheet)[worldName];
+  if (!row) return null;
+  return {row: row, values: sheet.getRange(row, 1, 1, COLUMNS).getValues()[0]};
+}
+
+function currentVersion() {
+  return Number(PropertiesService.getScriptProperties().getProperty("status_version") || 0);
+}
+
+function nextVersion() {
+  return currentVersion() + 1;
+}
+
+// Publish a version whose rows have been written. Called under the script lock.
+function publishVersion(version) {
+  // Flush first: a reader that sees the new version must also see the rows.
+  SpreadsheetApp.flush();
+  PropertiesService.getScriptProperties().setProperty("status_version", String(version));
+  return version;
+}
+
+// Write columns B..G of a row (version included) in one call and publish it.
+function writeRow(sheet, row, status, host, domain, lockTimestamp, leaseExpires) {
+  var version = nextVersion();
+  sheet.getRange(row, 2, 1, COLUMNS - 1)
+    .setValues([[status, host, domain, lockTimestamp, version, leaseExpires]]);
+  return publishVersion(version);
+}
+
+// --- Lease ---
+
+function leaseSeconds(data) {
+  var lease = Number(data.lease) || DEFAULT_LEASE;
+  return Math.max(30, Math.min(lease, MAX_LEASE));
+}
+
+function leaseUntil(seconds) {
+  return new Date(Date.now() + seconds * 1000).toISOString();
+}
+
+function leaseExpiry(values) {
+  if (values[6]) return new Date(values[6]).getTime();
+  if (values[4]) return new Date(values[4]).getTime() + LEGACY_LOCK_HOURS * 3600000;
+  return 0;
+}
+
+function leaseExpired(values) {
+  return values[1] !== "online" || !(leaseExpiry(values) > Date.now());
+}
+
+function rowStatus(values) {
+  return {
+    world_name:     values[0],
+    status:         values[1] || "offline",
+    host:           values[2] || "",
+    domain:         values[3] || "",
+    lock_timestamp: values[4] || "",
+    lease_expires:  values[6] || "",
+  };
 }
 
 function jsonResponse(obj) {
@@ -35,44 +140,45 @@ function doGet(e) {
   var sheet = getSheet();
 
   if (action === "list_worlds") {
-    return listWorlds(sheet);
+    return jsonResponse(listWorlds(sheet, e.parameter.since));
   }
   if (action === "get_status") {
-    return getStatus(sheet, e.parameter.world || "");
+    return jsonResponse(getStatus(sheet, e.parameter.world || ""));
   }
 
   return jsonResponse({error: "unknown action"});
 }
 
-function listWorlds(sheet) {
+// With "since", returns {not_modified} if nothing changed, otherwise only
+// the rows written after that version plus the names of all worlds (so the
+// client can drop deleted ones).
+function listWorlds(sheet, since) {
+  var version = currentVersion();
+  var partial = since !== undefined && since !== "";
+  if (partial && Number(since) === version) {
+    return {not_modified: true, version: version};
+  }
   var data = sheet.getDataRange().getValues();
   var worlds = [];
+  var names = [];
   for (var i = 0; i < data.length; i++) {
     if (!data[i][0]) continue;
-    worlds.push({
-      world_name:     data[i][0],
-      status:         data[i][1] || "offline",
-      host:           data[i][2] || "",
-      domain:         data[i][3] || "",
-      lock_timestamp: data[i][4] || "",
-    });
+    names.push(data[i][0]);
+    if (partial && Number(data[i][5] || 0) <= Number(since)) continue;
+    worlds.push(rowStatus(data[i]));
   }
-  return jsonResponse({worlds: worlds});
+  return {worlds: worlds, names: names, version: version, partial: partial};
 }
 
 function getStatus(sheet, worldName) {
-  var row = findRow(sheet, worldName);
-  if (row === -1) {
-    return jsonResponse({status: "not_found"});
+  var found = locate(sheet, worldName);
+  if (!found) {
+    return {status: "not_found"};
   }
-  var vals = sheet.getRange(row, 1, 1, 5).getValues()[0];
-  return jsonResponse({
-    world_name:     vals[0],
-    status:         vals[1] || "offline",
-    host:           vals[2] || "",
-    domain:         vals[3] || "",
-    lock_timestamp: vals[4] || "",
-  });
+  // Judged by the server clock, so client clock skew does not matter
+  var result = rowStatus(found.values);
+  result.lease_expired = leaseExpired(found.values);
+  return result;
 }
 
 // --- POST ---
@@ -80,21 +186,36 @@ function getStatus(sheet, worldName) {
 function doPost(e) {
   var data = JSON.parse(e.postData.contents);
   var sheet = getSheet();
-  var action = data.action || "";
 
+  // Every write is read-modify-write of one row: serialize them.
+  var lock = LockService.getScriptLock();
+  lock.waitLock(10000);
+  try {
+    return jsonResponse(handleWrite(sheet, data));
+  } finally {
+    lock.releaseLock();
+  }
+}
+
+function handleWrite(sheet, data) {
+  var action = data.action || "";
   switch (action) {
     case "set_online":
       return setOnline(sheet, data);
     case "set_offline":
       return setOffline(sheet, data);
+    case "heartbeat":
+      return heartbeat(sheet, data);
     case "update_domain":
       return updateDomain(sheet, data);
     case "add_world":
       return addWorld(sheet, data);
     case "delete_world":
       return deleteWorld(sheet, data);
+    case "batch":
+      return batch(sheet, data);
     default:
-      return jsonResponse({success: false, error: "unknown action"});
+      return {success: false, error: "unknown action"};
   }
 }
 
@@ -104,104 +225,192 @@ function setOnline(sheet, data) {
   var domain = data.domain || "preparing...";
 
   if (!world || !host) {
-    return jsonResponse({success: false, error: "missing world or host"});
+    return {success: false, error: "missing world or host"};
   }
 
-  var row = findRow(sheet, world);
-  if (row === -1) {
-    return jsonResponse({success: false, error: "world not found"});
+  var found = locate(sheet, world);
+  if (!found) {
+    return {success: false, error: "world not found"};
   }
 
-  var currentStatus = sheet.getRange(row, 2).getValue();
-  var currentHost   = sheet.getRange(row, 3).getValue();
+  // Compare-and-set: runs under the script lock taken in doPost, so of two
+  // racing hosts only the first sees the world free.
+  var currentStatus = found.values[1];
+  var currentHost   = found.values[2];
+  var previousHost  = "";
 
   if (currentStatus === "online" && currentHost && currentHost !== host) {
-    return jsonResponse({
-      success: false,
-      current_host: currentHost,
-      error: "already hosted by " + currentHost,
-    });
+    var expired = leaseExpired(found.values);
+    // An expired lease is taken over only when the client asks for it
+    // (the user confirmed), never as a side effect of a plain set_online.
+    if (!expired || !data.takeover) {
+      return {
+        success: false,
+        current_host: currentHost,
+        lease_expired: expired,
+        error: "already hosted by " + currentHost,
+      };
+    }
+    previousHost = currentHost;
   }
 
   var now = new Date().toISOString();
-  sheet.getRange(row, 2).setValue("online");
-  sheet.getRange(row, 3).setValue(host);
-  sheet.getRange(row, 4).setValue(domain);
-  sheet.getRange(row, 5).setValue(now);
+  // Old clients never heartbeat: leave the lease empty so their lock keeps
+  // the LEGACY_LOCK_HOURS expiry instead of lapsing mid-session.
+  var expires = data.lease ? leaseUntil(leaseSeconds(data)) : "";
+  var version = writeRow(sheet, found.row, "online", host, domain, now, expires);
+  return {
+    success: true,
+    current_host: host,
+    previous_host: previousHost,
+    lease_expires: expires,
+    version: version,
+  };
+}
+
+// Extend the lease of the current host. Does not bump the status version:
+// only the lease column changes, and listing clients do not need to refetch.
+function heartbeat(sheet, data) {
+  var world = data.world || "";
+  var host  = data.host  || "";
+  if (!world || !host) {
+    return {success: false, error: "missing world or host"};
+  }
 
-  return jsonResponse({success: true, current_host: host});
+  var found = locate(sheet, world);
+  if (!found) {
+    return {success: false, error: "world not found"};
+  }
+  if (found.values[1] !== "online" || found.values[2] !== host) {
+    return {
+      success: false,
+      current_host: found.values[1] === "online" ? found.values[2] : "",
+      error: "lease lost",
+    };
+  }
+
+  var expires = leaseUntil(leaseSeconds(data));
+  sheet.getRange(found.row, 7).setValue(expires);
+  return {success: true, lease_expires: expires};
 }
 
 function setOffline(sheet, data) {
   var world = data.world || "";
+  var host  = data.host  || "";
   if (!world) {
-    return jsonResponse({success: false, error: "missing world"});
+    return {success: false, error: "missing world"};
   }
 
-  var row = findRow(sheet, world);
-  if (row === -1) {
-    return jsonResponse({success: false, error: "world not found"});
+  var found = locate(sheet, world);
+  if (!found) {
+    return {success: false, error: "world not found"};
+  }
+  // 遅れて届いた解放で、引き継いだ別のホストのロックを外さない
+  // （hostを送らない古いクライアントは従来どおり確認しない）
+  if (host && found.values[2] !== host) {
+    return {success: false, current_host: found.values[2], error: "not host"};
   }
 
-  sheet.getRange(row, 2).setValue("offline");
-  sheet.getRange(row, 3).setValue("");
-  sheet.getRange(row, 4).setValue("");
-  sheet.getRange(row, 5).setValue("");
-
-  return jsonResponse({success: true});
+  var version = writeRow(sheet, found.row, "offline", "", "", "", "");
+  return {success: true, version: version};
 }
 
 function updateDomain(sheet, data) {
   var world  = data.world  || "";
+  var host   = data.host   || "";
   var domain = data.domain || "";
 
   if (!world) {
-    return jsonResponse({success: false, error: "missing world"});
+    return {success: false, error: "missing world"};
   }
 
-  var row = findRow(sheet, world);
-  if (row === -1) {
-    return jsonResponse({success: false, error: "world not found"});
+  var found = locate(sheet, world);
+  if (!found) {
+    return {success: false, error: "world not found"};
+  }
+  if (host && found.values[2] !== host) {
+    return {success: false, current_host: found.values[2], error: "not host"};
   }
 
-  sheet.getRange(row, 4).setValue(domain);
-  return jsonResponse({success: true});
+  var v = found.values;
+  var version = writeRow(sheet, found.row, v[1], v[2], domain, v[4], v[6]);
+  return {success: true, version: version};
 }
 
 function addWorld(sheet, data) {
   var world = data.world || "";
   if (!world) {
-    return jsonResponse({success: false, error: "missing world"});
+    return {success: false, error: "missing world"};
   }
 
-  var row = findRow(sheet, world);
-  if (row !== -1) {
-    return jsonResponse({success: true, message: "already exists"});
+  if (locate(sheet, world)) {
+    return {success: true, message: "already exists"};
   }
 
-  var lastRow = sheet.getLastRow();
-  sheet.getRange(lastRow + 1, 1).setValue(world);
-  sheet.getRange(lastRow + 1, 2).setValue("offline");
-
-  return jsonResponse({success: true});
+  var version = nextVersion();
+  var row = sheet.getLastRow() + 1;
+  sheet.getRange(row, 1, 1, COLUMNS).setValues([[world, "offline", "", "", "", version, ""]]);
+  var index = cachedIndex(sheet);
+  index[world] = row;
+  CacheService.getScriptCache().put(INDEX_KEY, JSON.stringify(index), INDEX_TTL);
+  publishVersion(version);
+  return {success: true, version: version};
 }
 
 function deleteWorld(sheet, data) {
   var world = data.world || "";
   if (!world) {
-    return jsonResponse({success: false, error: "missing world"});
+    return {success: false, error: "missing world"};
   }
 
-  var row = findRow(sheet, world);
-  if (row === -1) {
-    return jsonResponse({success: false, error: "world not found"});
+  var found = locate(sheet, world);
+  if (!found) {
+    return {success: false, error: "world not found"};
   }
 
-  var status = sheet.getRange(row, 2).getValue();
-  if (status === "online") {
-    return jsonResponse({success: false, error: "cannot delete online world"});
+  if (found.values[1] === "online") {
+    return {success: false, error: "cannot delete online world"};
   }
 
-  sheet.deleteRow(row);
-  return jsonResponse({success: true});
+  sheet.deleteRow(found.row);
+  // Rows below the deleted one have moved up
+  dropIndex();
+  var version = publishVersion(nextVersion());
+  return {success: true, version: version};
+}
+
+// --- Batch ---
+
+// Runs data.ops (each an action payload, or get_status) in order within a
+// single script lock, so no other request sees or writes the sheet in
+// between. Stops at the first failed operation: the rest are reported as
+// skipped and not run (Sheets has no rollback, so earlier writes stay).
+// With data.list, the world list (as list_worlds with data.since) is
+// returned after the operations.
+function batch(sheet, data) {
+  var ops = data.ops || [];
+  var results = [];
+  var failed = false;
+  for (var i = 0; i < ops.length; i++) {
+    var op = ops[i] || {};
+    if (failed) {
+      results.push({success: false, skipped: true, error: "skipped"});
+      continue;
+    }
+    var result;
+    if (op.action === "get_status") {
+      result = getStatus(sheet, op.world || "");
+    } else if (op.action === "batch") {
+      result = {success: false, error: "unknown action"};
+    } else {
+      result = handleWrite(sheet, op);
+    }
+    results.push(result);
+    if (result.success === false) failed = true;
+  }
+  var response = {success: !failed, results: results};
+  if (data.list) {
+    response.list = listWorlds(sheet, data.since);
+  }
+  return response;
 }
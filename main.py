@@ -21,14 +21,21 @@ from modules.config_mgr import (
     set_instance_path, get_instance_path, build_config,
 )
 from modules.status_mgr import (
-    list_worlds, get_status, set_online, update_domain,
-    set_offline, add_world, is_lock_expired, delete_world,
+    list_worlds, get_status, acquire_host, update_domain,
+    set_offline, add_world, is_lease_expired, delete_world, shutdown,
+    start_heartbeat, LEASE_SECONDS, LIST_TTL_SECONDS,
 )
 from modules.world_sync import (
     download_world, upload_world, create_backup, check_remote_world_exists,
-    archive_world,
+    archive_world, snapshot_world, is_remote_newer, resolve_conflicts,
+    list_backups, restore_backup,
 )
 from modules.nbt_editor import fix_level_dat, update_servers_dat
+from modules import (
+    bandwidth, batch, journal, local_backup, rclone_rc, timeline, transfer_progress,
+)
+from modules.prefetch import Prefetcher, record_host
+from modules.replicator import Replicator
 from modules.log_watcher import watch_for_domain
 from modules.process_monitor import (
     find_minecraft_process, wait_for_exit, wait_for_minecraft_start,
@@ -302,6 +309,232 @@ def _show_settings(base: str, worlds: list[dict]) -> None:
     win.close()
 
 
+# --- セッション計測レポート ---
+
+def _show_timeline() -> None:
+    sessions = timeline.load_sessions()
+    worlds = sorted({(e["session"] or {}).get("world", "") for e in sessions} - {""})
+    layout = [
+        [sg.Text("セッション計測", font=("Helvetica", 14, "bold"))],
+        [sg.Text("ワールド:"),
+         sg.Combo(["（すべて）", *worlds], default_value="（すべて）",
+                  key="-TWORLD-", readonly=True, enable_events=True),
+         sg.Text("表示するセッション数:"),
+         sg.Spin(list(range(1, 51)), initial_value=5, key="-TLIMIT-",
+                 size=(4, 1), enable_events=True)],
+        [sg.Multiline(timeline.format_report(sessions), size=(100, 30),
+                      key="-TREPORT-", disabled=True, font=("Consolas", 9))],
+        [sg.Button("閉じる", key="-TCLOSE-", size=(10, 1))],
+    ]
+    win = sg.Window("セッション計測", layout, finalize=True, modal=True)
+    while True:
+        event, values = win.read()
+        if event in (sg.WIN_CLOSED, "-TCLOSE-"):
+            break
+        world = values["-TWORLD-"]
+        selected = [
+            e for e in sessions
+            if world == "（すべて）" or (e["session"] or {}).get("world") == world
+        ]
+        try:
+            limit = int(values["-TLIMIT-"])
+        except (TypeError, ValueError):
+            limit = 5
+        win["-TREPORT-"].update(timeline.format_report(selected, limit))
+    win.close()
+
+
+# --- 一括操作ダイアログ ---
+
+def _show_batch(base: str, worlds: list[dict]) -> tuple | None:
+    """(操作名, ワールド名リスト, 同時実行数, 帯域上限KiB/s) を返す"""
+    personal = load_personal(base) or {}
+    instance_paths = personal.get("instance_paths", {})
+    world_names = [
+        w.get("world_name", "") for w in worlds
+        if instance_paths.get(w.get("world_name", ""))
+    ]
+    if not world_names:
+        sg.popup("インスタンスパスが設定されたワールドがありません。", title="情報")
+        return None
+    labels = {label: op for op, (label, _func) in batch.OPERATIONS.items()}
+
+    layout = [
+        [sg.Text("一括操作", font=("Helvetica", 14, "bold"))],
+        [sg.HorizontalSeparator()],
+        [sg.Text("操作:", size=(14, 1)),
+         sg.Combo(list(labels), default_value=next(iter(labels)),
+                  key="-BOP-", readonly=True, size=(20, 1))],
+        [sg.Text("対象ワールド:")],
+        [sg.Listbox(world_names, default_values=world_names, size=(40, 8),
+                    key="-BWORLDS-",
+                    select_mode=sg.LISTBOX_SELECT_MODE_MULTIPLE)],
+        [sg.Text("同時実行数:", size=(14, 1)),
+         sg.Spin([1, 2, 3, 4], initial_value=2, key="-BWORKERS-", size=(4, 1))],
+        [sg.Text("帯域上限 KiB/s:", size=(14, 1)),
+         sg.Input("0", key="-BLIMIT-", size=(8, 1)),
+         sg.Text("（0で無制限）")],
+        [sg.Text("")],
+        [sg.Button("実行", key="-BRUN-", size=(10, 1)),
+         sg.Button("キャンセル", key="-CANCEL-", size=(10, 1))],
+    ]
+    win = sg.Window("一括操作", layout, finalize=True, modal=True)
+    result = None
+    while True:
+        event, values = win.read()
+        if event in (sg.WIN_CLOSED, "-CANCEL-"):
+            break
+        if event == "-BRUN-":
+            names = values["-BWORLDS-"]
+            if not names:
+                sg.popup_error("ワールドを選択してください。", title="エラー")
+                continue
+            try:
+                workers = int(values["-BWORKERS-"])
+                limit = int(values["-BLIMIT-"].strip() or 0)
+            except ValueError:
+                sg.popup_error("数値を入力してください。", title="エラー")
+                continue
+            result = (labels[values["-BOP-"]], names, workers, max(0, limit))
+            break
+    win.close()
+    return result
+
+
+def _batch_thread(window: sg.Window, base: str, op: str, names: list[str],
+                  workers: int, limit_kb: int) -> None:
+    def send(msg):
+        window.write_event_value("-PRINT-", msg)
+
+    label = batch.OPERATIONS[op][0]
+    configs = []
+    for name in names:
+        config = build_config(name, base)
+        if config and config["curseforge_instance_path"]:
+            configs.append(config)
+        else:
+            send(f"[一括] {name}: 設定の構築に失敗したためスキップします。")
+
+    finished = [0]
+    lock = threading.Lock()
+
+    def on_status(world, status):
+        if status in (batch.DONE, batch.FAILED):
+            with lock:
+                finished[0] += 1
+            send(f"[一括] {world}: {status}（{finished[0]}/{len(configs)}）")
+        elif status == batch.RUNNING:
+            send(f"[一括] {world}: {label}を開始")
+
+    send(f"[一括] {label}: {len(configs)}ワールド（同時{workers}件"
+         + (f"、合計{limit_kb} KiB/s" if limit_kb else "") + "）")
+    try:
+        results = batch.run_batch(op, configs, workers, limit_kb, on_status)
+        failed = [w for w, ok in results.items() if not ok]
+        if failed:
+            send(f"[一括] 失敗: {', '.join(failed)}")
+        else:
+            send(f"[一括] {label}がすべて完了しました。")
+    except Exception as e:
+        send(f"[エラー] 一括操作中に例外発生: {e}")
+    window.write_event_value("-HOST-DONE-", True)
+
+
+# --- 世代の復元（ローカル世代・Driveのバックアップ）---
+
+def _show_restore(title: str, heading: str, names: list[str],
+                  rows: list[str]) -> tuple[str, bool] | None:
+    """(世代名, Driveにもアップロードするか) を返す"""
+    layout = [
+        [sg.Text(heading, font=("Helvetica", 14, "bold"))],
+        [sg.HorizontalSeparator()],
+        [sg.Listbox(rows, default_values=rows[:1], size=(50, 8), key="-LGENS-",
+                    select_mode=sg.LISTBOX_SELECT_MODE_SINGLE)],
+        [sg.Checkbox("復元後にDriveにもアップロードする", default=True,
+                     key="-LUPLOAD-")],
+        [sg.Text("現在の状態もローカル世代として保存してから復元します。",
+                 font=("Helvetica", 9))],
+        [sg.Button("復元", key="-LRUN-", size=(10, 1)),
+         sg.Button("キャンセル", key="-CANCEL-", size=(10, 1))],
+    ]
+    win = sg.Window(title, layout, finalize=True, modal=True)
+    result = None
+    while True:
+        event, values = win.read()
+        if event in (sg.WIN_CLOSED, "-CANCEL-"):
+            break
+        if event == "-LRUN-" and values["-LGENS-"]:
+            chosen = names[rows.index(values["-LGENS-"][0])]
+            result = (chosen, values["-LUPLOAD-"])
+            break
+    win.close()
+    return result
+
+
+def _show_local_restore(world_name: str,
+                        generations: list[dict]) -> tuple[str, bool] | None:
+    rows = [
+        f"{g['name']}  {g.get('files', '?')}ファイル  "
+        f"新規 {g.get('new_bytes', 0) / 1024 / 1024:.1f} MB"
+        for g in generations
+    ]
+    return _show_restore("ローカル復元", f"ローカル世代から復元: {world_name}",
+                         [g["name"] for g in generations], rows)
+
+
+def _list_backups_thread(window: sg.Window, config: dict) -> None:
+    window.write_event_value("-DRIVE-BACKUPS-", (config, list_backups(config)))
+
+
+def _restore_from_drive(config: dict, generation: str) -> bool:
+    # restore_backupはワールドフォルダを置き換えるため、今の状態を残しておく
+    local_backup.create_generation(config)
+    return restore_backup(config, generation)
+
+
+def _restore_thread(window: sg.Window, config: dict, label: str, restore,
+                    name: str, upload: bool) -> None:
+    """restore(config, name) でローカルのワールドを戻し、必要ならアップロードする"""
+    def send(msg):
+        window.write_event_value("-PRINT-", msg)
+
+    world_name = config["world_name"]
+    gas_url = config["gas_url"]
+    locked = False
+    try:
+        if upload:
+            # 他のPCがホスト中のワールドをDrive上で巻き戻さないよう、先にロックを取る
+            lease_seconds = config.get("lease_seconds", LEASE_SECONDS)
+            locked, status_info = acquire_host(gas_url, world_name,
+                                               config["player_name"], lease_seconds)
+            if not locked:
+                if status_info.get("status") == "online":
+                    send(f"[{label}] {status_info.get('host', '')} がホスト中のため、"
+                         "復元を中止しました。ホスト終了後に再試行してください。")
+                else:
+                    send(f"[{label}] ホストロックを取得できないため、復元を中止しました。")
+                return
+            start_heartbeat(gas_url, world_name, config["player_name"], lease_seconds)
+        send(f"[{label}] {world_name} を {name} に戻しています...")
+        if not restore(config, name):
+            send(f"[{label}] {world_name} の復元に失敗しました。")
+        elif upload:
+            send(f"[{label}] 復元したワールドをアップロード中...")
+            if upload_world(config):
+                send(f"[{label}] {world_name} をDriveに反映しました。")
+            else:
+                send(f"[{label}] アップロードに失敗しました。手動ULで再試行してください。")
+        else:
+            send(f"[{label}] 完了。次回ホスト時はDriveの内容で上書きされるため、"
+                 "必要なら手動ULしてください。")
+    except Exception as e:
+        send(f"[エラー] {label}中に例外発生: {e}")
+    finally:
+        if locked:
+            set_offline(gas_url, world_name, config["player_name"])
+        window.write_event_value("-HOST-DONE-", True)
+
+
 # --- ワールド表示文字列 ---
 
 def _world_display(w: dict) -> str:
@@ -345,6 +578,8 @@ def _make_layout(worlds: list[dict], player_name: str) -> list:
          sg.Button("savesを開く", key="-OPEN-SAVES-", size=(12, 1))],
         [sg.Button("手動UL", key="-UPLOAD-", size=(12, 1)),
          sg.Button("手動DL", key="-DOWNLOAD-", size=(12, 1))],
+        [sg.Button("ローカル復元", key="-LOCAL-RESTORE-", size=(12, 1)),
+         sg.Button("Drive復元", key="-DRIVE-RESTORE-", size=(12, 1))],
         [sg.Text("")],
         [sg.Text("手動ドメイン:", size=(14, 1)),
          sg.Input(key="-MANUAL-DOMAIN-", size=(20, 1)),
@@ -361,11 +596,18 @@ def _make_layout(worlds: list[dict], player_name: str) -> list:
          sg.VSeperator(),
          sg.Column(right_col, vertical_alignment="top")],
         [sg.HorizontalSeparator()],
+        [sg.Text("転送:", font=("Helvetica", 10, "bold")),
+         sg.ProgressBar(1000, orientation="h", size=(30, 12),
+                        key="-PROGRESS-BAR-"),
+         sg.Text("", key="-PROGRESS-TEXT-", size=(40, 1),
+                 font=("Consolas", 9))],
         [sg.Text("ログ:", font=("Helvetica", 10, "bold"))],
         [sg.Multiline(size=(72, 10), key="-LOG-", autoscroll=True,
                       disabled=True, font=("Consolas", 9))],
         [sg.Button("更新", key="-REFRESH-", size=(8, 1)),
          sg.Button("設定", key="-SETTINGS-", size=(8, 1)),
+         sg.Button("一括操作", key="-BATCH-", size=(8, 1)),
+         sg.Button("計測", key="-TIMELINE-", size=(8, 1)),
          sg.Push(),
          sg.Button("終了", key="-EXIT-", size=(8, 1))],
     ]
@@ -379,6 +621,30 @@ def _log(window: sg.Window, msg: str) -> None:
     window.refresh()
 
 
+# --- 転送進捗 ---
+
+def _format_progress(ev: transfer_progress.ProgressEvent) -> str:
+    mb = 1024 * 1024
+    text = (f"{ev.world} {ev.op}  {ev.bytes_done / mb:.1f}/"
+            f"{ev.bytes_total / mb:.1f} MB  {ev.rate / mb:.2f} MB/s")
+    if ev.finished:
+        status = "完了" if ev.ok else "失敗"
+        return f"{text}  {status} ({ev.elapsed:.0f}秒)"
+    if ev.eta is not None:
+        text += f"  残り {int(ev.eta) // 60:02d}:{int(ev.eta) % 60:02d}"
+    if ev.in_flight:
+        text += f"  ({len(ev.in_flight)}件転送中)"
+    if ev.errors:
+        text += f"  エラー {ev.errors}"
+    return text
+
+
+def _update_progress(window: sg.Window,
+                     ev: transfer_progress.ProgressEvent) -> None:
+    window["-PROGRESS-BAR-"].update(int(ev.fraction * 1000))
+    window["-PROGRESS-TEXT-"].update(_format_progress(ev))
+
+
 # --- 選択中のワールド ---
 
 def _selected_world(window: sg.Window, worlds: list[dict]) -> dict | None:
@@ -397,6 +663,20 @@ def _selected_world_name(window: sg.Window, worlds: list[dict]) -> str | None:
     return w.get("world_name") if w else None
 
 
+# --- ワールド一覧の更新 ---
+
+def _refresh_worlds(window: sg.Window, gas_url: str,
+                    max_age: float = LIST_TTL_SECONDS,
+                    announce: bool = False) -> None:
+    """ワールド一覧をワーカースレッドで取得し、-WORLDS- イベントで反映する。
+    取得前に送信待ちの書き込み（set_offline等）を待つため、GUIスレッドでは取得しない"""
+    def run():
+        worlds = list_worlds(gas_url, max_age=max_age)
+        window.write_event_value("-WORLDS-", (worlds, announce))
+
+    threading.Thread(target=run, daemon=True).start()
+
+
 # --- 詳細パネル更新 ---
 
 def _update_detail(window: sg.Window, w: dict | None) -> None:
@@ -436,160 +716,382 @@ def _ensure_instance_path(world_name: str, base: str) -> str | None:
     return p
 
 
+# --- 自動保存（スナップショットからバックグラウンドでアップロード）---
+
+def _autosave_upload(send, config: dict, snapshot_path: str) -> None:
+    world_name = config["world_name"]
+    with timeline.span("autosave_upload") as span:
+        span["ok"] = upload_world(config, source_path=snapshot_path)
+    if span["ok"]:
+        send(f"[自動保存] {world_name} のアップロード完了。")
+    else:
+        send(f"[自動保存] {world_name} のアップロードに失敗しました。")
+
+
+# --- 先読みとの排他 ---
+
+def _with_prefetch_held(prefetcher: Prefetcher | None, func, *args) -> None:
+    if prefetcher is None:
+        func(*args)
+        return
+    with prefetcher.hold():
+        func(*args)
+
+
+# --- セッション終了処理（ジャーナルに沿って実行）---
+
+def _finish_session(send, config: dict, steps: list[str],
+                    lease_lost: threading.Event | None = None) -> bool:
+    """未完了のステップを順に実行。アップロードに失敗した場合はロックを保持する。
+    途中でlease_lostがセットされたら、それ以降はDriveにもGASにも書き込まない"""
+    gas_url = config["gas_url"]
+    world_name = config["world_name"]
+    for step in steps:
+        if lease_lost is not None and lease_lost.is_set():
+            send(f"[{world_name}] ホストロックを失ったため、終了処理を中止しました"
+                 "（ローカルのワールドはそのまま残しています）。")
+            journal.finish(world_name)
+            return False
+        if step == "backup":
+            send(f"[{world_name}] バックアップを作成中...")
+            with timeline.span("backup") as span:
+                span["ok"] = create_backup(config)
+        elif step == "upload":
+            send(f"[{world_name}] アップロード中...")
+            with timeline.span("upload") as span:
+                span["ok"] = upload_world(config)
+            if not span["ok"]:
+                send(f"[{world_name}] アップロードに失敗しました。"
+                     "ロックを保持し、次回起動時に再試行します。")
+                return False
+            send(f"[{world_name}] アップロード完了！")
+        elif step == "set_offline":
+            # GASへの送信は待たない。送信できた時点でジャーナルを閉じる
+            def on_offline(ok: bool) -> None:
+                if not ok:
+                    send(f"[{world_name}] ステータスの更新に失敗しました。次回起動時に再試行します。")
+                    return
+                journal.complete(world_name, "set_offline")
+                journal.finish(world_name)
+                send(f"[{world_name}] ステータスをオフラインに設定しました。")
+
+            set_offline(gas_url, world_name, config["player_name"],
+                        on_done=on_offline)
+            send(f"[{world_name}] セッション終了。")
+            return True
+        journal.complete(world_name, step)
+    journal.finish(world_name)
+    return True
+
+
+def _resume_thread(window: sg.Window, base: str, entries: list[dict]) -> None:
+    """前回中断したセッションの終了処理を再開"""
+    def send(msg):
+        window.write_event_value("-PRINT-", msg)
+
+    try:
+        for entry in entries:
+            world_name = entry["world_name"]
+            steps = journal.remaining(entry)
+            send(f"[再開] {world_name}: 前回のセッションが未完了です（残り: {', '.join(steps)}）")
+            if find_minecraft_process() is not None:
+                send(f"[再開] Minecraftが実行中のため、{world_name} の再開を保留します。")
+                continue
+            config = build_config(world_name, base)
+            if not config or not config["curseforge_instance_path"]:
+                send(f"[再開] {world_name} のインスタンスパスが未設定のため再開できません。")
+                continue
+            # ロックは前回のセッションのプレイヤー名で保持している
+            config["player_name"] = entry["player_name"]
+            status_info = get_status(config["gas_url"], world_name)
+            status = status_info.get("status", "error")
+            if status == "error":
+                send(f"[再開] {world_name} のステータスを取得できませんでした。次回起動時に再試行します。")
+                continue
+            host = status_info.get("host", "")
+            if status == "online" and host != entry["player_name"]:
+                # ロック期限切れ後に他のプレイヤーがホストした: 上書きしない
+                send(f"[再開] {world_name} は現在 {host} がホスト中のため、"
+                     "前回のセッションの再開を取り消します。")
+                journal.finish(world_name)
+                continue
+            if status == "offline" and "upload" in steps:
+                if is_remote_newer(config):
+                    # ロック解放後に他のプレイヤーがホストして保存した: 上書きしない
+                    send(f"[再開] {world_name} はロックの解放後に他のプレイヤーが更新しています。"
+                         "Driveの版を上書きせず、前回のセッションの再開を取り消します。")
+                    saved = local_backup.create_generation(config)
+                    if saved:
+                        send(f"[再開] ローカルの変更はローカル世代 {saved} に保存しました"
+                             "（「ローカル復元」で戻せます）。")
+                    else:
+                        send("[再開] ローカルのワールドはそのまま残しています"
+                             "（次にダウンロードすると上書きされます）。")
+                    journal.finish(world_name)
+                    continue
+                send(f"[再開] {world_name} のロックは既に解放されています。"
+                     "ローカルの変更をアップロードします。")
+            elif status == "online":
+                # 終了処理の間もロックのリースを延長する
+                start_heartbeat(config["gas_url"], world_name, entry["player_name"],
+                                config.get("lease_seconds", LEASE_SECONDS))
+            _finish_session(send, config, steps)
+    except Exception as e:
+        send(f"[エラー] セッション再開中に例外発生: {e}")
+    window.write_event_value("-HOST-DONE-", True)
+
+
 # --- ホストスレッド（バックグラウンド）---
 
-def _host_thread(window: sg.Window, config: dict) -> None:
+def _host_thread(window: sg.Window, config: dict, takeover: bool = False) -> None:
+    """takeover: 期限切れのロックを引き継ぐ（ユーザーが確認済み）"""
     gas_url = config["gas_url"]
     player_name = config["player_name"]
     instance_path = config["curseforge_instance_path"]
     world_name = config["world_name"]
     lock_timeout = config["lock_timeout_hours"]
+    lease_seconds = config.get("lease_seconds", LEASE_SECONDS)
+    journaled = False
+    outcome = "error"
+    # ハートビートが「リースを失った」と返したらセット（他のプレイヤーが引き継いだ）
+    lease_lost = threading.Event()
 
     def send(msg):
         window.write_event_value("-PRINT-", msg)
 
+    def on_lease_lost(host: str) -> None:
+        lease_lost.set()
+        send(f"[警告] {world_name} のホストロックを失いました（現在のホスト: {host or 'なし'}）。"
+             "通信できない状態が続いたため、他のプレイヤーが引き継いだ可能性があります。"
+             "複製・自動保存を停止し、終了後もDriveには反映しません。")
+
+    timeline.begin(world_name, player_name)
     try:
-        send(f"[{world_name}] ステータス確認中...")
-        status_info = get_status(gas_url, world_name)
+        # ステータス確認とロック取得はGASへの1回のリクエストで行う
+        send(f"[{world_name}] ステータス確認・ホストロック取得中...")
+        with timeline.span("lock") as span:
+            span["ok"], status_info = acquire_host(
+                gas_url, world_name, player_name, lease_seconds, takeover)
         status = status_info.get("status", "error")
 
         if status == "error":
             send(f"[{world_name}] ステータスを取得できませんでした。")
+            outcome = "status_error"
             window.write_event_value("-HOST-DONE-", False)
             return
 
-        if status == "online":
+        if not span["ok"] and status == "online":
             host = status_info.get("host", "unknown")
-            lock_ts = status_info.get("lock_timestamp", "")
-            if is_lock_expired(lock_ts, lock_timeout):
+            if not takeover and is_lease_expired(status_info, lock_timeout):
+                outcome = "lock_expired"
                 window.write_event_value("-HOST-LOCK-EXPIRED-",
                                          {"world": world_name, "host": host})
                 return
-            else:
-                send(f"[{world_name}] 現在 {host} がホスト中です。")
-                window.write_event_value("-HOST-DONE-", False)
-                return
+            send(f"[{world_name}] 現在 {host} がホスト中です。")
+            outcome = "busy"
+            window.write_event_value("-HOST-DONE-", False)
+            return
 
-        send(f"[{world_name}] ホストロック取得中...")
-        if not set_online(gas_url, world_name, player_name):
+        if not span["ok"]:
             send(f"[{world_name}] ホストロックの取得に失敗しました。")
+            outcome = "lock_failed"
             window.write_event_value("-HOST-DONE-", False)
             return
         send(f"[{world_name}] ホスト取得完了 ({player_name})")
+        # ロックを解放する（set_offline）かアプリを終了するまで延長し続ける。
+        # PCが落ちた場合は lease_seconds 後に他のプレイヤーが引き継げる
+        start_heartbeat(gas_url, world_name, player_name, lease_seconds,
+                        on_lost=on_lease_lost)
+        record_host(world_name)
 
-        if check_remote_world_exists(config):
+        world_path = os.path.join(instance_path, "saves", world_name)
+        log_path = os.path.join(instance_path, "logs", "latest.log")
+        global _manual_domain_value
+        _manual_domain_event.clear()
+        _manual_domain_value = ""
+        domain_result = [None]
+        def _auto_detect():
+            domain_result[0] = watch_for_domain(log_path, timeout_seconds=600)
+        detect_thread = threading.Thread(target=_auto_detect, daemon=True)
+
+        def announce_ready():
+            # ローカルに無い遠くのリージョン以外が揃った時点で呼ばれる
+            if os.path.isfile(os.path.join(world_path, "level.dat")):
+                send(f"[{world_name}] level.datを修正中...")
+                with timeline.span("level_dat_fix"):
+                    fix_level_dat(world_path)
+            timeline.mark("ready")
+
+            send("=" * 50)
+            send("準備完了！")
+            send("  1. CurseForgeでプレイを押す")
+            send(f"  2. ワールド「{world_name}」を開く")
+            send("  3. Esc → LANに公開 → LANワールドを開始")
+            send("=" * 50)
+            send("e4mcドメインを検出中...")
+            send("自動検出に失敗した場合は、右パネルにドメインを手動入力し「設定」をクリックしてください。")
+            # バックグラウンドスレッドで自動検出（残りのダウンロード中も監視する）
+            detect_thread.start()
+
+        with timeline.span("remote_exists"):
+            remote_exists = check_remote_world_exists(config)
+        if remote_exists:
             send(f"[{world_name}] ワールドをダウンロード中...")
-            if not download_world(config):
+            with timeline.span("download") as span:
+                span["ok"] = download_world(config, on_ready=announce_ready)
+            if not span["ok"]:
                 send(f"[{world_name}] ダウンロードに失敗しました。")
-                set_offline(gas_url, world_name)
+                if detect_thread.is_alive():
+                    send("[警告] ワールドを開いている場合は、保存せずに閉じてください。")
+                set_offline(gas_url, world_name, player_name)
+                outcome = "download_failed"
                 window.write_event_value("-HOST-DONE-", False)
                 return
             send(f"[{world_name}] ダウンロード完了！")
         else:
             send(f"[{world_name}] Driveにワールドデータがありません（新規ワールド）。")
+            announce_ready()
 
-        world_path = os.path.join(instance_path, "saves", world_name)
-        if os.path.isdir(world_path):
-            send(f"[{world_name}] level.datを修正中...")
-            fix_level_dat(world_path)
-
-        send("=" * 50)
-        send("準備完了！")
-        send("  1. CurseForgeでプレイを押す")
-        send(f"  2. ワールド「{world_name}」を開く")
-        send("  3. Esc → LANに公開 → LANワールドを開始")
-        send("=" * 50)
-        send("e4mcドメインを検出中...")
-        send("自動検出に失敗した場合は、右パネルにドメインを手動入力し「設定」をクリックしてください。")
-
-        log_path = os.path.join(instance_path, "logs", "latest.log")
-
-        # バックグラウンドスレッドで自動検出
-        domain_result = [None]
-        def _auto_detect():
-            domain_result[0] = watch_for_domain(log_path, timeout_seconds=600)
-        detect_thread = threading.Thread(target=_auto_detect, daemon=True)
-        detect_thread.start()
+        # ここから先で落ちた場合は、次回起動時に終了処理を再開する
+        journal.begin(world_name, player_name)
+        journaled = True
 
         # 自動検出またはマニュアル入力を待機
-        global _manual_domain_value
-        _manual_domain_event.clear()
-        _manual_domain_value = ""
         domain = None
 
-        while detect_thread.is_alive():
-            detect_thread.join(timeout=1.0)
-            if domain_result[0]:
-                domain = domain_result[0]
-                break
-            if _manual_domain_event.is_set():
-                domain = _manual_domain_value
-                break
+        with timeline.span("domain_detect"):
+            while detect_thread.is_alive():
+                detect_thread.join(timeout=1.0)
+                if domain_result[0]:
+                    domain = domain_result[0]
+                    break
+                if _manual_domain_event.is_set():
+                    domain = _manual_domain_value
+                    break
 
         if domain is None and domain_result[0]:
             domain = domain_result[0]
 
         if domain:
             send(f"[ドメイン] {domain}")
-            update_domain(gas_url, world_name, domain)
+            update_domain(gas_url, world_name, player_name, domain)
             _clipboard_copy(domain)
             send("ドメインをクリップボードにコピーしました。")
         else:
             send("[警告] e4mcドメインが検出されませんでした。")
 
-        # -- Minecraft終了待機 + 定期自動保存 --
-        send("Minecraftの終了を待機中（10分ごとに自動保存）...")
+        # -- Minecraft終了待機 + 定期自動保存（または継続複製）--
+        replicate = config.get("replication", False)
+        if replicate:
+            send("Minecraftの終了を待機中（変更を継続的にDriveへ複製）...")
+        else:
+            send("Minecraftの終了を待機中（10分ごとに自動保存）...")
         AUTOSAVE_INTERVAL = 600
 
-        pid = find_minecraft_process()
-        if not pid:
-            send("[情報] Minecraftの起動を待機中（最大5分）...")
-            pid = wait_for_minecraft_start(timeout_seconds=300)
+        with timeline.span("wait_game_start"):
+            pid = find_minecraft_process()
+            if not pid:
+                send("[情報] Minecraftの起動を待機中（最大5分）...")
+                pid = wait_for_minecraft_start(timeout_seconds=300)
 
         if not pid:
             send("[情報] Minecraftのプロセスが見つかりません。手動ULを使用してください。")
+            outcome = "no_process"
             window.write_event_value("-HOST-DONE-", True)
             return
 
         send(f"[プロセス] Minecraft検出 (PID: {pid})")
+        bandwidth.start_session(config, pid)
         last_save = time.time()
-        while True:
-            try:
-                proc = psutil.Process(pid)
-                if not proc.is_running() or proc.status() == psutil.STATUS_ZOMBIE:
+        upload_worker = None
+        replicator = None
+        if replicate:
+            replicator = Replicator(
+                config,
+                settle_seconds=config.get("replication_settle_seconds", 20),
+                on_message=send,
+            )
+            replicator.start()
+        with timeline.span("play"):
+            while True:
+                try:
+                    proc = psutil.Process(pid)
+                    if not proc.is_running() or proc.status() == psutil.STATUS_ZOMBIE:
+                        break
+                except psutil.NoSuchProcess:
                     break
-            except psutil.NoSuchProcess:
-                break
-            if time.time() - last_save >= AUTOSAVE_INTERVAL:
-                send(f"[自動保存] {world_name} をアップロード中...")
-                upload_world(config)
-                last_save = time.time()
-                send("[自動保存] 完了。")
-            time.sleep(3)
+                if lease_lost.is_set():
+                    # ロックの無いままDriveに書き込まない
+                    if replicator is not None:
+                        replicator.stop()
+                        replicator = None
+                elif replicator is None and time.time() - last_save >= AUTOSAVE_INTERVAL:
+                    last_save = time.time()
+                    if upload_worker is not None and upload_worker.is_alive():
+                        send("[自動保存] 前回のアップロードが実行中のため、今回はスキップします。")
+                    else:
+                        send(f"[自動保存] {world_name} のスナップショットを作成中...")
+                        with timeline.span("autosave_snapshot"):
+                            snapshot_path = snapshot_world(config)
+                        if snapshot_path:
+                            upload_worker = threading.Thread(
+                                target=_autosave_upload,
+                                args=(send, config, snapshot_path),
+                                daemon=True,
+                            )
+                            upload_worker.start()
+                time.sleep(3)
 
         send("[プロセス] Minecraftが終了しました。")
+        bandwidth.end_session()
         time.sleep(3)
+        with timeline.span("drain"):
+            if replicator is not None:
+                send("[複製] 実行中の複製の完了を待機中...")
+                replicator.stop()
+            if upload_worker is not None and upload_worker.is_alive():
+                send("[自動保存] 実行中のアップロードの完了を待機中...")
+                upload_worker.join()
+
+        with timeline.span("local_generation"):
+            saved = local_backup.create_generation(config)
+
+        if lease_lost.is_set():
+            # 引き継いだプレイヤーのワールドを上書きせず、ロックも解放しない
+            send(f"[{world_name}] ホストロックを失ったため、Driveへのアップロードと"
+                 "ロックの解放を行いません。")
+            if saved:
+                send(f"[{world_name}] 今回の変更はローカル世代 {saved} に保存しました"
+                     "（「ローカル復元」で戻せます）。")
+            else:
+                send(f"[{world_name}] ローカルのワールドはそのまま残しています"
+                     "（次にダウンロードすると上書きされます）。")
+            journal.finish(world_name)
+            outcome = "lease_lost"
+            window.write_event_value("-HOST-DONE-", True)
+            return
 
-        send(f"[{world_name}] バックアップを作成中...")
-        create_backup(config)
+        with timeline.span("resolve_conflicts"):
+            # ダウンロード中にサーバーが作ったリージョンをDriveの版へ戻す
+            resolve_conflicts(config)
 
-        send(f"[{world_name}] アップロード中...")
-        if upload_world(config):
-            send(f"[{world_name}] アップロード完了！")
-        else:
-            send(f"[{world_name}] アップロードに失敗しました。")
-
-        set_offline(gas_url, world_name)
-        send(f"[{world_name}] セッション終了。ステータスをオフラインに設定しました。")
+        finished = _finish_session(send, config, journal.SESSION_STEPS, lease_lost)
+        outcome = "ok" if finished else "incomplete"
         window.write_event_value("-HOST-DONE-", True)
 
     except Exception as e:
         send(f"[エラー] ホスト処理中に例外発生: {e}")
-        try:
-            set_offline(gas_url, world_name)
-        except Exception:
-            pass
+        bandwidth.end_session()
+        if journaled:
+            send(f"[{world_name}] ロックを保持し、次回起動時に終了処理を再開します。")
+        else:
+            try:
+                set_offline(gas_url, world_name, player_name)
+            except Exception:
+                pass
         window.write_event_value("-HOST-DONE-", False)
+    finally:
+        timeline.end(outcome)
 
 
 # --- メインループ ---
@@ -620,9 +1122,8 @@ def main():
 
     player_name = personal["player_name"]
 
-    worlds = list_worlds(gas_url)
-    if not worlds:
-        worlds = []
+    # 一覧はウィンドウを開いてからワーカースレッドで取得する（-WORLDS-）
+    worlds = []
 
     window = sg.Window(
         "MC MultiDrive",
@@ -631,8 +1132,37 @@ def main():
     )
 
     sys.stdout = _GUIWriter(window)
+    if shared.get("rclone_backend", "rcd") == "rcd":
+        threading.Thread(
+            target=rclone_rc.start_daemon,
+            args=(os.path.join(base, "rclone", "rclone.exe"),
+                  os.path.join(base, "rclone.conf"),
+                  shared["rclone_drive_folder_id"]),
+            daemon=True,
+        ).start()
+    transfer_progress.add_listener(
+        lambda ev: window.write_event_value("-PROGRESS-", ev))
+    _refresh_worlds(window, gas_url)
+
+    prefetcher = None
+    if shared.get("prefetch", True):
+        prefetcher = Prefetcher(
+            base, gas_url,
+            interval_seconds=shared.get("prefetch_interval_minutes", 15) * 60,
+            max_worlds=shared.get("prefetch_worlds", 2),
+        )
+        prefetcher.start()
     hosting = False
 
+    unfinished = journal.pending()
+    if unfinished:
+        hosting = True
+        threading.Thread(
+            target=_with_prefetch_held,
+            args=(prefetcher, _resume_thread, window, base, unfinished),
+            daemon=True,
+        ).start()
+
     while True:
         event, values = window.read(timeout=100)
 
@@ -643,6 +1173,10 @@ def main():
         if event == "-PRINT-":
             _log(window, values["-PRINT-"])
 
+        # --- 転送進捗 ---
+        if event == "-PROGRESS-":
+            _update_progress(window, values["-PROGRESS-"])
+
         # --- ワールド選択 ---
         if event == "-WLIST-":
             w = _selected_world(window, worlds)
@@ -651,8 +1185,11 @@ def main():
         # --- 更新 ---
         if event == "-REFRESH-":
             _log(window, "[更新] ステータスを取得中...")
-            worlds = list_worlds(gas_url)
+            _refresh_worlds(window, gas_url, max_age=0, announce=True)
+
+        if event == "-WORLDS-":
             sel_name = _selected_world_name(window, worlds)
+            worlds, announce = values["-WORLDS-"]
             items = [_world_display(w) for w in worlds]
             window["-WLIST-"].update(items)
             if sel_name:
@@ -661,16 +1198,15 @@ def main():
                         window["-WLIST-"].update(set_to_index=[i])
                         _update_detail(window, w)
                         break
-            _log(window, f"[更新] {len(worlds)}個のワールドが見つかりました。")
+            if announce:
+                _log(window, f"[更新] {len(worlds)}個のワールドが見つかりました。")
 
         # --- ワールド追加 ---
         if event == "-ADD-WORLD-":
             wname = _ask_new_world(gas_url, base)
             if wname:
                 _log(window, f"[追加] ワールド「{wname}」を追加しました。")
-                worlds = list_worlds(gas_url)
-                items = [_world_display(w) for w in worlds]
-                window["-WLIST-"].update(items)
+                _refresh_worlds(window, gas_url)
 
         # --- ワールド削除 ---
         if event == "-DELETE-WORLD-":
@@ -709,10 +1245,8 @@ def main():
                         _log(window, f"[削除] {wname} をリストから削除しました。")
                     else:
                         _log(window, f"[エラー] GAS削除に失敗しました。")
-                worlds = list_worlds(gas_url)
-                items = [_world_display(w) for w in worlds]
-                window["-WLIST-"].update(items)
                 _update_detail(window, None)
+                _refresh_worlds(window, gas_url)
 
         # --- 手動ドメイン設定 ---
         if event == "-SET-DOMAIN-":
@@ -726,7 +1260,7 @@ def main():
                 if hosting:
                     wname = _selected_world_name(window, worlds)
                     if wname:
-                        update_domain(gas_url, wname, manual_d)
+                        update_domain(gas_url, wname, player_name, manual_d)
             else:
                 sg.popup("ドメインを入力してください。", title="情報")
 
@@ -748,15 +1282,14 @@ def main():
                 continue
             hosting = True
             threading.Thread(
-                target=_host_thread, args=(window, config),
+                target=_with_prefetch_held,
+                args=(prefetcher, _host_thread, window, config),
                 daemon=True,
             ).start()
 
         if event == "-HOST-DONE-":
             hosting = False
-            worlds = list_worlds(gas_url)
-            items = [_world_display(w) for w in worlds]
-            window["-WLIST-"].update(items)
+            _refresh_worlds(window, gas_url)
 
         if event == "-HOST-LOCK-EXPIRED-":
             info = values["-HOST-LOCK-EXPIRED-"]
@@ -771,10 +1304,11 @@ def main():
             if ans == "Yes":
                 config = build_config(wn, base)
                 if config:
-                    set_offline(gas_url, wn)
+                    # 期限切れの確認と取得はGAS側で1回の比較・設定として行う
                     hosting = True
                     threading.Thread(
-                        target=_host_thread, args=(window, config),
+                        target=_with_prefetch_held,
+                        args=(prefetcher, _host_thread, window, config, True),
                         daemon=True,
                     ).start()
             else:
@@ -856,10 +1390,11 @@ def main():
                 if config:
                     _log(window, f"[アップロード] {wname} をアップロード中...")
                     threading.Thread(
-                        target=lambda c=config: (
+                        target=_with_prefetch_held,
+                        args=(prefetcher, lambda c=config: (
                             upload_world(c),
                             window.write_event_value("-REFRESH-", None),
-                        ),
+                        )),
                         daemon=True,
                     ).start()
 
@@ -885,13 +1420,109 @@ def main():
                 if config:
                     _log(window, f"[ダウンロード] {wname} をダウンロード中...")
                     threading.Thread(
-                        target=lambda c=config: (
+                        target=_with_prefetch_held,
+                        args=(prefetcher, lambda c=config: (
                             download_world(c),
                             window.write_event_value("-REFRESH-", None),
-                        ),
+                        )),
                         daemon=True,
                     ).start()
 
+        # --- ローカル世代から復元 ---
+        if event == "-LOCAL-RESTORE-":
+            if hosting:
+                sg.popup("ホスト中は復元できません。", title="情報")
+                continue
+            wname = _selected_world_name(window, worlds)
+            if not wname:
+                sg.popup("ワールドを先に選択してください。", title="情報")
+                continue
+            if find_minecraft_process() is not None:
+                sg.popup("Minecraftを終了してから復元してください。", title="情報")
+                continue
+            config = build_config(wname, base)
+            if not config or not config["curseforge_instance_path"]:
+                sg.popup("インスタンスパスが設定されていません。", title="情報")
+                continue
+            generations = local_backup.list_generations(config)
+            if not generations:
+                sg.popup("ローカル世代がありません。ホスト終了時に作成されます。",
+                         title="情報")
+                continue
+            chosen = _show_local_restore(wname, generations)
+            if chosen:
+                hosting = True
+                threading.Thread(
+                    target=_with_prefetch_held,
+                    args=(prefetcher, _restore_thread, window, config,
+                          "ローカル復元", local_backup.restore_generation, *chosen),
+                    daemon=True,
+                ).start()
+
+        # --- Driveのバックアップから復元 ---
+        if event == "-DRIVE-RESTORE-":
+            if hosting:
+                sg.popup("ホスト中は復元できません。", title="情報")
+                continue
+            wname = _selected_world_name(window, worlds)
+            if not wname:
+                sg.popup("ワールドを先に選択してください。", title="情報")
+                continue
+            if find_minecraft_process() is not None:
+                sg.popup("Minecraftを終了してから復元してください。", title="情報")
+                continue
+            config = build_config(wname, base)
+            if not config or not config["curseforge_instance_path"]:
+                sg.popup("インスタンスパスが設定されていません。", title="情報")
+                continue
+            # 一覧の取得はDriveへの問い合わせになるため、ワーカースレッドで行う
+            hosting = True
+            _log(window, f"[Drive復元] {wname} のバックアップ一覧を取得中...")
+            threading.Thread(target=_list_backups_thread, args=(window, config),
+                             daemon=True).start()
+
+        if event == "-DRIVE-BACKUPS-":
+            config, backups = values["-DRIVE-BACKUPS-"]
+            hosting = False
+            wname = config["world_name"]
+            if backups is None:
+                _log(window, "[Drive復元] バックアップ一覧を取得できませんでした。")
+                continue
+            if not backups:
+                sg.popup("復元できるDriveのバックアップがありません。\n"
+                         "（copyモードの全体コピーはDriveのbackups/から手動で戻してください）",
+                         title="情報")
+                continue
+            chosen = _show_restore(
+                "Drive復元", f"Driveのバックアップから復元: {wname}", backups,
+                [f"{name}（UTC）" for name in backups])
+            if chosen:
+                hosting = True
+                threading.Thread(
+                    target=_with_prefetch_held,
+                    args=(prefetcher, _restore_thread, window, config,
+                          "Drive復元", _restore_from_drive, *chosen),
+                    daemon=True,
+                ).start()
+
+        # --- 一括操作 ---
+        if event == "-BATCH-":
+            if hosting:
+                sg.popup("ホスト中は一括操作を実行できません。", title="情報")
+                continue
+            chosen = _show_batch(base, worlds)
+            if chosen:
+                hosting = True
+                threading.Thread(
+                    target=_with_prefetch_held,
+                    args=(prefetcher, _batch_thread, window, base, *chosen),
+                    daemon=True,
+                ).start()
+
+        # --- 計測 ---
+        if event == "-TIMELINE-":
+            _show_timeline()
+
         # --- 設定 ---
         if event == "-SETTINGS-":
             _show_settings(base, worlds)
@@ -899,6 +1530,12 @@ def main():
             if personal:
                 player_name = personal["player_name"]
 
+    if prefetcher is not None:
+        prefetcher.stop()
+    rclone_rc.stop_daemon()
+    # 送信待ちのステータス更新（オフライン化など）を送り切る。送れなかった分は
+    # ジャーナルに残り、次回起動時に再試行される
+    shutdown(timeout=15)
     window.close()
 
 
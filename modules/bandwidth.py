@@ -0,0 +1,218 @@
+"""bandwidth.py - ホスト中の転送帯域制御（ゲーム回線を優先する）
+
+プレイ中の自動保存アップロードがe4mcトンネルと回線を取り合わないよう、
+セッション中はアップロード速度に上限を設ける。適応モードではJVMの
+読み書き以外のI/O量（Windowsのother_bytes。ソケット通信を含むがそれだけでは
+ない概算値）と、設定した場合は遅延プローブを監視し、混んでいる間は上限を
+さらに下げる。セッション終了後（最終アップロード）は全速に戻す。
+"""
+
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+from modules import rclone_rc
+
+_MIN_LIMIT_KB = 64
+# 遅延がベースラインのこの倍率＋余裕を超えたら混雑とみなす
+_LATENCY_FACTOR = 2.0
+_LATENCY_MARGIN_MS = 20.0
+_BASELINE_SAMPLES = 20
+
+
+def _probe_latency(host: str, port: int, timeout: float = 1.0) -> float | None:
+    """TCP接続にかかった時間（ミリ秒）。到達できなければNone"""
+    started = time.perf_counter()
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            pass
+    except OSError:
+        return None
+    return (time.perf_counter() - started) * 1000
+
+
+def _jvm_other_bytes(proc: psutil.Process | None) -> int | None:
+    """JVMの累計の読み書き以外のI/O量（Windowsのother_bytes）。ネットワーク通信の
+    ほかデバイス制御等も含む概算で、通信量そのものではない。取得不可ならNone"""
+    if proc is None:
+        return None
+    try:
+        return getattr(proc.io_counters(), "other_bytes", None)
+    except (psutil.Error, OSError):
+        return None
+
+
+class BandwidthGovernor:
+    """セッション中のアップロード上限（KiB/s）をAIMDで調整するスレッド"""
+
+    def __init__(self, pid: int | None, cap_kb: int, adaptive: bool = True,
+                 probe: str | None = None, busy_kb: int = 256,
+                 interval: float = 2.0):
+        """probe（ホスト:ポート）を指定すると、interval秒ごとにTCP接続の
+        遅延も測る（既定は測らない）"""
+        self._cap = max(_MIN_LIMIT_KB, cap_kb)
+        self._floor = max(_MIN_LIMIT_KB, self._cap // 8)
+        self._limit = self._cap
+        self._adaptive = adaptive
+        self._probe = None
+        if probe:
+            host, _, port = probe.rpartition(":")
+            self._probe = (host or probe, int(port) if host else 53)
+        self._busy_bytes = busy_kb * 1024 * interval
+        self._interval = interval
+        try:
+            self._proc = psutil.Process(pid) if pid else None
+        except psutil.Error:
+            self._proc = None
+        self._baseline = []
+        self._last_jvm = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def limit_kb(self) -> int:
+        with self._lock:
+            return self._limit
+
+    def start(self) -> None:
+        self._apply()
+        if self._adaptive:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self._interval * 2)
+
+    def _busy(self) -> bool:
+        busy = False
+        latency = _probe_latency(*self._probe) if self._probe else None
+        if latency is not None:
+            # ベースラインは直近の最小値（自分の転送による遅延を含まない値に寄せる）
+            self._baseline = (self._baseline + [latency])[-_BASELINE_SAMPLES:]
+            base = min(self._baseline)
+            if latency > base * _LATENCY_FACTOR + _LATENCY_MARGIN_MS:
+                busy = True
+        jvm = _jvm_other_bytes(self._proc)
+        if jvm is not None:
+            if self._last_jvm is not None and jvm - self._last_jvm > self._busy_bytes:
+                busy = True
+            self._last_jvm = jvm
+        return busy
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            busy = self._busy()
+            with self._lock:
+                previous = self._limit
+                if busy:
+                    self._limit = max(self._floor, self._limit // 2)
+                else:
+                    self._limit = min(self._cap, self._limit + self._floor)
+                changed = self._limit != previous
+            if changed:
+                self._apply()
+
+    def _apply(self) -> None:
+        _set_daemon_rate(rate_flag(self.limit_kb))
+
+
+def _set_daemon_rate(rate: str) -> None:
+    # 常駐rcdの上限はプロセス全体に掛かり、実行中のジョブにも即時反映される
+    daemon = rclone_rc.get_daemon()
+    if daemon is None:
+        return
+    try:
+        daemon.call("core/bwlimit", {"rate": rate})
+    except rclone_rc.RcError:
+        pass
+
+
+def rate_flag(limit_kb: int | None) -> str:
+    """rcloneの--bwlimit値（上り:下り）。下りは制限しない"""
+    if limit_kb is None:
+        return "off"
+    return f"{limit_kb}k:off"
+
+
+# -- 現在のセッション（アプリにつき1つ）--
+
+_governor: BandwidthGovernor | None = None
+_governor_lock = threading.Lock()
+
+
+def start_session(config: dict, pid: int | None) -> None:
+    """ホスト中の帯域制御を開始。session_upload_limit_kbが0なら何もしない"""
+    global _governor
+    cap = config.get("session_upload_limit_kb", 2048)
+    if not cap:
+        return
+    governor = BandwidthGovernor(
+        pid, cap,
+        adaptive=config.get("adaptive_bandwidth", True),
+        probe=config.get("latency_probe_host"),
+    )
+    with _governor_lock:
+        if _governor is not None:
+            _governor.stop()
+        _governor = governor
+    governor.start()
+    print(f"[帯域] ホスト中のアップロード上限: {cap} KiB/s"
+          + ("（適応）" if config.get("adaptive_bandwidth", True) else ""))
+
+
+def end_session() -> None:
+    """帯域制御を解除し、全速に戻す"""
+    global _governor
+    with _governor_lock:
+        governor, _governor = _governor, None
+    if governor is None:
+        return
+    governor.stop()
+    _set_daemon_rate("off")
+    print("[帯域] アップロード上限を解除しました。")
+
+
+def current_limit() -> int | None:
+    """セッション中ならアップロード上限（KiB/s）、それ以外はNone"""
+    governor = _governor
+    return governor.limit_kb if governor is not None else None
+
+
+# -- 一括操作の全体上限 --
+
+_batch_limit: tuple[int, int] | None = None
+
+
+@contextmanager
+def batch_limit(total_kb: int, workers: int):
+    """一括操作の間、全ワーカー合計の転送速度を total_kb KiB/s に制限する。
+    rcdでは合計に、サブプロセスでは1プロセスあたり total_kb / workers に掛かる"""
+    global _batch_limit
+    if not total_kb:
+        yield
+        return
+    _batch_limit = (total_kb, max(1, workers))
+    _set_daemon_rate(f"{total_kb}k")
+    try:
+        yield
+    finally:
+        _batch_limit = None
+        _set_daemon_rate("off")
+
+
+def current_flag() -> str | None:
+    """サブプロセスのrcloneに渡す --bwlimit の値。制限が無ければNone"""
+    limit = current_limit()
+    if limit is not None:
+        return rate_flag(limit)
+    batch = _batch_limit
+    if batch is not None:
+        total_kb, workers = batch
+        return f"{max(_MIN_LIMIT_KB, total_kb // workers)}k"
+    return None
@@ -0,0 +1,105 @@
+"""batch.py - 複数ワールドへの一括操作（同時実行数を制限したワーカープール）"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import bandwidth
+from modules.status_mgr import (
+    LEASE_SECONDS, acquire_host, set_offline, start_heartbeat,
+)
+from modules.world_sync import (
+    create_backup, download_world, has_local_changes, is_remote_newer,
+    read_remote_manifest, upload_world, verify_world,
+)
+
+
+def _verify(config: dict) -> bool:
+    return verify_world(config, read_remote_manifest(config)) == []
+
+
+def _presync(config: dict) -> bool:
+    """Driveの方が新しいワールドだけダウンロード"""
+    if not is_remote_newer(config):
+        print(f"[一括] {config['world_name']}: 最新です。")
+        return True
+    if has_local_changes(config):
+        print(f"[一括] {config['world_name']}: アップロードされていない変更があるため、"
+              "ダウンロードしません。")
+        return False
+    return download_world(config)
+
+
+def _upload(config: dict) -> bool:
+    """ホストロックを取得してからアップロードする（ホスト中のワールドは上書きしない）"""
+    world = config["world_name"]
+    gas_url = config["gas_url"]
+    lease_seconds = config.get("lease_seconds", LEASE_SECONDS)
+    acquired, status_info = acquire_host(gas_url, world, config["player_name"],
+                                         lease_seconds)
+    if not acquired:
+        if status_info.get("status") == "online":
+            print(f"[一括] {world}: {status_info.get('host', '')} がホスト中のため、"
+                  "スキップします。")
+        else:
+            print(f"[一括] {world}: ホストロックを取得できないため、スキップします。")
+        return False
+    # ロックを取ってから確認する（確認とロック取得の間に他のホストが
+    # アップロードした版を上書きしない）
+    if is_remote_newer(config):
+        print(f"[一括] {world}: Driveの方が新しい版のため、アップロードしません。")
+        set_offline(gas_url, world, config["player_name"])
+        return False
+    start_heartbeat(gas_url, world, config["player_name"], lease_seconds)
+    try:
+        return upload_world(config)
+    finally:
+        set_offline(gas_url, world, config["player_name"])
+
+
+# 操作名 -> (表示名, 実行関数)
+OPERATIONS = {
+    "backup": ("バックアップ", create_backup),
+    "verify": ("整合性検証", _verify),
+    "presync": ("事前同期（DL）", _presync),
+    "upload": ("アップロード", _upload),
+}
+
+# 各ワールドの状態
+PENDING = "待機中"
+RUNNING = "実行中"
+DONE = "完了"
+FAILED = "失敗"
+
+
+def run_batch(op: str, configs: list[dict], max_workers: int = 2,
+              bwlimit_kb: int = 0, on_status=None) -> dict[str, bool]:
+    """configsの各ワールドにopを実行し、{ワールド名: 成否} を返す。
+
+    同時に実行するのは max_workers ワールドまで。bwlimit_kb を指定すると
+    全ワーカー合計の転送速度を制限する。on_status(ワールド名, 状態) で
+    ワールドごとの進行状況を通知する。
+    """
+    label, func = OPERATIONS[op]
+    notify = on_status or (lambda world, status: None)
+    results = {}
+    lock = threading.Lock()
+
+    def task(config: dict) -> None:
+        world = config["world_name"]
+        notify(world, RUNNING)
+        try:
+            ok = bool(func(config))
+        except Exception as e:
+            print(f"[一括] {world}: {label}中にエラー: {e}")
+            ok = False
+        with lock:
+            results[world] = ok
+        notify(world, DONE if ok else FAILED)
+
+    for config in configs:
+        notify(config["world_name"], PENDING)
+    workers = max(1, min(max_workers, len(configs)))
+    with bandwidth.batch_limit(bwlimit_kb, workers):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(task, configs))
+    return results
@@ -106,3 +106,20 @@ def build_config(world_name: str, base: str = None) -> dict | None:
     config["rclone_exe_path"] = os.path.join(base, "rclone", "rclone.exe")
     config["rclone_config_path"] = os.path.join(base, "rclone.conf")
     return config
+
+
+# -- ワールド別ローカル状態 --
+
+def get_state_dir(config: dict) -> str:
+    """インスタンス配下のワールド別状態フォルダ（同期対象外）"""
+    path = os.path.join(config["curseforge_instance_path"], ".mcmultidrive",
+                        config["world_name"])
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_data_dir() -> str:
+    """マシンごとの学習データ・ログを置くフォルダ（実行ファイルと同じ場所）"""
+    path = os.path.join(_find_base(), "data")
+    os.makedirs(path, exist_ok=True)
+    return path
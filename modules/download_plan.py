@@ -0,0 +1,90 @@
+"""download_plan.py - ホスト開始を早めるためのダウンロード優先順位
+
+level.dat と playerdata を最初に取得し、そこからスポーン地点と
+各プレイヤーの最終位置を読み取って、周辺のリージョンを次に取得する。
+遠くのリージョンや他のディメンションはその後に回す。
+"""
+
+import math
+import os
+
+import nbtlib
+
+# プレイヤー位置の周囲何リージョン分を優先するか（1なら3x3）
+PRIORITY_RADIUS = 1
+
+_REGION_KINDS = ("region", "entities", "poi")
+_DIMENSION_DIRS = {
+    "minecraft:overworld": "",
+    "minecraft:the_nether": "DIM-1/",
+    "minecraft:the_end": "DIM1/",
+    0: "",
+    -1: "DIM-1/",
+    1: "DIM1/",
+}
+
+
+def first_files(files) -> list[str]:
+    """最初に取得するファイル（level.dat と playerdata）"""
+    return sorted(
+        rel for rel in files
+        if rel == "level.dat" or rel.startswith("playerdata/")
+    )
+
+
+def _dimension_dir(dimension) -> str:
+    if isinstance(dimension, str):
+        dimension = str(dimension)
+        if dimension in _DIMENSION_DIRS:
+            return _DIMENSION_DIRS[dimension]
+        namespace, _, path = dimension.partition(":")
+        return f"dimensions/{namespace}/{path}/" if path else ""
+    try:
+        return _DIMENSION_DIRS.get(int(dimension), "")
+    except (TypeError, ValueError):
+        return ""
+
+
+def _player_position(tag) -> tuple[str, float, float] | None:
+    try:
+        pos = tag["Pos"]
+        return _dimension_dir(tag.get("Dimension", 0)), float(pos[0]), float(pos[2])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def _positions(local_path: str) -> list[tuple[str, float, float]]:
+    """(ディメンションのフォルダ, x, z) の一覧"""
+    positions = []
+    try:
+        data = nbtlib.load(os.path.join(local_path, "level.dat"))["Data"]
+        positions.append(("", float(data["SpawnX"]), float(data["SpawnZ"])))
+        if "Player" in data:
+            positions.append(_player_position(data["Player"]))
+    except Exception:
+        pass
+    player_dir = os.path.join(local_path, "playerdata")
+    if os.path.isdir(player_dir):
+        for name in os.listdir(player_dir):
+            if not name.endswith(".dat"):
+                continue
+            try:
+                positions.append(
+                    _player_position(nbtlib.load(os.path.join(player_dir, name))))
+            except Exception:
+                continue
+    return [p for p in positions if p is not None]
+
+
+def priority_regions(local_path: str, files) -> list[str]:
+    """ローカルの level.dat・playerdata から、先に取得すべきリージョンを求める"""
+    rels = set()
+    for dim_dir, x, z in _positions(local_path):
+        rx, rz = math.floor(x) >> 9, math.floor(z) >> 9
+        for dx in range(-PRIORITY_RADIUS, PRIORITY_RADIUS + 1):
+            for dz in range(-PRIORITY_RADIUS, PRIORITY_RADIUS + 1):
+                for kind in _REGION_KINDS:
+                    rel = f"{dim_dir}{kind}/r.{rx + dx}.{rz + dz}.mca"
+                    if rel in files:
+                        rels.add(rel)
+    return sorted(rels)
@@ -0,0 +1,102 @@
+"""journal.py - セッション終了処理のクラッシュセーフなジャーナル
+
+ホストロック取得後、終了処理の各ステップ（backup / upload / set_offline）を
+data/journal/<ワールド>.json に記録する。アプリやPCが途中で落ちても、
+次回起動時に未完了のステップから再開できる。
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from modules.config_mgr import get_data_dir
+
+SESSION_STEPS = ["backup", "upload", "set_offline"]
+
+_lock = threading.Lock()
+
+
+def _journal_dir() -> str:
+    path = os.path.join(get_data_dir(), "journal")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _journal_path(world_name: str) -> str:
+    return os.path.join(_journal_dir(), quote(world_name, safe="") + ".json")
+
+
+def _write(path: str, entry: dict) -> None:
+    # 書きかけのファイルが残らないよう、同期してから置き換える
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entry, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def begin(world_name: str, player_name: str,
+          steps: list[str] | None = None) -> None:
+    """ロックを保持している間、未完了のステップを記録しておく"""
+    entry = {
+        "world_name": world_name,
+        "player_name": player_name,
+        "steps": list(steps or SESSION_STEPS),
+        "done": [],
+        "started": datetime.now(timezone.utc).isoformat(),
+    }
+    with _lock:
+        _write(_journal_path(world_name), entry)
+
+
+def complete(world_name: str, step: str) -> None:
+    with _lock:
+        path = _journal_path(world_name)
+        entry = _read(path)
+        if entry is None:
+            return
+        if step not in entry["done"]:
+            entry["done"].append(step)
+        entry["updated"] = datetime.now(timezone.utc).isoformat()
+        _write(path, entry)
+
+
+def finish(world_name: str) -> None:
+    with _lock:
+        try:
+            os.remove(_journal_path(world_name))
+        except FileNotFoundError:
+            pass
+
+
+def _read(path: str) -> dict | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or "world_name" not in entry:
+        return None
+    entry.setdefault("steps", list(SESSION_STEPS))
+    entry.setdefault("done", [])
+    return entry
+
+
+def remaining(entry: dict) -> list[str]:
+    return [step for step in entry["steps"] if step not in entry["done"]]
+
+
+def pending() -> list[dict]:
+    """前回のセッションで完了しなかったジャーナル"""
+    entries = []
+    with _lock:
+        for name in sorted(os.listdir(_journal_dir())):
+            if not name.endswith(".json"):
+                continue
+            entry = _read(os.path.join(_journal_dir(), name))
+            if entry is not None and remaining(entry):
+                entries.append(entry)
+    return entries
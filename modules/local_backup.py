@@ -0,0 +1,158 @@
+"""local_backup.py - インスタンス内のローカル世代（すぐに巻き戻せるバックアップ）
+
+.mcmultidrive/<world>/generations/<時刻>/ にワールドの世代を保存する。
+世代はスナップショット（snapshot.py）から作り、前の世代から変わっていない
+ファイルは前の世代へのハードリンクにするため、ディスクを消費しない
+（rsync --link-dest 相当）。変わったファイルだけをコピーする。
+Driveのバックアップは遠隔地用として残る。
+"""
+
+import json
+import os
+import shutil
+from datetime import datetime
+
+from modules import snapshot
+from modules.config_mgr import get_state_dir
+from modules.world_sync import snapshot_world
+
+_META_SUFFIX = ".json"
+
+
+def _generations_dir(config: dict) -> str:
+    path = os.path.join(get_state_dir(config), "generations")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def list_generations(config: dict) -> list[dict]:
+    """新しい順の世代一覧 [{"name", "files", "new_bytes", "total_bytes"}]"""
+    root = _generations_dir(config)
+    result = []
+    for name in sorted(os.listdir(root), reverse=True):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path) or name.endswith(".tmp"):
+            continue
+        meta = {}
+        try:
+            with open(path + _META_SUFFIX, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            pass
+        result.append({"name": name, **meta})
+    return result
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        # FAT等のハードリンク非対応のドライブ
+        shutil.copy2(src, dst)
+
+
+def create_generation(config: dict, keep: str | None = None) -> str | None:
+    """現在のワールドを新しい世代として保存し、その名前を返す。
+    local_generations が0なら何もしない。keepの世代は整理で消さない"""
+    count = config.get("local_generations", 3)
+    if not count:
+        return None
+    src = snapshot_world(config)
+    if src is None:
+        return None
+    root = _generations_dir(config)
+    name = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    dest = os.path.join(root, name)
+    if os.path.exists(dest):
+        return name
+    previous = next(iter(list_generations(config)), None)
+    previous_path = os.path.join(root, previous["name"]) if previous else None
+
+    tmp = dest + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    files = total_bytes = new_bytes = 0
+    try:
+        for rel, full in snapshot._walk(src).items():
+            dst = os.path.join(tmp, *rel.split("/"))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            old = os.path.join(previous_path, *rel.split("/")) if previous_path else None
+            if old is not None and snapshot._stat_key(old) == snapshot._stat_key(full):
+                _link_or_copy(old, dst)
+            else:
+                # スナップショットの.datはワールドと実体を共有しているためリンクしない
+                shutil.copy2(full, dst)
+                new_bytes += os.path.getsize(dst)
+            files += 1
+            total_bytes += os.path.getsize(dst)
+        # 情報ファイルを先に書き、世代フォルダは最後に置く（途中で失敗しても
+        # 情報の無い世代が残らない）
+        with open(dest + _META_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump({"files": files, "total_bytes": total_bytes,
+                       "new_bytes": new_bytes}, f)
+        os.replace(tmp, dest)
+    except OSError as e:
+        print(f"[ローカル世代] 作成に失敗しました: {e}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            os.remove(dest + _META_SUFFIX)
+        except OSError:
+            pass
+        return None
+    print(f"[ローカル世代] {name} を作成（{files}ファイル、"
+          f"新規 {new_bytes / 1024 / 1024:.1f} MB）")
+    _prune(config, count, keep)
+    return name
+
+
+def _prune(config: dict, count: int, keep: str | None) -> None:
+    root = _generations_dir(config)
+    names = [g["name"] for g in list_generations(config)]
+    for name in names[count:]:
+        if name == keep:
+            continue
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        try:
+            os.remove(os.path.join(root, name + _META_SUFFIX))
+        except OSError:
+            pass
+        print(f"[ローカル世代] 古い世代を削除: {name}")
+
+
+def restore_generation(config: dict, name: str) -> bool:
+    """世代をワールドフォルダに復元する。
+
+    サイズと更新時刻が同じファイルはそのままにし、異なるファイルだけを
+    コピーで戻す（ゲームがリージョンをその場で書き換えても世代が壊れないよう、
+    リンクではなくコピーする）。復元前の状態も世代として保存しておく。
+    """
+    source = os.path.join(_generations_dir(config), name)
+    if not os.path.isdir(source):
+        print(f"[エラー] ローカル世代が見つかりません: {name}")
+        return False
+    local_path = os.path.join(config["curseforge_instance_path"], "saves",
+                              config["world_name"])
+    if os.path.isdir(local_path):
+        create_generation(config, keep=name)
+
+    wanted = snapshot._walk(source)
+    current = snapshot._walk(local_path) if os.path.isdir(local_path) else {}
+    copied = removed = 0
+    try:
+        for rel, full in wanted.items():
+            dst = os.path.join(local_path, *rel.split("/"))
+            if rel in current and snapshot._stat_key(dst) == snapshot._stat_key(full):
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            tmp = dst + ".restore"
+            shutil.copy2(full, tmp)
+            os.replace(tmp, dst)
+            copied += 1
+        for rel, full in current.items():
+            if rel not in wanted:
+                os.remove(full)
+                removed += 1
+    except OSError as e:
+        print(f"[エラー] ローカル世代の復元に失敗しました: {e}")
+        return False
+    print(f"[ローカル世代] {name} を復元しました（{copied}件を戻し、{removed}件を削除）")
+    return True
@@ -0,0 +1,133 @@
+"""manifest.py - ワールドのファイルマニフェスト（パス・サイズ・更新時刻・MD5）"""
+
+import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# files: 相対パス -> [サイズ, 更新時刻(ns), md5]
+# packs: バンドルID -> {"digest": 内容ハッシュ, "files": [相対パス, ...]}
+# encoded: 相対パス -> [圧縮形式, 圧縮後サイズ]（region_codecで保存したファイル）
+MANIFEST_FORMAT = 1
+
+
+def file_md5(path: str) -> str:
+    """メモリマップで読み込んでMD5を計算（hashlibは計算中GILを解放する）"""
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return h.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            h.update(m)
+    return h.hexdigest()
+
+
+def hash_files(paths: dict[str, str],
+               workers: int | None = None) -> dict[str, str]:
+    """{キー: パス} をスレッドプールで並列にハッシュ。読めなかったものは含めない"""
+    def task(item):
+        key, path = item
+        try:
+            return key, file_md5(path)
+        except (OSError, ValueError):
+            return key, None
+
+    workers = workers or min(8, (os.cpu_count() or 2) * 2)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(task, paths.items())
+        return {key: md5 for key, md5 in results if md5 is not None}
+
+
+def scan(local_path: str, previous: dict | None = None,
+         include=None) -> dict[str, list]:
+    """ローカルのワールドを走査。サイズと更新時刻が前回と同じならハッシュを再利用"""
+    prev_files = previous.get("files", {}) if previous else {}
+    files = {}
+    to_hash = {}
+    for root, _dirs, names in os.walk(local_path):
+        for name in names:
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, local_path).replace(os.sep, "/")
+            if include and not include(rel):
+                continue
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            prev = prev_files.get(rel)
+            if prev and prev[0] == st.st_size and prev[1] == st.st_mtime_ns:
+                files[rel] = [st.st_size, st.st_mtime_ns, prev[2]]
+            else:
+                files[rel] = [st.st_size, st.st_mtime_ns, None]
+                to_hash[rel] = full
+    hashes = hash_files(to_hash)
+    for rel in to_hash:
+        if rel in hashes:
+            files[rel][2] = hashes[rel]
+        else:
+            del files[rel]
+    return files
+
+
+def new_manifest(files: dict[str, list], version: int,
+                 packs: dict | None = None,
+                 encoded: dict | None = None) -> dict:
+    return {
+        "format": MANIFEST_FORMAT,
+        "version": version,
+        "updated": datetime.now(timezone.utc).isoformat(),
+        "files": files,
+        "packs": packs or {},
+        "encoded": encoded or {},
+    }
+
+
+def diff(source: dict[str, list],
+         target: dict[str, list]) -> tuple[list[str], list[str]]:
+    """sourceをtargetに一致させるために転送するパスと削除するパス"""
+    changed = [
+        rel for rel, entry in source.items()
+        if rel not in target
+        or target[rel][0] != entry[0] or target[rel][2] != entry[2]
+    ]
+    removed = [rel for rel in target if rel not in source]
+    return sorted(changed), sorted(removed)
+
+
+def verify(local_path: str, expected: dict[str, str],
+           cache: dict[str, list]) -> tuple[list[str], dict[str, list]]:
+    """ローカルのファイルをexpected（相対パス -> md5）と照合する。
+
+    cacheは検証済みのハッシュ（相対パス -> [サイズ, 更新時刻(ns), md5]）。
+    サイズと更新時刻が変わっていないファイルは再計算しない。
+    戻り値は (一致しない・存在しないファイル, 更新後のcache)。
+    """
+    bad = []
+    new_cache = {}
+    stats = {}
+    to_hash = {}
+    for rel in expected:
+        full = os.path.join(local_path, *rel.split("/"))
+        try:
+            st = os.stat(full)
+        except OSError:
+            bad.append(rel)
+            continue
+        cached = cache.get(rel)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            new_cache[rel] = cached
+        else:
+            stats[rel] = [st.st_size, st.st_mtime_ns]
+            to_hash[rel] = full
+    hashes = hash_files(to_hash)
+    for rel in to_hash:
+        if rel in hashes:
+            new_cache[rel] = stats[rel] + [hashes[rel]]
+        else:
+            bad.append(rel)
+    bad += [rel for rel, entry in new_cache.items() if entry[2] != expected[rel]]
+    # 不一致のファイルはキャッシュしない（再ダウンロード後に必ず再計算する）
+    for rel in bad:
+        new_cache.pop(rel, None)
+    return sorted(bad), new_cache
@@ -0,0 +1,73 @@
+"""packer.py - 小さいファイルをバンドル(tar.gz)にまとめて転送"""
+
+import hashlib
+import os
+import tarfile
+import zlib
+from urllib.parse import quote
+
+# これ以下のサイズのファイルをバンドル対象にする
+PACK_MAX_FILE = 256 * 1024
+# 1バンドルの目安サイズ（超える場合はフォルダ内をハッシュで分割）
+PACK_TARGET_SIZE = 8 * 1024 * 1024
+
+_NEVER_PACK = (".mca", ".mcc")
+
+
+def plan(files: dict[str, list],
+         max_file: int = PACK_MAX_FILE) -> dict[str, list[str]]:
+    """バンドルID -> 含める相対パス。フォルダ単位でまとめ、直下のファイルは対象外"""
+    groups: dict[str, list[str]] = {}
+    for rel, entry in files.items():
+        if "/" not in rel or entry[0] > max_file or rel.endswith(_NEVER_PACK):
+            continue
+        groups.setdefault(rel.rsplit("/", 1)[0], []).append(rel)
+
+    packs: dict[str, list[str]] = {}
+    for group, rels in groups.items():
+        if len(rels) < 2:
+            continue
+        total = sum(files[rel][0] for rel in rels)
+        n = max(1, -(-total // PACK_TARGET_SIZE))
+        for rel in sorted(rels):
+            pack_id = group if n == 1 else f"{group}#{zlib.crc32(rel.encode()) % n}"
+            packs.setdefault(pack_id, []).append(rel)
+    return packs
+
+
+def digest(files: dict[str, list], rels: list[str]) -> str | None:
+    """メンバーのパスとMD5から求めるバンドルの内容ハッシュ（欠けていればNone）"""
+    h = hashlib.md5()
+    for rel in sorted(rels):
+        entry = files.get(rel)
+        if entry is None:
+            return None
+        h.update(f"{rel}\t{entry[2]}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def bundle_filename(pack_id: str) -> str:
+    return quote(pack_id, safe="") + ".tar.gz"
+
+
+def write_bundle(local_path: str, rels: list[str], dst: str) -> None:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with tarfile.open(dst, "w:gz", compresslevel=6) as tar:
+        for rel in sorted(rels):
+            tar.add(os.path.join(local_path, rel), arcname=rel, recursive=False)
+
+
+def extract_bundle(src: str, local_path: str, rels: list[str]) -> None:
+    """インデックスに載っているメンバーだけを展開"""
+    wanted = set(rels)
+    with tarfile.open(src, "r:gz") as tar:
+        members = [m for m in tar.getmembers()
+                   if m.isfile() and m.name in wanted]
+        if len(members) != len(wanted):
+            raise ValueError(f"バンドルの内容がインデックスと一致しません: {src}")
+        for member in members:
+            dst = os.path.join(local_path, *member.name.split("/"))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with tar.extractfile(member) as f_in, open(dst, "wb") as f_out:
+                f_out.write(f_in.read())
+            os.utime(dst, (member.mtime, member.mtime))
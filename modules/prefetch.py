@@ -0,0 +1,131 @@
+"""prefetch.py - 次にホストしそうなワールドのバックグラウンド先読み"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from modules.config_mgr import build_config, get_data_dir
+from modules.process_monitor import find_minecraft_process
+from modules.status_mgr import list_worlds
+from modules.world_sync import download_world, has_local_changes, is_remote_newer
+
+_history_lock = threading.Lock()
+
+
+def _history_path() -> str:
+    return os.path.join(get_data_dir(), "host_history.json")
+
+
+def load_history() -> dict:
+    try:
+        with open(_history_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_host(world_name: str) -> None:
+    """このPCでホストしたワールドを記録（先読みの優先度に使う）"""
+    with _history_lock:
+        history = load_history()
+        entry = history.setdefault(world_name, {"count": 0, "last": ""})
+        entry["count"] += 1
+        entry["last"] = datetime.now(timezone.utc).isoformat()
+        with open(_history_path(), "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=2, ensure_ascii=False)
+
+
+def rank_worlds(worlds: list[dict], history: dict) -> list[str]:
+    """オフラインのワールドをホスト履歴の多い順・新しい順に並べる"""
+    names = [
+        w.get("world_name", "") for w in worlds
+        if w.get("world_name") and w.get("status", "offline") != "online"
+    ]
+
+    def key(name):
+        entry = history.get(name, {})
+        return (entry.get("count", 0), entry.get("last", ""))
+
+    return sorted(names, key=key, reverse=True)
+
+
+class Prefetcher:
+    """アイドル中にDriveの新しい版をローカルへ取り込んでおくスレッド"""
+
+    def __init__(self, base: str, gas_url: str, interval_seconds: int = 900,
+                 max_worlds: int = 2, initial_delay: int = 60):
+        self._base = base
+        self._gas_url = gas_url
+        self._interval = interval_seconds
+        self._max_worlds = max_worlds
+        self._initial_delay = initial_delay
+        self._stop = threading.Event()
+        self._busy = threading.Lock()
+        self._holds = 0
+        self._holds_lock = threading.Lock()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    @contextmanager
+    def hold(self):
+        """ホスト・手動同期の間は先読みを止め、実行中の先読みの完了を待つ"""
+        with self._holds_lock:
+            self._holds += 1
+        try:
+            with self._busy:
+                pass
+            yield
+        finally:
+            with self._holds_lock:
+                self._holds -= 1
+
+    def _held(self) -> bool:
+        return self._holds > 0 or self._stop.is_set()
+
+    def _run(self) -> None:
+        if self._stop.wait(self._initial_delay):
+            return
+        while not self._stop.is_set():
+            if not self._held():
+                try:
+                    self._cycle()
+                except Exception as e:
+                    print(f"[先読み] エラー: {e}")
+            self._stop.wait(self._interval)
+
+    def _cycle(self) -> None:
+        if find_minecraft_process() is not None:
+            return
+        worlds = list_worlds(self._gas_url)
+        candidates = rank_worlds(worlds, load_history())
+        prefetched = 0
+        for name in candidates:
+            if prefetched >= self._max_worlds or self._held():
+                return
+            config = build_config(name, self._base)
+            if not config or not os.path.isdir(config["curseforge_instance_path"]):
+                continue
+            prefetched += 1
+            with self._busy:
+                if self._held():
+                    return
+                if not is_remote_newer(config):
+                    continue
+                if has_local_changes(config):
+                    # 未アップロードの変更を上書きしない
+                    print(f"[先読み] {name} にアップロードされていない変更があるため、"
+                          "先読みをスキップします。")
+                    continue
+                print(f"[先読み] {name} の新しい版をダウンロード中...")
+                if download_world(config):
+                    print(f"[先読み] {name} を最新にしました。")
+                else:
+                    print(f"[先読み] {name} のダウンロードに失敗しました。")
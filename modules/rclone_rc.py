@@ -0,0 +1,344 @@
+"""rclone_rc.py - 常駐rclone rcdのリモートコントロールAPIクライアント
+
+アプリ起動中は1つの `rclone rcd` を動かし、world_syncの操作をHTTP経由で
+送ることで、設定の再読み込み・再認証・フォルダの再一覧を省く。
+rcdが使えない操作や起動失敗時は、呼び出し側がサブプロセスで実行する。
+"""
+
+import os
+import secrets
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+import requests
+
+
+class RcError(Exception):
+    pass
+
+
+class RcloneDaemon:
+    def __init__(self, rclone_exe: str, rclone_conf: str,
+                 extra_args: list[str] | None = None):
+        self._exe = rclone_exe
+        self._conf = rclone_conf
+        self._extra_args = extra_args or []
+        self._proc = None
+        self._url = ""
+        self._session = requests.Session()
+        self._session.auth = ("mcmd", secrets.token_urlsafe(16))
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self, timeout: float = 15.0) -> bool:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        self._url = f"http://127.0.0.1:{port}/"
+        user, password = self._session.auth
+        cmd = [
+            self._exe, "rcd",
+            "--rc-addr", f"127.0.0.1:{port}",
+            "--rc-user", user, "--rc-pass", password,
+            "--config", self._conf,
+            *self._extra_args,
+        ]
+        try:
+            self._proc = subprocess.Popen(
+                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0,
+            )
+        except OSError as e:
+            print(f"[rclone] rcdを起動できません: {e}")
+            self._proc = None
+            return False
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.alive:
+                break
+            try:
+                self.call("rc/noop", timeout=2)
+                print(f"[rclone] rcdを起動しました ({self._url})")
+                return True
+            except RcError:
+                time.sleep(0.2)
+        print("[rclone] rcdの起動に失敗しました。サブプロセスで実行します。")
+        self.stop()
+        return False
+
+    def stop(self) -> None:
+        if self._proc is None:
+            return
+        try:
+            self.call("core/quit", timeout=2)
+        except RcError:
+            pass
+        try:
+            self._proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+        self._proc = None
+
+    def call(self, method: str, params: dict | None = None,
+             timeout: float = 60) -> dict:
+        try:
+            resp = self._session.post(self._url + method, json=params or {},
+                                      timeout=timeout)
+        except requests.RequestException as e:
+            raise RcError(str(e)) from e
+        try:
+            data = resp.json()
+        except ValueError:
+            data = {}
+        if resp.status_code != 200:
+            raise RcError(data.get("error") or f"HTTP {resp.status_code}")
+        return data
+
+    def run_job(self, method: str, params: dict, on_stats=None,
+                poll_interval: float = 1.0) -> tuple[bool, str]:
+        """非同期ジョブとして実行し、完了まで統計をon_statsに渡す"""
+        job = self.call(method, {**params, "_async": True})
+        jobid = job["jobid"]
+        group = f"job/{jobid}"
+        delay = 0.05
+        while True:
+            # 短いジョブを待たせないよう、間隔を徐々に広げる
+            delay = min(poll_interval, delay * 2)
+            time.sleep(delay)
+            status = self.call("job/status", {"jobid": jobid})
+            if on_stats is not None:
+                try:
+                    on_stats(self.call("core/stats", {"group": group}))
+                except RcError:
+                    pass
+            if status.get("finished"):
+                return bool(status.get("success")), status.get("error", "")
+
+
+# -- コマンドライン引数 → rc呼び出しへの変換 --
+
+_VALUE_FLAGS = {
+    "--files-from", "--exclude", "--include", "--max-depth", "--transfers",
+    "--checkers", "--drive-chunk-size", "--drive-upload-cutoff",
+    "--backup-dir", "--stats", "--stats-log-level",
+}
+_IGNORED_FLAGS = {"--use-json-log", "--stats", "--stats-log-level", "--progress"}
+_SYNC_METHODS = {"sync": "sync/sync", "copy": "sync/copy", "move": "sync/move"}
+_FILE_METHODS = {"copyto": "operations/copyfile", "moveto": "operations/movefile"}
+
+
+def _is_remote(path: str) -> bool:
+    return ":" in path and not os.path.isabs(path)
+
+
+def _split_path(path: str) -> tuple[str, str]:
+    """ファイルパスを (fs, remote) に分割"""
+    if _is_remote(path):
+        name, _, rest = path.partition(":")
+        parent, _, leaf = rest.rpartition("/")
+        return f"{name}:{parent}", leaf
+    return os.path.dirname(path) or ".", os.path.basename(path)
+
+
+def _with_backend_opts(path: str, opts: dict) -> str:
+    """Driveのチャンク設定は接続文字列で渡す"""
+    if not opts or not _is_remote(path):
+        return path
+    name, _, rest = path.partition(":")
+    params = ",".join(f"{k}={v}" for k, v in opts.items())
+    return f"{name},{params}:{rest}"
+
+
+def _parse_args(args: list[str]) -> tuple[list[str], dict]:
+    positional, flags = [], {}
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.startswith("--"):
+            name, eq, value = arg.partition("=")
+            if not eq and name in _VALUE_FLAGS:
+                i += 1
+                value = args[i]
+            elif not eq:
+                value = True
+            if name in _IGNORED_FLAGS:
+                pass
+            elif name in ("--exclude", "--include"):
+                flags.setdefault(name, []).append(value)
+            else:
+                flags[name] = value
+        else:
+            positional.append(arg)
+        i += 1
+    return positional, flags
+
+
+def translate(args: list[str]) -> tuple[str, str, dict] | None:
+    """rcloneの引数を (種別, rcメソッド, パラメータ) に変換。未対応ならNone"""
+    positional, flags = _parse_args(args)
+    if not positional:
+        return None
+    command, paths = positional[0], positional[1:]
+
+    config = {}
+    filters = {}
+    backend = {}
+    for name, value in list(flags.items()):
+        if name == "--transfers":
+            config["Transfers"] = int(value)
+        elif name == "--checkers":
+            config["Checkers"] = int(value)
+        elif name == "--no-traverse":
+            config["NoTraverse"] = True
+        elif name == "--backup-dir":
+            config["BackupDir"] = value
+        elif name == "--drive-chunk-size":
+            backend["chunk_size"] = value
+        elif name == "--drive-upload-cutoff":
+            backend["upload_cutoff"] = value
+        elif name == "--files-from":
+            filters["FilesFrom"] = [value]
+        elif name == "--exclude":
+            filters["ExcludeRule"] = value
+        elif name == "--include":
+            filters["IncludeRule"] = value
+        elif name == "--delete-empty-src-dirs":
+            pass  # moveでは常に指定する
+        elif name in ("--max-depth", "--dirs-only", "--files-only"):
+            continue
+        else:
+            return None
+        del flags[name]
+
+    params = {}
+    if config:
+        params["_config"] = config
+    if filters:
+        params["_filter"] = filters
+
+    if command in _SYNC_METHODS and len(paths) == 2:
+        params["srcFs"] = _with_backend_opts(paths[0], backend)
+        params["dstFs"] = _with_backend_opts(paths[1], backend)
+        if command == "move":
+            params["deleteEmptySrcDirs"] = True
+        return "job", _SYNC_METHODS[command], params
+    if command in _FILE_METHODS and len(paths) == 2:
+        params["srcFs"], params["srcRemote"] = _split_path(paths[0])
+        dst_fs, params["dstRemote"] = _split_path(paths[1])
+        params["dstFs"] = _with_backend_opts(dst_fs, backend)
+        return "call", _FILE_METHODS[command], params
+    if command == "delete" and len(paths) == 1:
+        params["fs"] = paths[0]
+        return "job", "operations/delete", params
+    if command == "purge" and len(paths) == 1:
+        params.update(fs=paths[0], remote="")
+        return "call", "operations/purge", params
+    if command == "deletefile" and len(paths) == 1:
+        params["fs"], params["remote"] = _split_path(paths[0])
+        return "call", "operations/deletefile", params
+    if command == "lsf" and len(paths) == 1:
+        if flags.get("--max-depth", "1") != "1":
+            return None
+        opt = {"dirsOnly": "--dirs-only" in flags,
+               "filesOnly": "--files-only" in flags}
+        params.update(fs=paths[0], remote="", opt=opt)
+        return "lsf", "operations/list", params
+    if command == "md5sum" and len(paths) == 1:
+        params.update(fs=paths[0], hashType="md5")
+        return "md5sum", "operations/hashsum", params
+    if command == "cat" and len(paths) == 1:
+        params["srcFs"], params["srcRemote"] = _split_path(paths[0])
+        return "cat", "operations/copyfile", params
+    return None
+
+
+# -- 常駐デーモン（アプリにつき1つ）--
+
+_daemon: RcloneDaemon | None = None
+_daemon_lock = threading.Lock()
+
+
+def start_daemon(rclone_exe: str, rclone_conf: str, folder_id: str) -> bool:
+    global _daemon
+    with _daemon_lock:
+        if _daemon is not None and _daemon.alive:
+            return True
+        daemon = RcloneDaemon(rclone_exe, rclone_conf,
+                              ["--drive-root-folder-id", folder_id])
+        if not daemon.start():
+            return False
+        _daemon = daemon
+        return True
+
+
+def stop_daemon() -> None:
+    global _daemon
+    with _daemon_lock:
+        if _daemon is not None:
+            _daemon.stop()
+            _daemon = None
+
+
+def get_daemon() -> RcloneDaemon | None:
+    daemon = _daemon
+    if daemon is None or not daemon.alive:
+        return None
+    return daemon
+
+
+def run(args: list[str], on_stats=None) -> tuple[bool, str] | None:
+    """転送系コマンドをrcdで実行。rcdで扱えない場合はNone"""
+    daemon = get_daemon()
+    call = translate(args) if daemon else None
+    if call is None or call[0] not in ("job", "call"):
+        return None
+    kind, method, params = call
+    try:
+        if kind == "job":
+            return daemon.run_job(method, params, on_stats)
+        daemon.call(method, params, timeout=600)
+        return True, ""
+    except RcError as e:
+        if not daemon.alive:
+            return None
+        return False, str(e)
+
+
+def output(args: list[str], timeout: float = 60) -> tuple[bool, str | None]:
+    """出力系コマンド（cat/lsf/md5sum）をrcdで実行。(処理したか, 標準出力相当)"""
+    daemon = get_daemon()
+    call = translate(args) if daemon else None
+    if call is None or call[0] not in ("lsf", "md5sum", "cat"):
+        return False, None
+    kind, method, params = call
+    try:
+        if kind == "lsf":
+            items = daemon.call(method, params, timeout=timeout).get("list", [])
+            return True, "".join(
+                item["Path"] + ("/" if item.get("IsDir") else "") + "\n"
+                for item in items
+            )
+        if kind == "md5sum":
+            return True, "".join(
+                line + "\n"
+                for line in daemon.call(method, params, timeout=timeout)["hashsum"]
+            )
+        tmp_dir = tempfile.mkdtemp(prefix="mcmd_rc_")
+        try:
+            params.update(dstFs=tmp_dir, dstRemote="out")
+            daemon.call(method, params, timeout=timeout)
+            with open(os.path.join(tmp_dir, "out"), "r", encoding="utf-8") as f:
+                return True, f.read()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except (RcError, OSError, KeyError):
+        if not daemon.alive:
+            return False, None
+        return True, None
@@ -0,0 +1,157 @@
+"""rclone_tuner.py - 転送ごとのrclone並列数・チャンクサイズ自動調整"""
+
+import json
+import os
+import threading
+
+from modules.config_mgr import get_data_dir
+
+_KB = 1024
+_MB = 1024 * 1024
+
+# ファイルサイズ分布のバケット（上限バイト, 名前）
+_BUCKETS = [
+    (64 * _KB, "tiny"),
+    (1 * _MB, "small"),
+    (16 * _MB, "medium"),
+    (128 * _MB, "large"),
+]
+
+# 同時転送数 × チャンクサイズのメモリ上限
+_CHUNK_MEMORY_LIMIT = 512 * _MB
+# 学習に使う最小転送量（これ未満の実行は計測誤差が大きい）
+_MIN_RECORD_BYTES = 4 * _MB
+# N回に1回、最良値から並列数をずらして試す
+_EXPLORE_EVERY = 3
+
+_lock = threading.Lock()
+
+
+def _tuning_path() -> str:
+    return os.path.join(get_data_dir(), "tuning.json")
+
+
+def _load() -> dict:
+    try:
+        with open(_tuning_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(data: dict) -> None:
+    path = _tuning_path()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def histogram(sizes: list[int]) -> dict[str, int]:
+    hist = {name: 0 for _, name in _BUCKETS}
+    hist["huge"] = 0
+    for size in sizes:
+        for limit, name in _BUCKETS:
+            if size < limit:
+                hist[name] += 1
+                break
+        else:
+            hist["huge"] += 1
+    return hist
+
+
+def _profile(sizes: list[int]) -> str:
+    """転送内容の特徴（バイト数が最も多いバケット）"""
+    if not sizes:
+        return "unknown"
+    weight = {name: 0 for _, name in _BUCKETS}
+    weight["huge"] = 0
+    for size in sizes:
+        for limit, name in _BUCKETS:
+            if size < limit:
+                weight[name] += size
+                break
+        else:
+            weight["huge"] += size
+    return max(weight, key=weight.get)
+
+
+def _heuristic(sizes: list[int]) -> dict:
+    if not sizes:
+        return {"transfers": 4, "checkers": 8, "chunk_mb": 8}
+    hist = histogram(sizes)
+    n = len(sizes)
+    small_ratio = (hist["tiny"] + hist["small"]) / n
+    if small_ratio > 0.8 and n >= 50:
+        transfers = 16
+    elif small_ratio > 0.5:
+        transfers = 8
+    else:
+        transfers = 4
+    largest = max(sizes)
+    if largest < 64 * _MB:
+        chunk_mb = 8
+    elif largest < 512 * _MB:
+        chunk_mb = 32
+    else:
+        chunk_mb = 64
+    return {"transfers": min(transfers, n), "checkers": max(8, transfers * 2),
+            "chunk_mb": chunk_mb}
+
+
+def choose(world: str, op: str, sizes: list[int]) -> dict:
+    """過去の実績とファイルサイズ分布から今回のパラメータを決める"""
+    params = _heuristic(sizes)
+    with _lock:
+        entry = _load().get(world, {}).get(op, {}).get(_profile(sizes))
+    if entry and entry.get("best"):
+        best = entry["best"]["params"]
+        params["transfers"] = best["transfers"]
+        params["chunk_mb"] = max(params["chunk_mb"], best["chunk_mb"])
+        if entry.get("runs", 0) % _EXPLORE_EVERY == _EXPLORE_EVERY - 1:
+            if entry.get("explore_up", True):
+                params["transfers"] = min(32, params["transfers"] * 2)
+            else:
+                params["transfers"] = max(1, params["transfers"] // 2)
+    params["transfers"] = max(1, params["transfers"])
+    params["checkers"] = max(8, params["transfers"] * 2)
+    while (params["chunk_mb"] > 8
+           and params["transfers"] * params["chunk_mb"] * _MB > _CHUNK_MEMORY_LIMIT):
+        params["chunk_mb"] //= 2
+    return params
+
+
+def to_flags(params: dict) -> list[str]:
+    chunk = f"{params['chunk_mb']}M"
+    return [
+        "--transfers", str(params["transfers"]),
+        "--checkers", str(params["checkers"]),
+        "--drive-chunk-size", chunk,
+        "--drive-upload-cutoff", chunk,
+    ]
+
+
+def record(world: str, op: str, sizes: list[int], params: dict,
+           seconds: float, moved: int | None = None) -> None:
+    """実測スループットを保存（ワールド・操作・サイズ分布ごと）。
+    movedはrcloneの統計から得た実際の転送バイト数"""
+    total = sum(sizes) if moved is None else moved
+    if total < _MIN_RECORD_BYTES or seconds <= 0:
+        return
+    rate = total / seconds
+    with _lock:
+        data = _load()
+        entry = data.setdefault(world, {}).setdefault(op, {}).setdefault(
+            _profile(sizes), {"runs": 0})
+        entry["runs"] += 1
+        entry["last"] = {"params": params, "rate": rate}
+        best = entry.get("best")
+        if (best is None or rate > best["rate"]
+                or params["transfers"] == best["params"]["transfers"]):
+            entry["best"] = {"params": params, "rate": rate}
+        elif params["transfers"] != best["params"]["transfers"]:
+            # 探索が外れたら次回は逆方向を試す
+            entry["explore_up"] = not entry.get("explore_up", True)
+        entry["histogram"] = histogram(sizes)
+        _save(data)
+    print(f"[チューニング] {op}: {total / _MB:.1f} MB / {seconds:.1f}秒 "
+          f"({rate / _MB:.2f} MB/s, transfers={params['transfers']})")
@@ -0,0 +1,135 @@
+"""region_codec.py - リージョン(.mca)ファイルの転送・保存用圧縮
+
+リージョンファイルはセクタ単位の詰め物や空きセクタを含み、チャンクは
+zlib（deflate）で個別に圧縮されている。エンコード時は、同じzlibレベルで
+再圧縮するとバイト単位で一致するチャンクを展開済みNBTとして格納し、
+ファイル全体をzstd（無ければlzma）でまとめて圧縮する。それ以外の部分
+（ヘッダー・長さ・詰め物・空きセクタ・再現できないチャンク）はそのまま
+格納するため、デコード結果は元のファイルとバイト単位で一致する。
+"""
+
+import io
+import lzma
+import os
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from modules.region_delta import SECTOR_SIZE, _read_header
+
+_MAGIC = b"MCRZ\x01"
+_CODECS = {b"z": "zstd", b"x": "lzma"}
+_ZLIB = 2
+# Minecraftの既定（Deflaterの既定レベル）を最初に試す
+_ZLIB_LEVELS = (6, 1, 2, 3, 4, 5, 7, 8, 9)
+_ZSTD_LEVEL = 19
+
+_VERBATIM = b"V"
+_INFLATED = b"I"
+
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "lzma"
+
+
+def _inflate_exact(payload: bytes) -> tuple[int, bytes] | None:
+    """再圧縮で元のバイト列に戻せるなら (zlibレベル, 展開データ)"""
+    try:
+        raw = zlib.decompress(payload)
+    except zlib.error:
+        return None
+    for level in _ZLIB_LEVELS:
+        if zlib.compress(raw, level) == payload:
+            return level, raw
+    return None
+
+
+def _tokens(data: bytes):
+    """リージョンを (種別, zlibレベル, バイト列) の列に分解"""
+    locations, _timestamps = _read_header(io.BytesIO(data))
+    chunks = sorted(
+        offset * SECTOR_SIZE for offset, count in locations if offset and count
+    )
+    pos = 0
+    for start in chunks:
+        if start < max(pos, SECTOR_SIZE * 2) or start + 5 > len(data):
+            continue
+        length = struct.unpack_from(">I", data, start)[0]
+        end = start + 4 + length
+        if length < 1 or end > len(data) or data[start + 4] != _ZLIB:
+            continue
+        inflated = _inflate_exact(data[start + 5:end])
+        if inflated is None:
+            continue
+        yield _VERBATIM, 0, data[pos:start + 5]
+        yield _INFLATED, inflated[0], inflated[1]
+        pos = end
+    yield _VERBATIM, 0, data[pos:]
+
+
+def _compress(codec: str, body: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandardがインストールされていません。")
+        return zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(body)
+    return lzma.compress(body, preset=6)
+
+
+def _decompress(codec: str, blob: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd形式の展開にはzstandardが必要です。")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return lzma.decompress(blob)
+
+
+def encode(src: str, dst: str, codec: str | None = None) -> int:
+    """srcをエンコードしてdstに書き込み、エンコード後のサイズを返す"""
+    codec = codec or default_codec()
+    with open(src, "rb") as f:
+        data = f.read()
+    body = bytearray()
+    for kind, level, chunk in _tokens(data):
+        body += kind + struct.pack(">BI", level, len(chunk)) + chunk
+    tag = next(k for k, v in _CODECS.items() if v == codec)
+    blob = (_MAGIC + tag + struct.pack(">QI", len(data), zlib.crc32(data))
+            + _compress(codec, bytes(body)))
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp_path = dst + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(blob)
+    os.replace(tmp_path, dst)
+    return len(blob)
+
+
+def decode(src: str, dst: str) -> None:
+    with open(src, "rb") as f:
+        blob = f.read()
+    if not blob.startswith(_MAGIC) or blob[len(_MAGIC):len(_MAGIC) + 1] not in _CODECS:
+        raise ValueError(f"不正なリージョン圧縮ファイルです: {src}")
+    pos = len(_MAGIC)
+    codec = _CODECS[blob[pos:pos + 1]]
+    size, crc = struct.unpack_from(">QI", blob, pos + 1)
+    body = _decompress(codec, blob[pos + 13:])
+
+    out = bytearray()
+    pos = 0
+    while pos < len(body):
+        kind = body[pos:pos + 1]
+        level, length = struct.unpack_from(">BI", body, pos + 1)
+        pos += 6
+        chunk = body[pos:pos + length]
+        pos += length
+        out += zlib.compress(chunk, level) if kind == _INFLATED else chunk
+    if len(out) != size or zlib.crc32(out) != crc:
+        raise ValueError(f"リージョンの復元結果が元のファイルと一致しません: {src}")
+
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    tmp_path = dst + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(out)
+    os.replace(tmp_path, dst)
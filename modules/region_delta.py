@@ -0,0 +1,129 @@
+"""region_delta.py - リージョン(.mca)ファイルのチャンク単位差分"""
+
+import hashlib
+import os
+import struct
+
+SECTOR_SIZE = 4096
+CHUNKS_PER_REGION = 1024
+
+_PATCH_MAGIC = b"MCDP\x01"
+
+
+def _read_header(f) -> tuple[list[tuple[int, int]], list[int]]:
+    header = f.read(SECTOR_SIZE * 2)
+    if len(header) < SECTOR_SIZE * 2:
+        return [], []
+    locations = []
+    for i in range(CHUNKS_PER_REGION):
+        entry = struct.unpack_from(">I", header, i * 4)[0]
+        locations.append((entry >> 8, entry & 0xFF))
+    timestamps = list(struct.unpack_from(f">{CHUNKS_PER_REGION}I",
+                                         header, SECTOR_SIZE))
+    return locations, timestamps
+
+
+def read_timestamps(path: str) -> dict[int, int]:
+    """ヘッダーのみ読み込み、存在するチャンクのタイムスタンプを返す"""
+    with open(path, "rb") as f:
+        locations, timestamps = _read_header(f)
+    return {
+        i: timestamps[i]
+        for i, (offset, count) in enumerate(locations) if offset and count
+    }
+
+
+def read_chunks(path: str) -> dict[int, tuple[int, bytes]]:
+    """チャンク番号 -> (タイムスタンプ, 圧縮種別+圧縮データ)"""
+    chunks = {}
+    with open(path, "rb") as f:
+        locations, timestamps = _read_header(f)
+        for i, (offset, count) in enumerate(locations):
+            if not offset or not count:
+                continue
+            f.seek(offset * SECTOR_SIZE)
+            raw_len = f.read(4)
+            if len(raw_len) < 4:
+                continue
+            length = struct.unpack(">I", raw_len)[0]
+            if length == 0 or length > count * SECTOR_SIZE:
+                continue
+            payload = f.read(length)
+            if len(payload) < length:
+                continue
+            chunks[i] = (timestamps[i], payload)
+    return chunks
+
+
+def chunk_table(chunks: dict[int, tuple[int, bytes]]) -> dict[str, list]:
+    """状態ファイル用のチャンク表（番号 -> [タイムスタンプ, sha1]）"""
+    return {
+        str(i): [ts, hashlib.sha1(payload).hexdigest()]
+        for i, (ts, payload) in sorted(chunks.items())
+    }
+
+
+def write_region(path: str, chunks: dict[int, tuple[int, bytes]]) -> None:
+    """チャンク集合からリージョンファイルを再構築"""
+    locations = bytearray(SECTOR_SIZE)
+    timestamps = bytearray(SECTOR_SIZE)
+    body = bytearray()
+    sector = 2
+    for i, (ts, payload) in sorted(chunks.items()):
+        blob = struct.pack(">I", len(payload)) + payload
+        count = -(-len(blob) // SECTOR_SIZE)
+        if count > 0xFF:
+            raise ValueError(f"チャンクが大きすぎます: {path} #{i}")
+        struct.pack_into(">I", locations, i * 4, (sector << 8) | count)
+        struct.pack_into(">I", timestamps, i * 4, ts)
+        body += blob + b"\x00" * (count * SECTOR_SIZE - len(blob))
+        sector += count
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(locations)
+        f.write(timestamps)
+        f.write(body)
+    os.replace(tmp_path, path)
+
+
+# -- パッチ --
+
+def diff_chunks(chunks: dict[int, tuple[int, bytes]],
+                base_table: dict[str, list]) -> tuple[list[int], list[int]]:
+    """base_tableに対する変更チャンク番号と削除チャンク番号を返す"""
+    table = chunk_table(chunks)
+    changed = [int(k) for k, v in table.items() if base_table.get(k) != v]
+    removed = [int(k) for k in base_table if k not in table]
+    return sorted(changed), sorted(removed)
+
+
+def build_patch(chunks: dict[int, tuple[int, bytes]],
+                changed: list[int], removed: list[int]) -> bytes:
+    out = bytearray(_PATCH_MAGIC)
+    out += struct.pack(">I", len(changed))
+    for i in changed:
+        ts, payload = chunks[i]
+        out += struct.pack(">HII", i, ts, len(payload)) + payload
+    out += struct.pack(">I", len(removed))
+    for i in removed:
+        out += struct.pack(">H", i)
+    return bytes(out)
+
+
+def apply_patch(chunks: dict[int, tuple[int, bytes]], patch: bytes) -> None:
+    if not patch.startswith(_PATCH_MAGIC):
+        raise ValueError("不正なパッチファイルです。")
+    pos = len(_PATCH_MAGIC)
+    (n_changed,) = struct.unpack_from(">I", patch, pos)
+    pos += 4
+    for _ in range(n_changed):
+        i, ts, length = struct.unpack_from(">HII", patch, pos)
+        pos += 10
+        chunks[i] = (ts, patch[pos:pos + length])
+        pos += length
+    (n_removed,) = struct.unpack_from(">I", patch, pos)
+    pos += 4
+    for _ in range(n_removed):
+        (i,) = struct.unpack_from(">H", patch, pos)
+        pos += 2
+        chunks.pop(i, None)
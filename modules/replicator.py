@@ -0,0 +1,99 @@
+"""replicator.py - プレイ中のワールドを継続的にDriveへ複製
+
+savesフォルダのワールドを定期的に走査し、書き込みが落ち着いた変更から
+スナップショット経由でアップロードする。終了時のアップロードは
+最後の数秒分の変更だけになる。
+
+変更されたパスを個別に送るのではなく、スナップショットとマニフェストの
+差分（upload_world）で送る。転送されるのは変更されたファイルだけだが、
+マニフェストの版・バンドル・リージョン圧縮を通常のアップロードと同じ
+手順で一貫して更新するため。走査はサイズと更新時刻のみで、ハッシュは
+変更されたファイルにしか計算しない。
+"""
+
+import os
+import threading
+import time
+
+from modules import timeline
+from modules.world_sync import snapshot_world, upload_world
+
+
+def _scan(path: str) -> dict[str, tuple[int, int]]:
+    files = {}
+    for root, _dirs, names in os.walk(path):
+        for name in names:
+            full = os.path.join(root, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            files[os.path.relpath(full, path)] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+class Replicator:
+    """変更が settle_seconds 止まったら（最長 max_delay 待ったら）複製する"""
+
+    def __init__(self, config: dict, settle_seconds: float = 20,
+                 max_delay: float = 120, poll_interval: float = 3.0,
+                 on_message=print):
+        self._config = config
+        self._path = os.path.join(config["curseforge_instance_path"], "saves",
+                                  config["world_name"])
+        self._settle = settle_seconds
+        self._max_delay = max_delay
+        self._interval = poll_interval
+        self._send = on_message
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """監視を止め、実行中の複製の完了を待つ"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        world_name = self._config["world_name"]
+        previous = _scan(self._path)
+        dirty_since = None
+        last_change = 0.0
+        changed = set()
+        while not self._stop.wait(self._interval):
+            current = _scan(self._path)
+            now = time.monotonic()
+            if current != previous:
+                last_change = now
+                if dirty_since is None:
+                    dirty_since = now
+                changed.update(rel for rel in current.keys() | previous.keys()
+                               if current.get(rel) != previous.get(rel))
+            previous = current
+            if dirty_since is None:
+                continue
+            if (now - last_change < self._settle
+                    and now - dirty_since < self._max_delay):
+                continue
+            dirty_since = None
+            pending, changed = changed, set()
+            count = len(pending)
+            try:
+                with timeline.span("replicate", changed=count) as span:
+                    snapshot_path = snapshot_world(self._config)
+                    span["ok"] = bool(snapshot_path) and upload_world(
+                        self._config, source_path=snapshot_path)
+                if span["ok"]:
+                    self._send(f"[複製] {world_name} の変更（{count}件）をDriveに反映しました。")
+                else:
+                    self._send(f"[複製] {world_name} の反映に失敗しました。しばらくして再試行します。")
+                    dirty_since = last_change = time.monotonic()
+                    changed |= pending
+            except Exception as e:
+                self._send(f"[複製] エラー: {e}")
+                dirty_since = last_change = time.monotonic()
+                changed |= pending
@@ -0,0 +1,122 @@
+"""snapshot.py - プレイ中ワールドの一貫したローカルスナップショット"""
+
+import json
+import os
+import shutil
+
+# Minecraftが一時ファイル+リネームで書き換えるファイル（ハードリンクで安全に固定できる）。
+# リージョンやdata/・Modの.datはその場で書き換えられることがあるため必ずコピーする。
+_LINKABLE_FILES = ("level.dat",)
+_LINKABLE_DIRS = ("playerdata/",)
+# コピー中に元ファイルが変化した場合の再試行回数
+_COPY_RETRIES = 3
+
+
+def _stat_key(path: str) -> list[int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _commit(tmp: str, dst: str) -> None:
+    # 同じ実体へのハードリンク同士ではrenameが何もしないため、先に片付ける
+    if os.path.exists(dst) and os.path.samefile(tmp, dst):
+        os.remove(tmp)
+    else:
+        os.replace(tmp, dst)
+
+
+def _linkable(rel: str) -> bool:
+    return rel in _LINKABLE_FILES or (
+        rel.startswith(_LINKABLE_DIRS) and rel.endswith(".dat")
+        and "/" not in rel.split("/", 1)[1])
+
+
+def _place(src: str, dst: str, link: bool = False) -> list[int] | None:
+    """srcをdstに固定し、固定した時点の [サイズ, 更新時刻] を返す"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + ".snap"
+    for _ in range(_COPY_RETRIES):
+        before = _stat_key(src)
+        if before is None:
+            return None
+        try:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if link:
+                try:
+                    os.link(src, tmp)
+                except OSError:
+                    shutil.copy2(src, tmp)
+            else:
+                shutil.copy2(src, tmp)
+        except OSError:
+            continue
+        if _stat_key(src) == before:
+            _commit(tmp, dst)
+            return before
+    # 書き込みが続いている場合は最後のコピーを採用（次回のスナップショットで更新）
+    if os.path.exists(tmp):
+        _commit(tmp, dst)
+        return _stat_key(dst)
+    return None
+
+
+def _walk(root: str) -> dict[str, str]:
+    files = {}
+    for dirpath, _dirs, names in os.walk(root):
+        for name in names:
+            full = os.path.join(dirpath, name)
+            files[os.path.relpath(full, root).replace(os.sep, "/")] = full
+    return files
+
+
+def take_snapshot(src: str, dest: str, index_path: str) -> dict:
+    """srcの変更ファイルだけをdestに反映する。
+
+    前回から変化のないファイルはそのまま残し、変化したファイルはコピー
+    （level.datとplayerdataはハードリンク）する。2周目で1周目の間に変化したファイルを拾い直す。
+    戻り値は {"copied": 件数, "removed": 件数, "files": 件数}。
+    """
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    if not os.path.isdir(dest):
+        index = {}
+
+    copied = 0
+    for _ in range(2):
+        changed = 0
+        sources = _walk(src)
+        for rel, full in sources.items():
+            key = _stat_key(full)
+            if key is None or index.get(rel) == key:
+                continue
+            placed = _place(full, os.path.join(dest, *rel.split("/")),
+                            _linkable(rel))
+            if placed is not None:
+                index[rel] = placed
+                changed += 1
+        copied += changed
+        if not changed:
+            break
+
+    removed = 0
+    for rel in list(index):
+        if rel not in sources:
+            try:
+                os.remove(os.path.join(dest, *rel.split("/")))
+            except OSError:
+                pass
+            del index[rel]
+            removed += 1
+
+    tmp = index_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp, index_path)
+    return {"copied": copied, "removed": removed, "files": len(index)}
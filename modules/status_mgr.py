@@ -1,38 +1,326 @@
 """status_mgr.py - GASステータス管理（マルチワールド）"""
 
 import json
+import queue
+import random
+import threading
+import time
 from datetime import datetime, timezone
 
 import requests
+import requests.adapters
 
+from modules import timeline
 
-def _get(gas_url: str, params: dict) -> dict:
-    try:
-        resp = requests.get(gas_url, params=params, timeout=15)
+
+# -- 通信クライアント --
+#
+# GAS（script.google.com）への接続はセッションで使い回し、TLS接続と
+# リダイレクト先（googleusercontent.com）への接続を毎回張り直さない。
+# 一時的なエラー（接続失敗・タイムアウト・429・5xx・JSONでない応答）は
+# 指数バックオフ＋ジッターで再試行する。失敗が続いた場合はサーキット
+# ブレーカーを開き、しばらくは即座に失敗を返す（GUIを待たせない）。
+# update_domain / set_offline はバックグラウンドのキューから送信する。
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+# GASが処理した上での失敗（再送しても結果は変わらない）
+_LOGICAL_ERRORS = {"missing world", "missing world or host", "world not found",
+                   "not host", "unknown action"}
+
+
+class _Transient(Exception):
+    """再試行すべき失敗"""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class StatusClient:
+    def __init__(self, gas_url: str, timeout: float = 15, retries: int = 3,
+                 backoff: float = 0.5, max_backoff: float = 8.0,
+                 breaker_threshold: int = 5, breaker_reset: float = 60.0):
+        self._url = gas_url
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._breaker_threshold = breaker_threshold
+        self._breaker_reset = breaker_reset
+        self._failures = 0
+        self._opened_at = None
+        self._breaker_lock = threading.Lock()
+
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._worker = None
+        self._closed = False
+
+    # -- サーキットブレーカー --
+
+    def _breaker_open(self) -> bool:
+        with self._breaker_lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at >= self._breaker_reset:
+                # 半開: 1回だけ試し、失敗すればまた開く
+                self._opened_at = None
+                self._failures = self._breaker_threshold - 1
+                return False
+            return True
+
+    def _record(self, ok: bool) -> None:
+        with self._breaker_lock:
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._failures >= self._breaker_threshold and self._opened_at is None:
+                self._opened_at = time.monotonic()
+                print(f"[GAS] 失敗が続いたため、{self._breaker_reset:.0f}秒間リクエストを止めます。")
+
+    # -- 送信 --
+
+    def _send_once(self, method: str, body: dict) -> dict:
+        try:
+            if method == "GET":
+                resp = self._session.get(self._url, params=body, timeout=self._timeout)
+            else:
+                resp = self._session.post(self._url, json=body, timeout=self._timeout,
+                                          allow_redirects=True)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _Transient(str(e))
+        if resp.status_code in _RETRY_STATUS:
+            retry_after = resp.headers.get("Retry-After")
+            raise _Transient(f"HTTP {resp.status_code}",
+                             float(retry_after) if retry_after and retry_after.isdigit()
+                             else None)
         resp.raise_for_status()
-        return json.loads(resp.text)
-    except Exception as e:
-        print(f"[エラー] GAS GETリクエスト失敗: {e}")
-        return {"error": str(e)}
+        try:
+            return json.loads(resp.text)
+        except ValueError:
+            # GASの起動失敗時などはHTMLのエラーページが返る
+            raise _Transient("JSONでない応答")
+
+    def _delay(self, attempt: int, retry_after: float | None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self._max_backoff * 4)
+        # フルジッター: 0〜(backoff * 2^attempt) の一様乱数
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
+
+    def request(self, method: str, body: dict, retries: int | None = None) -> dict:
+        """応答のJSON。失敗時は {"error": ...}（POSTは "success": False も付く）"""
+        failed = {"error": ""} if method == "GET" else {"success": False, "error": ""}
+        if self._breaker_open():
+            return {**failed, "error": "GASへの接続を一時停止中です"}
+        retries = self._retries if retries is None else retries
+        with timeline.span(f"gas:{body.get('action')}") as span:
+            for attempt in range(retries + 1):
+                try:
+                    data = self._send_once(method, body)
+                    self._record(True)
+                    span["attempts"] = attempt + 1
+                    return data
+                except _Transient as e:
+                    error, retry_after = str(e), e.retry_after
+                except Exception as e:
+                    error, retry_after = str(e), None
+                    attempt = retries  # 4xx等は再試行しない
+                if attempt >= retries:
+                    break
+                time.sleep(self._delay(attempt, retry_after))
+            span["ok"] = False
+            span["attempts"] = attempt + 1
+        self._record(False)
+        print(f"[エラー] GAS {method}リクエスト失敗: {error}")
+        return {**failed, "error": error}
+
+    def _read_your_writes(self) -> None:
+        # 送信待ちの書き込みを先に反映する（ブレーカーが開いている間は待たない）
+        if not self._breaker_open():
+            self.flush(timeout=10)
+
+    def get(self, params: dict) -> dict:
+        self._read_your_writes()
+        return self.request("GET", params)
+
+    def post(self, payload: dict) -> dict:
+        self._read_your_writes()
+        return self.request("POST", payload)
+
+    # -- 書き込みキュー --
+
+    def enqueue(self, payload: dict, on_done=None) -> None:
+        """payloadをバックグラウンドで送信する。on_done(成否) は送信スレッドから呼ばれる"""
+        with self._pending_cond:
+            self._pending += 1
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._drain, daemon=True)
+                self._worker.start()
+        self._queue.put((payload, on_done))
+
+    def _drain(self) -> None:
+        while True:
+            payload, on_done = self._queue.get()
+            ok = False
+            # 一時的な失敗は長めに粘る（ブレーカーが開いている間は閉じるまで待つ）
+            for attempt in range(8):
+                while self._breaker_open() and not self._closed:
+                    time.sleep(1.0)
+                data = self.request("POST", payload, retries=0)
+                if data.get("success"):
+                    ok = True
+                    break
+                if (payload.get("action") == "set_offline"
+                        and data.get("error") == "not host"):
+                    # 既に解放済み・別のホストが引き継ぎ済みなら、解放するものは無い
+                    ok = True
+                    break
+                if "error" in data and data["error"] in _LOGICAL_ERRORS:
+                    break
+                if self._closed:
+                    break
+                time.sleep(self._delay(attempt + 1, None))
+            if on_done is not None:
+                try:
+                    on_done(ok)
+                except Exception:
+                    pass
+            with self._pending_cond:
+                self._pending -= 1
+                self._pending_cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """キューが空になるまで待つ。時間内に空になればTrue"""
+        if threading.current_thread() is self._worker:
+            return True
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout: float = 15) -> bool:
+        flushed = self.flush(timeout)
+        self._closed = True
+        self._session.close()
+        return flushed
+
+
+_clients: dict[str, StatusClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(gas_url: str) -> StatusClient:
+    with _clients_lock:
+        client = _clients.get(gas_url)
+        if client is None:
+            client = _clients[gas_url] = StatusClient(gas_url)
+        return client
+
+
+def shutdown(timeout: float = 15) -> bool:
+    """送信待ちの書き込みを送り切ってから接続を閉じる。全て送れたらTrue。
+    リースの延長も止める（保持中のロックは期限が来れば切れる）"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        heartbeats = list(_heartbeats.values())
+        _heartbeats.clear()
+    for heartbeat in heartbeats:
+        heartbeat.stop()
+    return all([client.close(timeout) for client in clients])
+
+
+def _get(gas_url: str, params: dict) -> dict:
+    return get_client(gas_url).get(params)
 
 
 def _post(gas_url: str, payload: dict) -> dict:
-    try:
-        resp = requests.post(
-            gas_url, json=payload, timeout=15, allow_redirects=True,
-        )
-        resp.raise_for_status()
-        return json.loads(resp.text)
-    except Exception as e:
-        print(f"[エラー] GAS POSTリクエスト失敗: {e}")
-        return {"success": False, "error": str(e)}
+    data = get_client(gas_url).post(payload)
+    _cache(gas_url).invalidate()
+    return data
+
+
+def _enqueue(gas_url: str, payload: dict, on_done=None) -> None:
+    def done(ok: bool) -> None:
+        _cache(gas_url).invalidate()
+        if on_done is not None:
+            on_done(ok)
+
+    _cache(gas_url).invalidate()
+    get_client(gas_url).enqueue(payload, done)
 
 
 # -- 読み取り --
 
-def list_worlds(gas_url: str) -> list[dict]:
-    data = _get(gas_url, {"action": "list_worlds"})
-    return data.get("worlds", [])
+# ワールド一覧のキャッシュ。GASのステータス版数を覚えておき、更新時は
+# 版数を送って「変更なし」か変更された行だけを受け取る。
+# 自分が書き込んだ後は期限切れにして、次の一覧取得で取り直す。
+LIST_TTL_SECONDS = 5.0
+
+
+class _WorldCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.rows: dict[str, dict] = {}
+        self.names: list[str] = []
+        self.fetched = 0.0
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.fetched = 0.0
+
+    def snapshot(self) -> list[dict]:
+        return [dict(self.rows[name]) for name in self.names if name in self.rows]
+
+
+_caches: dict[str, _WorldCache] = {}
+
+
+def _cache(gas_url: str) -> _WorldCache:
+    with _clients_lock:
+        return _caches.setdefault(gas_url, _WorldCache())
+
+
+def list_worlds(gas_url: str, max_age: float = LIST_TTL_SECONDS) -> list[dict]:
+    """ワールド一覧。max_age秒以内に取得済みならキャッシュを返す"""
+    cache = _cache(gas_url)
+    with cache.lock:
+        if cache.version is not None and time.monotonic() - cache.fetched < max_age:
+            return cache.snapshot()
+        params = {"action": "list_worlds"}
+        if cache.version is not None:
+            params["since"] = cache.version
+    data = _get(gas_url, params)
+    with cache.lock:
+        if "error" in data:
+            # 取得に失敗した場合は手元の一覧を返す（無ければ空）
+            return cache.snapshot()
+        _apply_list(cache, data)
+        return cache.snapshot()
+
+
+def _apply_list(cache: _WorldCache, data: dict) -> None:
+    """list_worlds の応答をキャッシュに反映する（cache.lockを保持して呼ぶ）"""
+    if data.get("not_modified"):
+        cache.fetched = time.monotonic()
+        return
+    worlds = data.get("worlds", [])
+    if not data.get("partial"):
+        cache.rows = {}
+    for row in worlds:
+        cache.rows[row.get("world_name", "")] = row
+    cache.names = data.get("names") or [row.get("world_name", "") for row in worlds]
+    cache.rows = {name: cache.rows[name] for name in cache.names if name in cache.rows}
+    # 版数に対応していない古いGASでは毎回全件を取り直す
+    cache.version = data.get("version")
+    cache.fetched = time.monotonic()
 
 
 def get_status(gas_url: str, world_name: str) -> dict:
@@ -42,48 +330,219 @@ def get_status(gas_url: str, world_name: str) -> dict:
 
 # -- 書き込み --
 
-def set_online(gas_url: str, world_name: str, player_name: str,
-               domain: str = "preparing...") -> bool:
-    payload = {
+# ホストロックのリース期間（秒）。ハートビートが止まってからこの時間で切れる
+LEASE_SECONDS = 300
+
+def _set_online_payload(world_name: str, player_name: str, domain: str,
+                        lease_seconds: int, takeover: bool) -> dict:
+    return {
         "action": "set_online",
         "world": world_name,
         "host": player_name,
         "domain": domain,
+        "lease": lease_seconds,
+        "takeover": takeover,
     }
+
+
+def set_online(gas_url: str, world_name: str, player_name: str,
+               domain: str = "preparing...",
+               lease_seconds: int = LEASE_SECONDS, takeover: bool = False) -> bool:
+    """ホストロック（lease_seconds秒のリース）を取得する。
+    GAS側でロック付きの比較・設定を行うため、同時に取得しても勝つのは1人だけ。
+    他のプレイヤーの期限切れのロックは takeover=True のときだけ引き継ぐ"""
+    payload = _set_online_payload(world_name, player_name, domain,
+                                  lease_seconds, takeover)
     data = _post(gas_url, payload)
     if data.get("success") and data.get("current_host") == player_name:
+        if data.get("previous_host"):
+            print(f"[情報] {data['previous_host']} の期限切れのロックを引き継ぎました。")
         return True
     if data.get("current_host") and data.get("current_host") != player_name:
         print(f"[情報] {data['current_host']} が既にホスト中です。")
     return False
 
 
-def update_domain(gas_url: str, world_name: str, domain: str) -> bool:
-    payload = {"action": "update_domain", "world": world_name, "domain": domain}
-    data = _post(gas_url, payload)
-    return data.get("success", False)
+def update_domain(gas_url: str, world_name: str, player_name: str,
+                  domain: str, on_done=None) -> None:
+    """バックグラウンドで送信（待たない）。on_done(成否) で結果を受け取れる。
+    GASはplayer_nameがホストのときだけ反映する（遅れて届いた送信で上書きしない）"""
+    payload = {"action": "update_domain", "world": world_name,
+               "host": player_name, "domain": domain}
+    _enqueue(gas_url, payload, on_done)
 
 
-def set_offline(gas_url: str, world_name: str) -> bool:
-    payload = {"action": "set_offline", "world": world_name}
-    data = _post(gas_url, payload)
-    return data.get("success", False)
+def set_offline(gas_url: str, world_name: str, player_name: str,
+                on_done=None) -> None:
+    """バックグラウンドで送信（待たない）。on_done(成否) で結果を受け取れる。
+    GASはplayer_nameがホストのときだけ解放する"""
+    # 解放するロックのリースはもう延長しない
+    stop_heartbeat(gas_url, world_name)
+    payload = {"action": "set_offline", "world": world_name, "host": player_name}
+    _enqueue(gas_url, payload, on_done)
 
 
 def add_world(gas_url: str, world_name: str) -> bool:
-    payload = {"action": "add_world", "world": world_name}
-    data = _post(gas_url, payload)
+    """ワールドを追加し、同じ往復で最新の一覧をキャッシュに反映する"""
+    data = batch(gas_url, [{"action": "add_world", "world": world_name}],
+                 include_list=True)
     return data.get("success", False)
 
 
 def delete_world(gas_url: str, world_name: str) -> bool:
-    """GASステータスシートからワールドを削除"""
-    payload = {"action": "delete_world", "world": world_name}
-    data = _post(gas_url, payload)
+    """GASステータスシートからワールドを削除（最新の一覧も同じ往復で受け取る）"""
+    data = batch(gas_url, [{"action": "delete_world", "world": world_name}],
+                 include_list=True)
     return data.get("success", False)
 
 
-# -- ロック --
+# -- まとめて送信 --
+#
+# GASへのリクエストは1回ごとに数秒かかることがあるため、続けて行う操作は
+# batch で1回にまとめる。GAS側では1つのロックの中で順に実行され、
+# 失敗した操作より後は実行されない（それまでの書き込みは取り消されない）。
+
+def batch(gas_url: str, ops: list[dict], include_list: bool = False) -> dict:
+    """opsを1回のリクエストで順に実行し、{"success", "results": [...]} を返す。
+    include_list なら実行後のワールド一覧を受け取り、キャッシュに反映する"""
+    cache = _cache(gas_url)
+    payload = {"action": "batch", "ops": ops}
+    if include_list:
+        payload["list"] = True
+        with cache.lock:
+            if cache.version is not None:
+                payload["since"] = cache.version
+    data = get_client(gas_url).post(payload)
+    if data.get("error") == "unknown action":
+        # batchに対応していない古いGAS: 1件ずつ送る
+        return _batch_one_by_one(gas_url, ops)
+    with cache.lock:
+        if isinstance(data.get("list"), dict):
+            _apply_list(cache, data["list"])
+        elif any(op.get("action") != "get_status" for op in ops):
+            cache.fetched = 0.0
+    data.setdefault("results", [])
+    return data
+
+
+def _batch_one_by_one(gas_url: str, ops: list[dict]) -> dict:
+    results = []
+    for op in ops:
+        if op.get("action") == "get_status":
+            result = _get(gas_url, op)
+        else:
+            result = _post(gas_url, op)
+        results.append(result)
+        if result.get("success") is False or "error" in result:
+            return {"success": False, "results": results}
+    return {"success": True, "results": results}
+
+
+def acquire_host(gas_url: str, world_name: str, player_name: str,
+                 lease_seconds: int = LEASE_SECONDS,
+                 takeover: bool = False) -> tuple[bool, dict]:
+    """ステータス確認とホストロックの取得を1往復で行う。
+    (取得できたか, 取得前のステータス) を返す。通信できなければステータスは error"""
+    ops = [
+        {"action": "get_status", "world": world_name},
+        _set_online_payload(world_name, player_name, "preparing...",
+                            lease_seconds, takeover),
+    ]
+    data = batch(gas_url, ops)
+    results = data["results"]
+    if not results or "error" in results[0]:
+        return False, {"status": "error"}
+    status_info = results[0]
+    if len(results) < 2:
+        return False, status_info
+    lock = results[1]
+    if lock.get("success") and lock.get("current_host") == player_name:
+        if lock.get("previous_host"):
+            print(f"[情報] {lock['previous_host']} の期限切れのロックを引き継ぎました。")
+        return True, status_info
+    return False, status_info
+
+
+# -- ロック（リース）--
+#
+# ホストロックは期限付きのリースで、ホスト中は定期的にハートビートを送って
+# 延長する。ホストのPCが落ちるとハートビートが止まり、数分でリースが切れて
+# 他のプレイヤーが引き継げるようになる。
+
+
+class Heartbeat:
+    """ホスト中のリースを定期的に延長するスレッド"""
+
+    def __init__(self, gas_url: str, world_name: str, player_name: str,
+                 lease_seconds: int = LEASE_SECONDS, on_lost=None):
+        self.gas_url = gas_url
+        self.world_name = world_name
+        self.player_name = player_name
+        self.lease_seconds = lease_seconds
+        # リースの1/5ごとに延長する（数回失敗しても切れない）
+        self.interval = max(10.0, lease_seconds / 5)
+        self.on_lost = on_lost
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        payload = {
+            "action": "heartbeat",
+            "world": self.world_name,
+            "host": self.player_name,
+            "lease": self.lease_seconds,
+        }
+        while not self._stop.wait(self.interval):
+            data = get_client(self.gas_url).request("POST", payload, retries=1)
+            if data.get("success") or self._stop.is_set():
+                continue
+            if data.get("error") == "lease lost":
+                # 通信できない間にリースが切れ、他のプレイヤーが引き継いだ
+                if self.on_lost is not None:
+                    self.on_lost(data.get("current_host", ""))
+                else:
+                    print(f"[警告] {self.world_name} のホストロックを失いました"
+                          f"（現在のホスト: {data.get('current_host') or 'なし'}）")
+                return
+            # 一時的な失敗は次の周期で再送する
+
+
+_heartbeats: dict[tuple[str, str], Heartbeat] = {}
+
+
+def start_heartbeat(gas_url: str, world_name: str, player_name: str,
+                    lease_seconds: int = LEASE_SECONDS, on_lost=None) -> Heartbeat:
+    """リースの延長を始める。set_offline か stop_heartbeat で止まる"""
+    heartbeat = Heartbeat(gas_url, world_name, player_name, lease_seconds, on_lost)
+    with _clients_lock:
+        previous = _heartbeats.get((gas_url, world_name))
+        _heartbeats[(gas_url, world_name)] = heartbeat
+    if previous is not None:
+        previous.stop()
+    return heartbeat.start()
+
+
+def stop_heartbeat(gas_url: str, world_name: str) -> None:
+    with _clients_lock:
+        heartbeat = _heartbeats.pop((gas_url, world_name), None)
+    if heartbeat is not None:
+        heartbeat.stop()
+
+
+def is_lease_expired(status_info: dict, timeout_hours: int) -> bool:
+    """get_status の結果からロックが切れているかを判定する。
+    リース対応のGASはサーバーの時計で判定した lease_expired を返す"""
+    if "lease_expired" in status_info:
+        return bool(status_info["lease_expired"])
+    return is_lock_expired(status_info.get("lock_timestamp", ""), timeout_hours)
+
 
 def is_lock_expired(lock_timestamp: str, timeout_hours: int) -> bool:
     if not lock_timestamp:
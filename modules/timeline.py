@@ -0,0 +1,227 @@
+"""timeline.py - ホストセッションの段階ごとの所要時間を記録
+
+ホストセッション中の各段階（ステータス確認・ロック・ダウンロード・
+バックアップ・アップロード等）と、その中の小さな処理（GAS呼び出し・
+rclone実行）を data/session_timeline.jsonl に1行ずつ追記する。
+どこで時間が掛かっているかを、セッションごとのタイムラインと
+セッション横断のパーセンタイルで確認できる。
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from modules.config_mgr import get_data_dir
+
+_FILE = "session_timeline.jsonl"
+# レポートで読む最大行数（古い記録は読まない）
+_MAX_LINES = 20000
+
+_write_lock = threading.Lock()
+_local = threading.local()
+
+
+def _path() -> str:
+    return os.path.join(get_data_dir(), _FILE)
+
+
+def _append(record: dict) -> None:
+    with _write_lock:
+        try:
+            with open(_path(), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+
+class _Session:
+    def __init__(self, world_name: str, player_name: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.world = world_name
+        self.player = player_name
+        self.started = time.monotonic()
+        self.started_at = datetime.now(timezone.utc).isoformat()
+
+
+# -- 現在のセッション（アプリにつき1つ）--
+
+_session: _Session | None = None
+
+
+def begin(world_name: str, player_name: str) -> None:
+    global _session
+    _session = _Session(world_name, player_name)
+
+
+def end(outcome: str) -> None:
+    """セッション全体の記録を書き、計測を終える。outcomeは ok / failed 等"""
+    global _session
+    session, _session = _session, None
+    if session is None:
+        return
+    _append({
+        "type": "session",
+        "session": session.id,
+        "world": session.world,
+        "player": session.player,
+        "time": session.started_at,
+        "duration": round(time.monotonic() - session.started, 3),
+        "outcome": outcome,
+    })
+
+
+def _stack() -> list[str]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """with内の処理を1区間として記録する。セッション外では何もしない。
+
+    入れ子にすると "download/rclone:download" のようなパスで記録される。
+    yieldされるdictに "ok" などを書き込むと記録に含まれる。
+    """
+    session = _session
+    info = dict(attrs)
+    if session is None:
+        yield info
+        return
+    stack = _stack()
+    stack.append(name)
+    path = "/".join(stack)
+    started = time.monotonic()
+    info.setdefault("ok", True)
+    try:
+        yield info
+    except BaseException:
+        info["ok"] = False
+        raise
+    finally:
+        stack.pop()
+        _append({
+            "type": "span",
+            "session": session.id,
+            "world": session.world,
+            "path": path,
+            "start": round(started - session.started, 3),
+            "duration": round(time.monotonic() - started, 3),
+            "thread": threading.current_thread().name,
+            **info,
+        })
+
+
+def mark(name: str) -> None:
+    """時間幅の無い出来事（準備完了など）を記録する"""
+    with span(name):
+        pass
+
+
+# -- レポート --
+
+def load_sessions() -> list[dict]:
+    """記録を読み、新しい順のセッション一覧 [{"session": ..., "spans": [...]}] を返す"""
+    path = _path()
+    if not os.path.isfile(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()[-_MAX_LINES:]
+    except OSError:
+        return []
+    sessions = {}
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        entry = sessions.setdefault(record.get("session"),
+                                    {"session": None, "spans": []})
+        if record.get("type") == "session":
+            entry["session"] = record
+        else:
+            entry["spans"].append(record)
+    # 終了記録の無いセッション（アプリ終了などで中断）も残す
+    result = [e for e in sessions.values() if e["spans"] or e["session"]]
+    for entry in result:
+        # 同時に始まった区間は外側（長い方）を先に
+        entry["spans"].sort(key=lambda s: (s["start"], -s["duration"],
+                                           s["path"].count("/")))
+    result.sort(key=lambda e: (e["session"] or {}).get("time", ""), reverse=True)
+    return result
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    pos = (len(values) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def percentiles(sessions: list[dict]) -> dict[str, dict]:
+    """区間パスごとの {件数, p50, p90, 最大}（1セッション内の同じ区間は合計する）"""
+    per_path = {}
+    for entry in sessions:
+        totals = {}
+        for record in entry["spans"]:
+            totals[record["path"]] = totals.get(record["path"], 0.0) + record["duration"]
+        for path, total in totals.items():
+            per_path.setdefault(path, []).append(total)
+    return {
+        path: {
+            "count": len(values),
+            "p50": _percentile(values, 0.5),
+            "p90": _percentile(values, 0.9),
+            "max": max(values),
+        }
+        for path, values in per_path.items()
+    }
+
+
+def _bar(start: float, duration: float, total: float, width: int = 30) -> str:
+    if total <= 0:
+        return ""
+    left = int(start / total * width)
+    length = max(1, round(duration / total * width)) if duration > 0 else 0
+    return " " * left + ("#" * length if length else "|")
+
+
+def format_report(sessions: list[dict], limit: int = 5) -> str:
+    """直近 limit セッションのタイムラインと、全セッションのパーセンタイル表"""
+    if not sessions:
+        return "記録がありません。ホストセッションを行うと記録されます。"
+    lines = []
+    for entry in sessions[:limit]:
+        info = entry["session"] or {}
+        spans = entry["spans"]
+        total = info.get("duration") or max(
+            (s["start"] + s["duration"] for s in spans), default=0.0)
+        world = info.get("world") or (spans[0]["world"] if spans else "?")
+        lines.append(f"■ {info.get('time', '（中断）')[:19]}  {world}  "
+                     f"{total:.1f}s  {info.get('outcome', '中断')}")
+        for record in spans:
+            depth = record["path"].count("/")
+            name = "  " * depth + record["path"].rsplit("/", 1)[-1]
+            flag = "" if record.get("ok", True) else " NG"
+            lines.append(f"  {name:<32.32} {record['start']:>8.1f} "
+                         f"{record['duration']:>8.1f}s "
+                         f"{_bar(record['start'], record['duration'], total)}{flag}")
+        lines.append("")
+
+    lines.append(f"■ 全{len(sessions)}セッションの所要時間（秒）")
+    lines.append(f"  {'区間':<30} {'件数':>5} {'p50':>8} {'p90':>8} {'最大':>8}")
+    stats = percentiles(sessions)
+    for path in sorted(stats, key=lambda p: -stats[p]["p50"]):
+        s = stats[path]
+        lines.append(f"  {path:<32.32} {s['count']:>5} {s['p50']:>8.1f} "
+                     f"{s['p90']:>8.1f} {s['max']:>8.1f}")
+    return "\n".join(lines)
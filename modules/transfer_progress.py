@@ -0,0 +1,111 @@
+"""transfer_progress.py - rcloneのJSON統計を進捗イベントに変換"""
+
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timezone
+
+from modules.config_mgr import get_data_dir
+
+# rcloneに渡すフラグ（1秒ごとに統計をJSONログとして出力）
+STATS_FLAGS = ["--use-json-log", "--stats", "1s", "--stats-log-level", "NOTICE"]
+
+
+@dataclass
+class ProgressEvent:
+    world: str
+    op: str
+    bytes_done: int = 0
+    bytes_total: int = 0
+    rate: float = 0.0
+    eta: float | None = None
+    in_flight: list[str] = field(default_factory=list)
+    files_done: int = 0
+    files_total: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    finished: bool = False
+    ok: bool = True
+
+    @property
+    def fraction(self) -> float:
+        if self.bytes_total <= 0:
+            return 1.0 if self.finished else 0.0
+        return min(1.0, self.bytes_done / self.bytes_total)
+
+
+_listeners = []
+_listeners_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+
+
+def add_listener(callback) -> None:
+    with _listeners_lock:
+        _listeners.append(callback)
+
+
+def remove_listener(callback) -> None:
+    with _listeners_lock:
+        if callback in _listeners:
+            _listeners.remove(callback)
+
+
+def emit(event: ProgressEvent) -> None:
+    # 受信側が別スレッドで読むため、送るのは更新されないコピー
+    event = replace(event, in_flight=list(event.in_flight))
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for callback in listeners:
+        try:
+            callback(event)
+        except Exception:
+            pass
+
+
+def parse_line(line: str) -> tuple[dict | None, str | None]:
+    """JSONログ1行を (統計, エラーメッセージ) に分解"""
+    line = line.strip()
+    if not line:
+        return None, None
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None, line
+    if not isinstance(entry, dict):
+        return None, None
+    if "stats" in entry:
+        return entry["stats"], None
+    if entry.get("level") in ("error", "critical"):
+        obj = entry.get("object")
+        msg = entry.get("msg", "").strip()
+        return None, f"{obj}: {msg}" if obj else msg
+    return None, None
+
+
+def update_event(event: ProgressEvent, stats: dict) -> ProgressEvent:
+    event.bytes_done = int(stats.get("bytes", 0))
+    event.bytes_total = int(stats.get("totalBytes", 0))
+    event.rate = float(stats.get("speed", 0.0))
+    event.eta = stats.get("eta")
+    event.in_flight = [t.get("name", "") for t in stats.get("transferring") or []]
+    event.files_done = int(stats.get("transfers", 0))
+    event.files_total = int(stats.get("totalTransfers", 0))
+    event.errors = int(stats.get("errors", 0))
+    event.elapsed = float(stats.get("elapsedTime", 0.0))
+    return event
+
+
+def record_metrics(event: ProgressEvent) -> None:
+    """完了した転送の実績を data/transfer_metrics.jsonl に追記"""
+    entry = asdict(event)
+    entry.pop("in_flight", None)
+    entry["avg_rate"] = event.bytes_done / event.elapsed if event.elapsed else 0.0
+    entry["time"] = datetime.now(timezone.utc).isoformat()
+    path = os.path.join(get_data_dir(), "transfer_metrics.jsonl")
+    with _metrics_lock:
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
@@ -1,12 +1,40 @@
 """world_sync.py - rcloneワールド同期（マルチワールド）"""
 
+import json
 import os
+import posixpath
+import shutil
 import subprocess
+import tarfile
+import threading
+import time
 from datetime import datetime, timezone
 
+from modules import (
+    bandwidth, download_plan, manifest, packer, rclone_rc, rclone_tuner, region_codec,
+    region_delta, snapshot, timeline, transfer_progress,
+)
+from modules.config_mgr import get_data_dir, get_state_dir
+
+# Drive上のメタデータフォルダ（worlds/<world>/.mcmd/）
+META_DIR = ".mcmd"
+_META_EXCLUDE = f"/{META_DIR}/**"
+_MANIFEST = f"{META_DIR}/manifest.json"
+_REGIONS = f"{META_DIR}/regions.json"
+_CODEC_DIR = f"{META_DIR}/codec"
+
+# リージョン差分モード: パッチがこの数を超えるとベースを再アップロード
+MAX_REGION_PATCHES = 16
+
+# 世代管理（backup_mode: "versioned"）の実行中アップロードの退避先
+_versioning = threading.local()
+
 
 def _run_rclone(config: dict, args: list[str],
-                show_progress: bool = True) -> bool:
+                show_progress: bool = True, op: str | None = None,
+                sizes: list[int] | None = None) -> bool:
+    """op（upload/download等）を指定すると、sizesの分布と過去の実績から
+    並列数・チャンクサイズを自動調整し、実測スループットを記録する"""
     rclone_exe = config["rclone_exe_path"]
     rclone_conf = config["rclone_config_path"]
     folder_id = config["rclone_drive_folder_id"]
@@ -16,81 +44,1177 @@ def _run_rclone(config: dict, args: list[str],
         "--config", rclone_conf,
         "--drive-root-folder-id", folder_id,
     ]
-    if show_progress:
-        cmd.append("--progress")
+    params = None
+    if op and config.get("adaptive_tuning", True):
+        params = rclone_tuner.choose(config["world_name"], op, sizes or [])
+        cmd += rclone_tuner.to_flags(params)
+    cmd += transfer_progress.STATS_FLAGS
+    backup_dir = getattr(_versioning, "backup_dir", None)
+    if backup_dir and args[0] in ("sync", "copy", "copyto"):
+        # 上書き・削除される旧版はDrive上で世代フォルダへ移動される。
+        # copytoは宛先の親フォルダが基準になるので、ワールド内の位置を補う
+        world = _remote_world(config) + "/"
+        if args[0] == "copyto" and args[2].startswith(world):
+            parent = posixpath.dirname(args[2][len(world):])
+            if parent:
+                backup_dir = f"{backup_dir}/{parent}"
+        args = [*args, "--backup-dir", backup_dir]
+        cmd += ["--backup-dir", backup_dir]
+    # ホスト中・一括操作中は帯域を制限（rcd経由の場合はcore/bwlimitで制御済み）
+    bwlimit = bandwidth.current_flag()
+    if bwlimit is not None:
+        cmd += ["--bwlimit", bwlimit]
 
     print(f"[rclone] 実行中: {' '.join(cmd)}")
 
+    event = transfer_progress.ProgressEvent(world=config["world_name"],
+                                            op=op or args[0])
+
+    def on_stats(stats: dict) -> None:
+        transfer_progress.update_event(event, stats)
+        if show_progress:
+            transfer_progress.emit(event)
+
+    started = time.monotonic()
+    extra = rclone_tuner.to_flags(params) if params else []
+    with timeline.span(f"rclone:{op or args[0]}") as span:
+        result = rclone_rc.run([*args, *extra], on_stats)
+        if result is None:
+            result = _run_rclone_process(cmd, on_stats)
+        span["ok"] = result[0]
+        span["bytes"] = event.bytes_done
+    ok, errors = result
+    seconds = time.monotonic() - started
+
+    event.finished = True
+    event.ok = ok
+    event.elapsed = seconds
+    if show_progress:
+        transfer_progress.emit(event)
+    if op:
+        transfer_progress.record_metrics(event)
+    if not ok:
+        for error in errors.splitlines()[-5:]:
+            print(f"[rcloneエラー] {error}")
+        return False
+    if params is not None and sizes:
+        rclone_tuner.record(config["world_name"], op, sizes, params,
+                            seconds, moved=event.bytes_done or None)
+    return True
+
+
+def _run_rclone_process(cmd: list[str], on_stats) -> tuple[bool, str]:
+    errors = []
     try:
-        result = subprocess.run(
-            cmd, capture_output=not show_progress, text=True,
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", errors="replace",
             creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0,
         )
-        if result.returncode != 0:
-            if not show_progress and result.stderr:
-                print(f"[rcloneエラー] {result.stderr.strip()}")
-            return False
-        return True
+        for line in proc.stderr:
+            stats, error = transfer_progress.parse_line(line)
+            if stats is not None:
+                on_stats(stats)
+            elif error:
+                errors.append(error)
+        return proc.wait() == 0, "\n".join(errors)
     except FileNotFoundError:
-        print(f"[エラー] rcloneが見つかりません: {rclone_exe}")
-        return False
+        return False, f"rcloneが見つかりません: {cmd[0]}"
     except Exception as e:
-        print(f"[エラー] rcloneエラー: {e}")
-        return False
+        return False, f"rcloneエラー: {e}"
 
 
-def check_remote_world_exists(config: dict) -> bool:
+def _rclone_output(config: dict, args: list[str],
+                   timeout: int = 60) -> str | None:
+    handled, out = rclone_rc.output(args, timeout=timeout)
+    if handled:
+        return out
+
     rclone_exe = config["rclone_exe_path"]
     rclone_conf = config["rclone_config_path"]
     folder_id = config["rclone_drive_folder_id"]
-    remote_name = config["rclone_remote_name"]
-    world_name = config["world_name"]
 
     cmd = [
-        rclone_exe, "lsf", f"{remote_name}:worlds/{world_name}",
+        rclone_exe, *args,
         "--config", rclone_conf,
         "--drive-root-folder-id", folder_id,
-        "--max-depth", "1",
     ]
     try:
         result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=30,
+            cmd, capture_output=True, text=True, timeout=timeout,
             creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0,
         )
-        return result.returncode == 0 and result.stdout.strip() != ""
+        if result.returncode != 0:
+            return None
+        return result.stdout
     except Exception:
+        return None
+
+
+def _remote_world(config: dict, rel: str = "") -> str:
+    remote = f"{config['rclone_remote_name']}:worlds/{config['world_name']}"
+    return f"{remote}/{rel}" if rel else remote
+
+
+def _remote_backups(config: dict, rel: str = "") -> str:
+    remote = f"{config['rclone_remote_name']}:backups/{config['world_name']}"
+    return f"{remote}/{rel}" if rel else remote
+
+
+def _read_remote_json(config: dict, remote_path: str) -> dict | None:
+    out = _rclone_output(config, ["cat", remote_path])
+    if not out:
+        return None
+    try:
+        return json.loads(out)
+    except ValueError:
+        return None
+
+
+def _write_remote_json(config: dict, remote_path: str, data: dict) -> bool:
+    path = os.path.join(get_state_dir(config),
+                        "upload_" + remote_path.rsplit("/", 1)[-1])
+    _save_json(path, data)
+    return _run_rclone(config, ["copyto", path, remote_path],
+                       show_progress=False)
+
+
+def _load_json(path: str) -> dict | None:
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_json(path: str, data: dict) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _dir_sizes(path: str) -> list[int]:
+    return [
+        os.path.getsize(os.path.join(root, name))
+        for root, _dirs, names in os.walk(path) for name in names
+    ]
+
+
+def _dir_files(path: str) -> list[str]:
+    return [
+        os.path.relpath(os.path.join(root, name), path).replace(os.sep, "/")
+        for root, _dirs, names in os.walk(path) for name in names
+    ]
+
+
+def _write_list(path: str, items: list[str]) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(items) + "\n")
+    return path
+
+
+def _remove_remote_files(config: dict, list_path: str) -> bool:
+    """ワールドから削除。世代管理中のアップロードでは世代フォルダへ移動する"""
+    backup_dir = getattr(_versioning, "backup_dir", None)
+    if backup_dir:
+        return _run_rclone(config, ["move", _remote_world(config), backup_dir,
+                                    "--files-from", list_path],
+                           show_progress=False)
+    return _run_rclone(config, ["delete", _remote_world(config),
+                                "--files-from", list_path],
+                       show_progress=False)
+
+
+def check_remote_world_exists(config: dict) -> bool:
+    remote = read_remote_manifest(config)
+    if remote is not None:
+        return bool(remote.get("files"))
+
+    out = _rclone_output(config, ["lsf", _remote_world(config),
+                                  "--max-depth", "1"], timeout=30)
+    return out is not None and out.strip() != ""
+
+
+# -- マニフェスト --
+#
+# Drive上の .mcmd/manifest.json がワールドの現在のファイル一覧（バージョン付き）。
+# ローカルには最後に同期したマニフェストを保存し、ハッシュのキャッシュと
+# 「リモートの方が新しいか」の判定に使う。
+
+def _manifest_state_path(config: dict) -> str:
+    return os.path.join(get_state_dir(config), "manifest.json")
+
+
+def _manifest_filter(delta: bool):
+    if delta:
+        return lambda rel: not rel.endswith(".mca")
+    return None
+
+
+def _sync_excludes(delta: bool) -> list[str]:
+    excludes = ["--exclude", _META_EXCLUDE]
+    if delta:
+        excludes += ["--exclude", "*.mca"]
+    return excludes
+
+
+def read_remote_manifest(config: dict) -> dict | None:
+    return _read_remote_json(config, _remote_world(config, _MANIFEST))
+
+
+def is_remote_newer(config: dict) -> bool:
+    """Drive上のワールドが最後に同期した版より新しいか（manifest 1ファイルの読み込みのみ）"""
+    remote = read_remote_manifest(config)
+    if remote is None:
+        return check_remote_world_exists(config)
+    synced = _load_json(_manifest_state_path(config))
+    return synced is None or remote.get("version", 0) > synced.get("version", 0)
+
+
+def has_local_changes(config: dict) -> bool:
+    """最後に同期した後でローカルのワールドが変更されたか（サイズと更新時刻のみで判定）。
+    同期の記録が無いワールドは変更ありとみなす"""
+    local_path = os.path.join(config["curseforge_instance_path"], "saves",
+                              config["world_name"])
+    if not os.path.isdir(local_path):
         return False
+    synced = _load_json(_manifest_state_path(config))
+    if synced is None:
+        return bool(os.listdir(local_path))
+    delta = bool(config.get("region_delta"))
+    include = _manifest_filter(delta)
+    files = synced.get("files", {})
+    regions = (_load_json(_region_state_path(config)) or {}) if delta else {}
+    seen = 0
+    for rel in _dir_files(local_path):
+        if rel.startswith(META_DIR + "/"):
+            continue
+        full = os.path.join(local_path, rel)
+        if include is not None and not include(rel):
+            have = regions.get(rel)
+            if have is None or not _timestamps_match(full, have["chunks"]):
+                return True
+            continue
+        entry = files.get(rel)
+        try:
+            st = os.stat(full)
+        except OSError:
+            continue
+        if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+            return True
+        seen += 1
+    return seen != len(files)
+
 
+def _plan_packs(config: dict, files: dict[str, list]) -> dict:
+    if not config.get("pack_small_files", True):
+        return {}
+    max_file = config.get("pack_max_file_kb", packer.PACK_MAX_FILE // 1024) * 1024
+    return {
+        pack_id: {"digest": packer.digest(files, rels), "files": rels}
+        for pack_id, rels in packer.plan(files, max_file).items()
+    }
 
-def download_world(config: dict) -> bool:
+
+def _pack_locations(packs: dict) -> dict[str, str]:
+    return {rel: pack_id for pack_id, p in packs.items() for rel in p["files"]}
+
+
+def _bundle_name(pack_id: str) -> str:
+    return f"{META_DIR}/packs/{packer.bundle_filename(pack_id)}"
+
+
+# -- リージョン圧縮 --
+#
+# region_codec有効時、リージョンファイルは .mcmd/codec/<相対パス>.mcz として
+# 圧縮して保存し、マニフェストの "encoded" に記録する。
+
+def _codec_enabled(config: dict) -> bool:
+    return bool(config.get("region_codec")) and not config.get("region_delta")
+
+
+def _codec_name(rel: str) -> str:
+    return f"{_CODEC_DIR}/{rel}.mcz"
+
+
+def _stage_encoded(config: dict, local_path: str, local_files: dict,
+                   rels: list[str], staging: str) -> dict[str, list]:
+    """relsを圧縮してstagingに置き、{相対パス: [形式, 圧縮後サイズ]} を返す。
+    中断したアップロードの再開時は、内容が同じなら作成済みのものを使う"""
+    staged_path = staging + ".json"
+    staged = _load_json(staged_path) or {}
+    wanted = {_codec_name(rel): rel for rel in rels}
+    for name in (_dir_files(staging) if os.path.isdir(staging) else []):
+        rel = wanted.get(name)
+        if rel is None or staged.get(rel, [None])[0] != local_files[rel][2]:
+            os.remove(os.path.join(staging, name))
+    staged = {
+        rel: entry for rel, entry in staged.items()
+        if os.path.isfile(os.path.join(staging, _codec_name(rel)))
+    }
+    codec = region_codec.default_codec()
+    for rel in rels:
+        if rel not in staged:
+            size = region_codec.encode(os.path.join(local_path, rel),
+                                       os.path.join(staging, _codec_name(rel)),
+                                       codec)
+            staged[rel] = [local_files[rel][2], codec, size]
+        _save_json(staged_path, staged)
+    return {rel: staged[rel][1:] for rel in rels}
+
+
+_report_lock = threading.Lock()
+
+
+def _report_codec(config: dict, new: dict) -> None:
+    """圧縮で節約できた容量を表示し、data/codec_report.json に記録"""
+    encoded = new.get("encoded", {})
+    if not encoded:
+        return
+    original = sum(new["files"][rel][0] for rel in encoded)
+    stored = sum(entry[1] for entry in encoded.values())
+    saved = original - stored
+    ratio = saved / original if original else 0.0
+    print(f"[圧縮] リージョン {len(encoded)}件: {original / 1048576:.1f}MB → "
+          f"{stored / 1048576:.1f}MB（{saved / 1048576:.1f}MB削減, {ratio:.0%}）")
+    path = os.path.join(get_data_dir(), "codec_report.json")
+    with _report_lock:
+        report = _load_json(path) or {}
+        report[config["world_name"]] = {
+            "files": len(encoded),
+            "original_bytes": original,
+            "stored_bytes": stored,
+            "saved_bytes": saved,
+            "updated": new["updated"],
+        }
+        _save_json(path, report)
+
+
+def _download_files(config: dict, local_path: str, remote: dict,
+                    delta: bool, only=None, keep=frozenset(),
+                    fetched: list | None = None,
+                    prune: bool | None = None) -> dict | None:
+    """onlyを指定すると、そのファイル（を含むバンドル）だけを取得して
+    空のdictを返す。keepのファイルは取得済みとして扱い、ローカルの内容を
+    そのまま記録する（無ければ記録しない）。fetchedには実際に取得した
+    ファイルの相対パスを追加する。pruneはDriveに無いローカルのファイルを
+    削除するか（既定はonlyを指定しないときだけ削除する）"""
+    state_dir = get_state_dir(config)
+    synced = _load_json(_manifest_state_path(config))
+    local_files = manifest.scan(local_path, synced, _manifest_filter(delta))
+    changed, removed = manifest.diff(remote["files"], local_files)
+    changed = [rel for rel in changed if rel not in keep]
+    removed = [rel for rel in removed if rel not in keep]
+    if only is not None:
+        changed = [rel for rel in changed if rel in only]
+    if not (only is None if prune is None else prune):
+        removed = []
+
+    remote_packs = remote.get("packs", {})
+    remote_encoded = remote.get("encoded", {})
+    packed = _pack_locations(remote_packs)
+    loose = [rel for rel in changed if rel not in packed]
+    decode = [rel for rel in loose if rel in remote_encoded]
+    # keepのファイルはバンドルから展開しない（ローカルの内容を上書きしない）
+    extract = {
+        pack_id: [rel for rel in p["files"] if rel not in keep]
+        for pack_id, p in remote_packs.items()
+        if packer.digest(local_files, p["files"]) != p["digest"]
+        and (only is None or any(rel in only for rel in p["files"]))
+    }
+    bundles = [pack_id for pack_id, rels in extract.items() if rels]
+
+    if loose or bundles:
+        print(f"[同期] 変更ファイル {len(loose)}件 / バンドル {len(bundles)}件を"
+              "ダウンロード")
+        fetch = [
+            _codec_name(rel) if rel in remote_encoded else rel for rel in loose
+        ] + [_bundle_name(pack_id) for pack_id in bundles]
+        sizes = [
+            remote_encoded[rel][1] if rel in remote_encoded
+            else remote["files"][rel][0] for rel in loose
+        ] + [
+            sum(remote["files"][rel][0] for rel in remote_packs[pack_id]["files"])
+            for pack_id in bundles
+        ]
+        list_path = _write_list(os.path.join(state_dir, "fetch.txt"), fetch)
+        if not _run_rclone(config, ["copy", _remote_world(config), local_path,
+                                    "--files-from", list_path,
+                                    "--no-traverse"],
+                           op="download", sizes=sizes):
+            return None
+        try:
+            for pack_id in bundles:
+                src = os.path.join(local_path, _bundle_name(pack_id))
+                packer.extract_bundle(src, local_path, extract[pack_id])
+            for rel in decode:
+                dst = os.path.join(local_path, rel)
+                region_codec.decode(os.path.join(local_path, _codec_name(rel)),
+                                    dst)
+                mtime = remote["files"][rel][1]
+                os.utime(dst, ns=(mtime, mtime))
+        except (OSError, ValueError, tarfile.TarError) as e:
+            print(f"[エラー] バンドル・圧縮ファイルの展開に失敗しました: {e}")
+            return None
+        finally:
+            shutil.rmtree(os.path.join(local_path, META_DIR),
+                          ignore_errors=True)
+        if fetched is not None:
+            fetched += loose
+            fetched += [rel for pack_id in bundles for rel in extract[pack_id]]
+    for rel in removed:
+        try:
+            os.remove(os.path.join(local_path, rel))
+        except OSError:
+            pass
+    if only is not None:
+        return {}
+
+    files = {}
+    for rel, entry in remote["files"].items():
+        try:
+            st = os.stat(os.path.join(local_path, rel))
+        except OSError:
+            if rel in keep:
+                continue
+            print(f"[エラー] ダウンロード後にファイルがありません: {rel}")
+            return None
+        md5 = entry[2]
+        if rel in keep:
+            # 先に取得した後で書き換えられている場合がある（level.datの修正や
+            # ホスト開始後のサーバーの保存など）。実際の内容から記録する
+            have = local_files.get(rel)
+            if have and have[:2] == [st.st_size, st.st_mtime_ns]:
+                md5 = have[2]
+            else:
+                md5 = manifest.file_md5(os.path.join(local_path, rel))
+        files[rel] = [st.st_size, st.st_mtime_ns, md5]
+    return manifest.new_manifest(files, remote.get("version", 0), remote_packs,
+                                 remote_encoded)
+
+
+def download_world(config: dict, on_ready=None) -> bool:
+    """on_readyを指定すると、ローカルに無い遠くのリージョン以外をすべて
+    取得・検証した時点でon_ready()を呼び、ホストを開始させる。
+
+    サーバーは起動後どのリージョンでも開く可能性があり、開いた後で置き換えると
+    どちらかの変更が失われる。そのため、ローカルにある古いファイルは先に
+    すべてDriveと一致させ、後回しにするのはローカルにまだ無いリージョン
+    （スポーン地点とプレイヤー周辺以外）だけにする。取得する前にサーバーが
+    作ってしまったリージョンは衝突として記録し、Driveの版を優先する"""
     instance_path = config["curseforge_instance_path"]
     world_name = config["world_name"]
-    remote_name = config["rclone_remote_name"]
 
     local_path = os.path.join(instance_path, "saves", world_name)
     os.makedirs(local_path, exist_ok=True)
-    remote_path = f"{remote_name}:worlds/{world_name}"
 
     print(f"\n[同期] ダウンロード中: Drive → {local_path}")
-    return _run_rclone(config, ["sync", remote_path, local_path])
+    # 前回の衝突でサーバーが作ったファイルは退避し、Driveの版を取得し直す
+    _set_aside_conflicts(config, local_path)
+    index = None
+    if config.get("region_delta"):
+        index = _read_remote_json(config, _remote_world(config, _REGIONS))
+    delta = index is not None
+
+    remote = read_remote_manifest(config)
+
+    early = on_ready is not None and remote is not None
+    deferred = frozenset()
+    if early:
+        first = download_plan.first_files(remote["files"])
+        with timeline.span("first_files", files=len(first)):
+            if _fetch_verified(config, local_path, remote, delta,
+                               only=set(first)) is None:
+                return False
+        regions = (set(index.get("regions", {})) if delta else
+                   {rel for rel in remote["files"] if rel.endswith(".mca")})
+        near = set(download_plan.priority_regions(local_path, regions))
+        deferred = frozenset(
+            rel for rel in regions - near
+            if not os.path.exists(os.path.join(local_path, rel))
+        )
+        with timeline.span("before_ready", deferred=len(deferred)):
+            if _fetch_verified(config, local_path, remote, delta,
+                               only=set(remote["files"]) - deferred,
+                               prune=True) is None:
+                return False
+            if delta and not _download_regions(config, local_path, index,
+                                               skip=deferred):
+                return False
+        print(f"[同期] ホスト開始に必要なファイルの準備完了。ローカルに無い"
+              f"リージョン {len(deferred)}件を続けてダウンロードします。")
+        # ここからサーバーがワールドに書き込み始める。以降はローカルにまだ
+        # 無いリージョンだけを取得し、既存のファイルは置き換えも削除もしない
+        on_ready()
+        on_ready = None
+
+    # 取得する前にサーバーが作ったリージョン。Driveの版で上書きすると
+    # サーバーが開いているファイルを置き換えてしまうため、ここでは取得しない
+    conflicts = {rel for rel in deferred
+                 if os.path.exists(os.path.join(local_path, rel))}
+    keep = frozenset()
+    if early:
+        keep = frozenset(remote["files"]) - (deferred - conflicts)
+    with timeline.span("remaining_files"):
+        synced = _fetch_verified(config, local_path, remote, delta,
+                                 keep=keep, prune=not early)
+    if synced is None:
+        return False
+    _save_json(_manifest_state_path(config), synced)
+
+    if delta:
+        with timeline.span("region_patches"):
+            ok = _download_regions(config, local_path, index,
+                                   only=deferred - conflicts if early else None)
+    else:
+        if config.get("region_delta"):
+            _save_json(_region_state_path(config), {})
+        ok = True
+    if not ok:
+        return False
+    _save_conflicts(config, conflicts)
+    if conflicts:
+        for rel in sorted(conflicts)[:10]:
+            print(f"[衝突] {rel}")
+        print(f"[警告] ダウンロードが終わる前にサーバーが作成したリージョンが"
+              f" {len(conflicts)}件あります。Driveの版を優先し、これらは"
+              "アップロードしません。ホスト終了後にDriveの版へ置き換えます。")
+    if on_ready is not None:
+        on_ready()
+    return True
+
+
+# -- 衝突 --
+#
+# ホスト開始後、Driveから取得する前にサーバーが作成したリージョンは
+# conflicts.jsonに記録する。記録したファイルはアップロードせず（Driveの版を
+# 優先）、ホスト終了後に状態フォルダのconflicts/へ退避してDriveの版を取得する。
+
+def _conflicts_path(config: dict) -> str:
+    return os.path.join(get_state_dir(config), "conflicts.json")
 
 
-def upload_world(config: dict) -> bool:
+def _load_conflicts(config: dict) -> set[str]:
+    return set((_load_json(_conflicts_path(config)) or {}).get("files", []))
+
+
+def _save_conflicts(config: dict, rels) -> None:
+    path = _conflicts_path(config)
+    if not rels:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    _save_json(path, {"files": sorted(rels)})
+
+
+def _set_aside_conflicts(config: dict, local_path: str) -> set[str]:
+    """記録済みの衝突ファイルを状態フォルダへ退避し、記録を返す
+    （記録はDriveの版を取得できるまで残す）"""
+    rels = _load_conflicts(config)
+    present = [rel for rel in sorted(rels)
+               if os.path.isfile(os.path.join(local_path, rel))]
+    if present:
+        dest = os.path.join(get_state_dir(config), "conflicts",
+                            datetime.now().strftime('%Y-%m-%d_%H%M%S'))
+        for rel in present:
+            target = os.path.join(dest, rel)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(os.path.join(local_path, rel), target)
+        print(f"[衝突] サーバーが作成した {len(present)}件を退避しました: {dest}")
+    return rels
+
+
+def resolve_conflicts(config: dict) -> bool:
+    """ホスト終了後に、衝突したファイルをDriveの版へ置き換える"""
+    local_path = os.path.join(config["curseforge_instance_path"], "saves",
+                              config["world_name"])
+    rels = _set_aside_conflicts(config, local_path)
+    if not rels:
+        return True
+    index = None
+    if config.get("region_delta"):
+        index = _read_remote_json(config, _remote_world(config, _REGIONS))
+    if index is not None:
+        ok = _download_regions(config, local_path, index, only=rels)
+    else:
+        remote = read_remote_manifest(config)
+        ok = remote is not None and _fetch_verified(
+            config, local_path, remote, False,
+            only=rels & set(remote["files"])) is not None
+    if not ok:
+        print("[エラー] 衝突したファイルをDriveの版に置き換えられませんでした。"
+              "次回のダウンロードで取得し直します。")
+        return False
+    _save_conflicts(config, ())
+    print(f"[衝突] {len(rels)}件をDriveの版に置き換えました。")
+    return True
+
+
+def _verify_fetched(config: dict, remote: dict | None, delta: bool,
+                    only, keep, fetched: list[str]) -> list[str] | None:
+    """今回取得したファイルだけを照合する（DriveのMD5もそのファイルの分だけ取得）"""
+    if remote is None:
+        # マニフェストの無いワールドは全体同期のため、全体を照合する
+        def select(rel):
+            return rel in only if only is not None else rel not in keep
+        drive = None
+    else:
+        select = set(fetched).__contains__
+        stored_elsewhere = set(_pack_locations(remote.get("packs", {})))
+        stored_elsewhere |= set(remote.get("encoded", {}))
+        drive = _drive_md5s(config, [rel for rel in fetched
+                                     if rel not in stored_elsewhere])
+        if drive is None:
+            print("[警告] DriveのMD5を取得できませんでした。"
+                  "マニフェストのMD5のみで照合します。")
+            drive = {}
+    with timeline.span("verify", files=len(fetched)):
+        return verify_world(config, remote, delta, select, drive)
+
+
+def _fetch_verified(config: dict, local_path: str, remote: dict | None,
+                    delta: bool, only=None, keep=frozenset(),
+                    prune: bool | None = None) -> dict | None:
+    """取得して検証し、不一致があれば一度だけ取り直す"""
+    fetched = []
+    synced = _download_tree(config, local_path, remote, delta, only, keep,
+                            fetched, prune)
+    if synced is None or not config.get("verify_downloads", True):
+        return synced
+    if remote is not None and not fetched:
+        return synced
+
+    bad = _verify_fetched(config, remote, delta, only, keep, fetched)
+    if not bad:
+        return synced
+    # サイズと更新時刻が同じだとrcloneが転送を省くため、先に消す
+    print(f"[検証] {len(bad)}件がDriveと一致しません。再ダウンロードします。")
+    for rel in bad:
+        try:
+            os.remove(os.path.join(local_path, rel))
+        except OSError:
+            pass
+    fetched = []
+    synced = _download_tree(config, local_path, remote, delta, only, keep,
+                            fetched, prune)
+    if synced is None:
+        return None
+    bad = _verify_fetched(config, remote, delta, only, keep, fetched)
+    if bad:
+        for rel in bad[:10]:
+            print(f"[検証] 不一致: {rel}")
+        print("[エラー] ダウンロードしたワールドがDriveと一致しません。")
+        return None
+    return synced
+
+
+def _download_tree(config: dict, local_path: str, remote: dict | None,
+                   delta: bool, only=None, keep=frozenset(),
+                   fetched: list | None = None,
+                   prune: bool | None = None) -> dict | None:
+    if remote is not None:
+        return _download_files(config, local_path, remote, delta, only, keep,
+                               fetched, prune)
+    # マニフェストがまだ無いワールドは全体同期
+    print("[同期] マニフェストがありません。全体を同期します。")
+    if not _run_rclone(config, ["sync", _remote_world(config), local_path,
+                                *_sync_excludes(delta)], op="download"):
+        return None
+    return manifest.new_manifest(
+        manifest.scan(local_path, include=_manifest_filter(delta)), 0)
+
+
+# -- 整合性検証 --
+#
+# ダウンロード後のローカルファイルを、DriveのMD5（rclone md5sum、Driveが
+# 保存している値なので再ダウンロード不要）と照合する。バンドル・圧縮保存の
+# ファイルはマニフェストのMD5と照合する。計算したハッシュは
+# サイズ・更新時刻つきでキャッシュし、変更の無いファイルは再計算しない。
+
+def _hash_cache_path(config: dict) -> str:
+    return os.path.join(get_state_dir(config), "hash_cache.json")
+
+
+def _drive_md5s(config: dict, rels: list[str] | None = None) -> dict[str, str] | None:
+    """DriveのMD5一覧。relsを指定するとそのファイルだけを問い合わせる"""
+    args = ["md5sum", _remote_world(config)]
+    if rels is None:
+        args += ["--exclude", _META_EXCLUDE]
+    elif not rels:
+        return {}
+    else:
+        list_path = _write_list(os.path.join(get_state_dir(config), "md5.txt"),
+                                sorted(rels))
+        args += ["--files-from", list_path]
+    out = _rclone_output(config, args, timeout=300)
+    if out is None:
+        return None
+    md5s = {}
+    for line in out.splitlines():
+        md5, _, rel = line.partition("  ")
+        if rel and md5.strip():
+            md5s[rel] = md5.strip()
+    return md5s
+
+
+def verify_world(config: dict, remote: dict | None = None,
+                 delta: bool = False, select=None,
+                 drive: dict | None = None) -> list[str] | None:
+    """ローカルのワールドをDriveと照合し、一致しないファイルを返す。
+    照合できなかった場合はNone。selectで照合するファイルを絞り込める。
+    driveにDriveのMD5一覧を渡すと取得を省略する"""
+    local_path = os.path.join(config["curseforge_instance_path"], "saves",
+                              config["world_name"])
+    started = time.monotonic()
+    if drive is None:
+        drive = _drive_md5s(config)
+        if drive is None and remote is not None:
+            print("[警告] DriveのMD5を取得できませんでした。"
+                  "マニフェストのMD5のみで照合します。")
+    if remote is not None:
+        expected = {rel: entry[2] for rel, entry in remote["files"].items()}
+        if drive is not None:
+            stored_elsewhere = set(_pack_locations(remote.get("packs", {})))
+            stored_elsewhere |= set(remote.get("encoded", {}))
+            expected.update({
+                rel: md5 for rel, md5 in drive.items()
+                if rel in expected and rel not in stored_elsewhere
+            })
+    elif drive is not None:
+        include = _manifest_filter(delta)
+        expected = {
+            rel: md5 for rel, md5 in drive.items()
+            if include is None or include(rel)
+        }
+    else:
+        print("[警告] DriveのMD5を取得できないため、検証をスキップします。")
+        return None
+    if select is not None:
+        expected = {rel: md5 for rel, md5 in expected.items() if select(rel)}
+
+    cache_path = _hash_cache_path(config)
+    bad, cache = manifest.verify(local_path, expected,
+                                 _load_json(cache_path) or {})
+    _save_json(cache_path, cache)
+    print(f"[検証] {len(expected)}件を照合 "
+          f"({time.monotonic() - started:.1f}秒): 不一致 {len(bad)}件")
+    return bad
+
+
+def _upload_files(config: dict, local_path: str, local_files: dict,
+                  packs: dict, remote: dict, encoded: dict) -> bool | None:
+    """差分を転送。変更があればTrue、無ければFalse、失敗時はNone。
+    圧縮して保存したファイルはencodedに記録する"""
+    state_dir = get_state_dir(config)
+    changed, _removed = manifest.diff(local_files, remote["files"])
+    changed = set(changed)
+    remote_packs = remote.get("packs", {})
+    remote_encoded = remote.get("encoded", {})
+    local_packed = _pack_locations(packs)
+    remote_packed = _pack_locations(remote_packs)
+    codec = _codec_enabled(config)
+
+    def want_encoded(rel):
+        return codec and rel.endswith(".mca")
+
+    # バンドル外のファイル（バンドルから外れたファイル・保存形式が変わったファイルも含む）
+    send = [
+        rel for rel in sorted(local_files)
+        if rel not in local_packed
+        and (rel in changed or rel in remote_packed
+             or want_encoded(rel) != (rel in remote_encoded))
+    ]
+    remove = [
+        rel for rel in sorted(remote["files"])
+        if rel not in remote_packed and rel not in remote_encoded
+        and (rel not in local_files or rel in local_packed or want_encoded(rel))
+    ]
+    remove += [
+        _codec_name(rel) for rel in sorted(remote_encoded)
+        if rel not in local_files or not want_encoded(rel)
+    ]
+    encode = [rel for rel in send if want_encoded(rel)]
+    send = [rel for rel in send if not want_encoded(rel)]
+    encoded.update({
+        rel: remote_encoded[rel] for rel in local_files
+        if want_encoded(rel) and rel not in encode
+    })
+    bundles = [
+        pack_id for pack_id, p in packs.items()
+        if remote_packs.get(pack_id, {}).get("digest") != p["digest"]
+    ]
+    remove += [_bundle_name(pack_id) for pack_id in remote_packs
+               if pack_id not in packs]
+
+    if send:
+        print(f"[同期] 変更ファイル {len(send)}件をアップロード")
+        list_path = _write_list(os.path.join(state_dir, "send.txt"), send)
+        if not _run_rclone(config, ["copy", local_path, _remote_world(config),
+                                    "--files-from", list_path,
+                                    "--no-traverse"],
+                           op="upload",
+                           sizes=[local_files[rel][0] for rel in send]):
+            return None
+    if encode:
+        staging = os.path.join(state_dir, "codec_staging")
+        print(f"[同期] リージョン {len(encode)}件を圧縮中...")
+        try:
+            encoded.update(_stage_encoded(config, local_path, local_files,
+                                          encode, staging))
+        except (OSError, ValueError) as e:
+            print(f"[エラー] リージョンの圧縮に失敗しました: {e}")
+            return None
+        print(f"[同期] 圧縮したリージョン {len(encode)}件をアップロード")
+        if not _run_rclone(config, ["copy", staging, _remote_world(config),
+                                    "--no-traverse"],
+                           op="upload", sizes=_dir_sizes(staging)):
+            return None
+        shutil.rmtree(staging, ignore_errors=True)
+        os.remove(staging + ".json")
+    if bundles:
+        # 中断したアップロードの再開時は、作成済みのバンドルをそのまま使う
+        # （同じファイルなのでrcloneが転送済みの分をスキップする）
+        staging = os.path.join(state_dir, "pack_staging")
+        staged_path = os.path.join(state_dir, "pack_staging.json")
+        staged = _load_json(staged_path) or {}
+        os.makedirs(staging, exist_ok=True)
+        wanted = {_bundle_name(pack_id): pack_id for pack_id in bundles}
+        for rel in _dir_files(staging):
+            pack_id = wanted.get(rel)
+            if pack_id is None or staged.get(pack_id) != packs[pack_id]["digest"]:
+                os.remove(os.path.join(staging, rel))
+        n_files = 0
+        for pack_id in bundles:
+            rels = packs[pack_id]["files"]
+            dst = os.path.join(staging, _bundle_name(pack_id))
+            if not os.path.exists(dst):
+                packer.write_bundle(local_path, rels, dst)
+                staged[pack_id] = packs[pack_id]["digest"]
+            n_files += len(rels)
+        _save_json(staged_path, staged)
+        print(f"[同期] バンドル {len(bundles)}件 ({n_files}ファイル) をアップロード")
+        if not _run_rclone(config, ["copy", staging, _remote_world(config),
+                                    "--no-traverse"],
+                           op="upload", sizes=_dir_sizes(staging)):
+            return None
+        shutil.rmtree(staging, ignore_errors=True)
+        os.remove(staged_path)
+    if remove:
+        print(f"[同期] 削除ファイル {len(remove)}件をDriveから削除")
+        list_path = _write_list(os.path.join(state_dir, "remove.txt"), remove)
+        if not _remove_remote_files(config, list_path):
+            return None
+    return bool(send or encode or bundles or remove or changed)
+
+
+def snapshot_world(config: dict) -> str | None:
+    """プレイ中のワールドを一貫した状態でローカルに固定し、そのパスを返す"""
+    instance_path = config["curseforge_instance_path"]
+    local_path = os.path.join(instance_path, "saves", config["world_name"])
+    if not os.path.isdir(local_path):
+        return None
+    snap_dir = os.path.join(get_state_dir(config), "snapshot")
+    dest = os.path.join(snap_dir, "world")
+    started = time.monotonic()
+    try:
+        result = snapshot.take_snapshot(local_path, dest,
+                                        os.path.join(snap_dir, "index.json"))
+    except OSError as e:
+        print(f"[エラー] スナップショットの作成に失敗しました: {e}")
+        return None
+    print(f"[スナップショット] {result['copied']}件を更新 / 全{result['files']}件 "
+          f"({time.monotonic() - started:.1f}秒)")
+    return dest
+
+
+def upload_world(config: dict, source_path: str | None = None) -> bool:
+    """source_pathを指定すると、ライブのワールドではなくそのフォルダ
+    （snapshot_worldの結果など）からアップロードする"""
+    if config.get("backup_mode", "dedup") != "versioned":
+        return _upload_world(config, source_path)
+    _versioning.backup_dir = _remote_backups(
+        config, f"{_open_generation(config)}/"
+                f"{datetime.now(timezone.utc).strftime('%Y-%m-%d_%H%M%S_%f')}")
+    try:
+        return _upload_world(config, source_path)
+    finally:
+        _versioning.backup_dir = None
+
+
+def _upload_world(config: dict, source_path: str | None) -> bool:
     instance_path = config["curseforge_instance_path"]
     world_name = config["world_name"]
-    remote_name = config["rclone_remote_name"]
 
-    local_path = os.path.join(instance_path, "saves", world_name)
+    local_path = source_path or os.path.join(instance_path, "saves", world_name)
     if not os.path.isdir(local_path):
         print(f"[エラー] ワールドフォルダが見つかりません: {local_path}")
         return False
-    remote_path = f"{remote_name}:worlds/{world_name}"
+    remote_path = _remote_world(config)
+    delta = bool(config.get("region_delta"))
 
     print(f"\n[同期] アップロード中: {local_path} → Drive")
-    return _run_rclone(config, ["sync", local_path, remote_path])
+    remote = read_remote_manifest(config)
+    synced = _load_json(_manifest_state_path(config))
+    local_files = manifest.scan(local_path, synced, _manifest_filter(delta))
+    encoded = {}
+    # 衝突したファイルはDriveの版を優先する（アップロードも削除もしない）
+    pinned = _load_conflicts(config)
+    if pinned:
+        print(f"[衝突] Driveの版と衝突している {len(pinned)}件はアップロードしません。")
+    if remote is not None:
+        for rel in pinned & set(remote["files"]):
+            local_files[rel] = remote["files"][rel]
+
+    if remote is None and not check_remote_world_exists(config):
+        # Driveにまだ何も無いワールドは、空のマニフェストとの差分として送る
+        # （小さいファイルは最初からバンドル、リージョンは最初から圧縮）
+        remote = manifest.new_manifest({}, 0)
+
+    if remote is None and _codec_enabled(config):
+        # マニフェストの無い既存のワールド: リージョン以外を全体同期し、
+        # リージョンは圧縮して送り直す
+        if not _run_rclone(config, ["sync", local_path, remote_path,
+                                    *_sync_excludes(delta),
+                                    "--exclude", "*.mca"], op="upload",
+                           sizes=[entry[0] for entry in local_files.values()]):
+            return False
+        remote = manifest.new_manifest(local_files, 0)
+
+    if remote is None:
+        if not _run_rclone(config, ["sync", local_path, remote_path,
+                                    *_sync_excludes(delta)], op="upload",
+                           sizes=[entry[0] for entry in local_files.values()]):
+            return False
+        packs = {}
+        version = 1
+        dirty = True
+    else:
+        if synced and remote.get("version", 0) > synced.get("version", 0):
+            print("[警告] Drive上のワールドが最後の同期より新しい版です。上書きします。")
+        packs = _plan_packs(config, local_files)
+        dirty = _upload_files(config, local_path, local_files, packs, remote,
+                              encoded)
+        if dirty is None:
+            return False
+        version = remote.get("version", 0) + 1
+
+    if delta:
+        n_regions = _upload_regions(config, local_path, pinned)
+        if n_regions is None:
+            return False
+        dirty = dirty or n_regions > 0
+    if not dirty:
+        print("[同期] 変更はありません。")
+        return True
+
+    new = manifest.new_manifest(local_files, version, packs, encoded)
+    if not _write_remote_json(config, _remote_world(config, _MANIFEST), new):
+        return False
+    _save_json(_manifest_state_path(config), new)
+    _report_codec(config, new)
+    return True
+
+
+# -- リージョン差分同期 --
+#
+# Drive上ではリージョンファイル本体（ベース）の横に、変更チャンクだけを
+# 含むパッチを .mcmd/patches/ に積み上げる。.mcmd/regions.json が
+# 各リージョンの世代・パッチ数・チャンク表を保持する。
+
+def _region_state_path(config: dict) -> str:
+    return os.path.join(get_state_dir(config), "regions.json")
+
+
+def _patch_name(rel: str, gen: int, seq: int) -> str:
+    return f"{META_DIR}/patches/{rel}.{gen}.{seq}.patch"
+
+
+def _list_regions(local_path: str) -> list[str]:
+    regions = []
+    for root, _dirs, files in os.walk(local_path):
+        for name in files:
+            if name.endswith(".mca"):
+                rel = os.path.relpath(os.path.join(root, name), local_path)
+                regions.append(rel.replace(os.sep, "/"))
+    return sorted(regions)
+
+
+def _upload_regions(config: dict, local_path: str,
+                    pinned=frozenset()) -> int | None:
+    """変更のあったリージョン数を返す（失敗時はNone）。
+    pinnedのリージョンはDriveの版を残す"""
+    state_dir = get_state_dir(config)
+    staging = os.path.join(state_dir, "staging")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    index = _read_remote_json(config, _remote_world(config, _REGIONS))
+    regions = index["regions"] if index else {}
+    stale = []
+    n_base = n_patch = 0
+    staged_bytes = 0
+
+    local_regions = _list_regions(local_path)
+    for rel in local_regions:
+        if rel in pinned:
+            continue
+        src = os.path.join(local_path, rel)
+        try:
+            chunks = region_delta.read_chunks(src)
+        except OSError as e:
+            print(f"[警告] リージョンの読み込みに失敗: {rel} ({e})")
+            continue
+        table = region_delta.chunk_table(chunks)
+        entry = regions.get(rel)
+        if entry is not None:
+            changed, removed = region_delta.diff_chunks(chunks, entry["chunks"])
+            if not changed and not removed:
+                continue
+            patch = region_delta.build_patch(chunks, changed, removed)
+            patch_bytes = entry.get("patch_bytes", 0) + len(patch)
+            if (entry["patches"] < MAX_REGION_PATCHES
+                    and patch_bytes < os.path.getsize(src) // 2):
+                seq = entry["patches"] + 1
+                dst = os.path.join(staging, _patch_name(rel, entry["gen"], seq))
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                with open(dst, "wb") as f:
+                    f.write(patch)
+                entry.update(patches=seq, patch_bytes=patch_bytes, chunks=table)
+                n_patch += 1
+                staged_bytes += len(patch)
+                continue
+            stale += [_patch_name(rel, entry["gen"], s)
+                      for s in range(1, entry["patches"] + 1)]
+
+        # ベース（チャンク表と一致するよう再構築したリージョン）
+        dst = os.path.join(staging, rel)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        region_delta.write_region(dst, chunks)
+        regions[rel] = {
+            "gen": entry["gen"] + 1 if entry else 1,
+            "patches": 0, "patch_bytes": 0, "chunks": table,
+        }
+        n_base += 1
+        staged_bytes += os.path.getsize(dst)
+
+    for rel in set(regions) - set(local_regions) - set(pinned):
+        entry = regions.pop(rel)
+        stale.append(rel)
+        stale += [_patch_name(rel, entry["gen"], s)
+                  for s in range(1, entry["patches"] + 1)]
+
+    if n_base or n_patch:
+        print(f"[同期] リージョン差分: ベース {n_base}件 / パッチ {n_patch}件 "
+              f"({staged_bytes / 1024:.0f} KB)")
+        if not _run_rclone(config, ["copy", staging, _remote_world(config)],
+                           op="upload", sizes=_dir_sizes(staging)):
+            return None
+    if stale:
+        list_path = _write_list(os.path.join(state_dir, "stale.txt"), stale)
+        _remove_remote_files(config, list_path)
+    if n_base or n_patch or stale or index is None:
+        if not _write_remote_json(config, _remote_world(config, _REGIONS),
+                                  {"regions": regions}):
+            return None
+    _save_json(_region_state_path(config), regions)
+    shutil.rmtree(staging, ignore_errors=True)
+    return n_base + n_patch + len(stale)
+
+
+def _timestamps_match(path: str, table: dict[str, list]) -> bool:
+    try:
+        current = region_delta.read_timestamps(path)
+    except OSError:
+        return False
+    return current == {int(k): v[0] for k, v in table.items()}
+
+
+def _download_regions(config: dict, local_path: str, index: dict,
+                      only=None, skip=frozenset()) -> bool:
+    """onlyを指定すると、そのリージョンだけを取得し、削除は行わない。
+    skipのリージョンは取得しない"""
+    state_dir = get_state_dir(config)
+    staging = os.path.join(state_dir, "staging")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    regions = index.get("regions", {})
+    state = _load_json(_region_state_path(config)) or {}
+    plan = {}
+    fetch = []
+    for rel, entry in regions.items():
+        if rel in skip or (only is not None and rel not in only):
+            continue
+        dst = os.path.join(local_path, rel)
+        have = state.get(rel)
+        if (have and have["gen"] == entry["gen"]
+                and have["patches"] <= entry["patches"]
+                and _timestamps_match(dst, have["chunks"])):
+            if have["patches"] == entry["patches"]:
+                continue
+            with_base, start = False, have["patches"] + 1
+        else:
+            with_base, start = True, 1
+        patches = [_patch_name(rel, entry["gen"], s)
+                   for s in range(start, entry["patches"] + 1)]
+        plan[rel] = (with_base, patches)
+        fetch += ([rel] if with_base else []) + patches
+
+    if fetch:
+        n_base = sum(1 for b, _ in plan.values() if b)
+        print(f"[同期] リージョン差分: ベース {n_base}件 / "
+              f"パッチ {len(fetch) - n_base}件を取得")
+        list_path = _write_list(os.path.join(state_dir, "fetch.txt"), fetch)
+        if not _run_rclone(config, ["copy", _remote_world(config), staging,
+                                    "--files-from", list_path,
+                                    "--no-traverse"], op="download"):
+            return False
+
+    for rel, (with_base, patches) in plan.items():
+        dst = os.path.join(local_path, rel)
+        src = os.path.join(staging, rel) if with_base else dst
+        try:
+            chunks = region_delta.read_chunks(src)
+            for name in patches:
+                with open(os.path.join(staging, name), "rb") as f:
+                    region_delta.apply_patch(chunks, f.read())
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            region_delta.write_region(dst, chunks)
+        except (OSError, ValueError) as e:
+            print(f"[エラー] リージョンの復元に失敗: {rel} ({e})")
+            return False
+        state[rel] = regions[rel]
+
+    for rel in _list_regions(local_path) if only is None else ():
+        if rel not in regions:
+            os.remove(os.path.join(local_path, rel))
+    state = {rel: e for rel, e in state.items() if rel in regions}
+    _save_json(_region_state_path(config), state)
+    shutil.rmtree(staging, ignore_errors=True)
+    return True
 
 
 def create_backup(config: dict) -> bool:
+    """セッション終了時（アップロード前）のバックアップ。
+
+    copyはDrive上のワールド（セッション前の状態）を、dedupはローカルの
+    ワールド（これからアップロードするセッション後の状態）を保存する。
+    dedupでセッション前の状態に戻すには、ひとつ前の世代を復元する"""
+    if config.get("backup_mode", "dedup") == "versioned":
+        return _rotate_generation(config)
+    if config.get("backup_mode", "dedup") == "dedup":
+        instance_path = config["curseforge_instance_path"]
+        local_path = os.path.join(instance_path, "saves", config["world_name"])
+        if os.path.isdir(local_path):
+            return _create_dedup_backup(config, local_path)
+        print("[バックアップ] ローカルにワールドが無いため、Drive上でコピーします。")
+    return _create_copy_backup(config)
+
+
+def _create_copy_backup(config: dict) -> bool:
     remote_name = config["rclone_remote_name"]
     world_name = config["world_name"]
     backup_generations = config["backup_generations"]
@@ -100,7 +1224,8 @@ def create_backup(config: dict) -> bool:
     dst = f"{remote_name}:backups/{world_name}/{timestamp}"
 
     print(f"\n[バックアップ] 作成中: backups/{world_name}/{timestamp}")
-    success = _run_rclone(config, ["copy", src, dst], show_progress=False)
+    success = _run_rclone(config, ["copy", src, dst, "--exclude", _META_EXCLUDE],
+                          show_progress=False)
     if not success:
         print("[警告] バックアップの作成に失敗しました。")
         return False
@@ -108,47 +1233,354 @@ def create_backup(config: dict) -> bool:
     return True
 
 
-def _cleanup_old_backups(config: dict, max_generations: int) -> None:
-    rclone_exe = config["rclone_exe_path"]
-    rclone_conf = config["rclone_config_path"]
-    folder_id = config["rclone_drive_folder_id"]
-    remote_name = config["rclone_remote_name"]
+# -- 世代管理（サーバー側の移動によるバックアップ）--
+#
+# アップロードで上書き・削除されるファイルの旧版を、rcloneの --backup-dir で
+# backups/<world>/<世代>/<アップロード時刻>/ へDrive上で移動する（コピーしない）。
+# create_backup は新しい世代を開くだけなので、ワールドの大きさに関係なく一瞬で終わる。
+# 世代には、その世代が開いていた間に置き換えられたファイルだけが入る。
+# 現在の世代名はDrive上の backups/<world>/generation.json に置き、どのPCから
+# アップロードしても同じ世代に集まるようにする。
+
+_GENERATION = "generation.json"
+
+
+def _new_generation(config: dict) -> str | None:
+    generation = datetime.now(timezone.utc).strftime("%Y-%m-%d_%H%M%S")
+    if not _write_remote_json(config, _remote_backups(config, _GENERATION),
+                              {"generation": generation}):
+        return None
+    return generation
+
+
+def _open_generation(config: dict) -> str:
+    """現在の世代名。まだ無ければ開く"""
+    state = _read_remote_json(config, _remote_backups(config, _GENERATION))
+    if state and state.get("generation"):
+        return state["generation"]
+    generation = _new_generation(config)
+    if generation is None:
+        print("[警告] 世代の記録をDriveに保存できませんでした。")
+        generation = datetime.now(timezone.utc).strftime("%Y-%m-%d_%H%M%S")
+    return generation
+
+
+def _rotate_generation(config: dict) -> bool:
+    """以降のアップロードで置き換わる版を新しい世代に集め、古い世代を削除"""
+    generation = _new_generation(config)
+    if generation is None:
+        print("[警告] 新しい世代を開始できませんでした。")
+        return False
+    print(f"\n[バックアップ] 新しい世代を開始: backups/{config['world_name']}/{generation}"
+          "（このあとのアップロードで置き換わる旧版を保存）")
+    # 開いた世代はまだDrive上に無いので、それを含めて backup_generations 世代にする
+    _cleanup_old_backups(config, max(0, config["backup_generations"] - 1))
+    return True
+
+
+# -- 重複排除バックアップ --
+#
+# backups/<world>/store/ 以下にファイルをMD5名のブロブとして保存する。
+#   blobs/<md5[:2]>/<md5>   ファイル本体（全世代で共有）
+#   gens/<timestamp>.json   世代ごとのインデックス（相対パス -> [サイズ, 更新時刻, md5]）
+#   index.json              世代一覧と各ブロブの参照数
+
+_STORE = "store"
+
+
+def _blob_name(md5: str) -> str:
+    return f"blobs/{md5[:2]}/{md5}"
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _read_store_index(config: dict) -> dict:
+    index = _read_remote_json(config, _remote_backups(config, f"{_STORE}/index.json"))
+    if index is None:
+        return {"generations": [], "blobs": {}}
+    return index
+
+
+def _create_dedup_backup(config: dict, local_path: str) -> bool:
     world_name = config["world_name"]
+    state_dir = get_state_dir(config)
+    store = _remote_backups(config, _STORE)
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d_%H%M%S")
 
-    cmd = [
-        rclone_exe, "lsf", f"{remote_name}:backups/{world_name}",
-        "--config", rclone_conf,
-        "--drive-root-folder-id", folder_id,
-        "--dirs-only", "--max-depth", "1",
-    ]
+    print(f"\n[バックアップ] 作成中: backups/{world_name}/{_STORE}/gens/{timestamp}")
+    scan_path = os.path.join(state_dir, "backup_scan.json")
+    files = manifest.scan(local_path, _load_json(scan_path))
+    _save_json(scan_path, {"files": files})
+
+    index = _read_store_index(config)
+    if (not index["generations"] and config["backup_generations"] > 1
+            and check_remote_world_exists(config)):
+        # 最初の世代はセッション後の状態なので、それ以前のDrive上のワールドも
+        # 従来のコピーで残しておく（重複排除の世代が揃うと整理で消える）
+        _create_copy_backup(config)
+    blobs = index["blobs"]
+    missing = {}
+    for rel, (size, _mtime, md5) in files.items():
+        if md5 not in blobs and md5 not in missing:
+            missing[md5] = rel
+
+    staging = os.path.join(state_dir, "backup_staging")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    if missing:
+        new_bytes = 0
+        for md5, rel in missing.items():
+            src = os.path.join(local_path, rel)
+            _link_or_copy(src, os.path.join(staging, _blob_name(md5)))
+            new_bytes += os.path.getsize(src)
+        print(f"[バックアップ] 新規ブロブ {len(missing)}件 "
+              f"({new_bytes / 1024 / 1024:.1f} MB) / 全{len(files)}ファイル")
+        if not _run_rclone(config, ["copy", staging, store, "--no-traverse"],
+                           show_progress=False, op="backup",
+                           sizes=_dir_sizes(staging)):
+            print("[警告] バックアップの作成に失敗しました。")
+            return False
+    else:
+        print(f"[バックアップ] 新規ブロブなし / 全{len(files)}ファイル")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    if not _write_remote_json(config, f"{store}/gens/{timestamp}.json",
+                              manifest.new_manifest(files, 0)):
+        print("[警告] バックアップの作成に失敗しました。")
+        return False
+    sizes = {entry[2]: entry[0] for entry in files.values()}
+    for md5, size in sizes.items():
+        blobs.setdefault(md5, [size, 0])[1] += 1
+    index["generations"].append(timestamp)
+    to_delete = _prune_dedup_backups(config, index, config["backup_generations"])
+    # 新しいインデックスを先に書く（書き込みに失敗しても、インデックスが
+    # 消えたブロブを指すことはない。削除に失敗して残ったブロブは参照されない
+    # だけで、同じ内容が再びバックアップされれば上書きされる）
+    if not _write_remote_json(config, f"{store}/index.json", index):
+        return False
+    if to_delete:
+        list_path = _write_list(os.path.join(state_dir, "prune.txt"), to_delete)
+        if not _run_rclone(config, ["delete", store, "--files-from", list_path],
+                           show_progress=False):
+            print("[警告] バックアップのクリーンアップに失敗しました。")
+    # 以前のモードで作った時刻名のバックアップも、世代数の上限に含めて整理する
+    _cleanup_old_backups(config, max(0, config["backup_generations"]
+                                     - len(index["generations"])))
+    return True
+
+
+def _prune_dedup_backups(config: dict, index: dict, max_generations: int) -> list[str]:
+    """古い世代をインデックスから外し、削除すべきファイル（どの世代からも
+    参照されなくなったブロブと世代インデックス）の一覧を返す"""
+    gens = sorted(index["generations"])
+    if len(gens) <= max_generations:
+        return []
+    store = _remote_backups(config, _STORE)
+    blobs = index["blobs"]
+    to_delete = []
+    for gen in gens[: len(gens) - max_generations]:
+        print(f"[バックアップ] 古いバックアップを削除: {_STORE}/gens/{gen}")
+        data = _read_remote_json(config, f"{store}/gens/{gen}.json")
+        if data is None:
+            print(f"[警告] 世代インデックスを読めません（ブロブは保持）: {gen}")
+            continue
+        for md5 in {entry[2] for entry in data["files"].values()}:
+            if md5 in blobs:
+                blobs[md5][1] -= 1
+                if blobs[md5][1] <= 0:
+                    del blobs[md5]
+                    to_delete.append(_blob_name(md5))
+        to_delete.append(f"gens/{gen}.json")
+        index["generations"].remove(gen)
+    return to_delete
+
+
+def list_backups(config: dict) -> list[str] | None:
+    """restore_backupで復元できる世代名（新しい順）。一覧を取得できなければNone。
+    copyモードの全体コピーは対象外（Drive上のbackups/から手動で戻す）"""
+    mode = config.get("backup_mode", "dedup")
+    if mode == "versioned":
+        generations = _backup_dirs(config)
+    elif mode == "dedup":
+        generations = _read_store_index(config)["generations"]
+    else:
+        return []
+    return None if generations is None else sorted(generations, reverse=True)
+
+
+def restore_backup(config: dict, generation: str) -> bool:
+    """バックアップの世代をローカルのワールドフォルダに復元"""
+    if config.get("backup_mode", "dedup") == "versioned":
+        return _restore_generation(config, generation)
+    instance_path = config["curseforge_instance_path"]
+    local_path = os.path.join(instance_path, "saves", config["world_name"])
+    store = _remote_backups(config, _STORE)
+    data = _read_remote_json(config, f"{store}/gens/{generation}.json")
+    if data is None:
+        print(f"[エラー] バックアップが見つかりません: {generation}")
+        return False
+    files = data["files"]
+
+    state_dir = get_state_dir(config)
+    staging = os.path.join(state_dir, "restore_staging")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    needed = sorted({_blob_name(entry[2]) for entry in files.values()})
+    list_path = _write_list(os.path.join(state_dir, "restore.txt"), needed)
+    print(f"\n[復元] {generation} を復元中 ({len(files)}ファイル)")
+    sizes = list({entry[2]: entry[0] for entry in files.values()}.values())
+    if not _run_rclone(config, ["copy", store, staging,
+                                "--files-from", list_path, "--no-traverse"],
+                       op="download", sizes=sizes):
+        return False
+
+    shutil.rmtree(local_path, ignore_errors=True)
+    for rel, entry in files.items():
+        dst = os.path.join(local_path, rel)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copy2(os.path.join(staging, _blob_name(entry[2])), dst)
+    shutil.rmtree(staging, ignore_errors=True)
+    print(f"[復元] 完了: {generation}")
+    return True
+
+
+def _restore_generation(config: dict, generation: str) -> bool:
+    """世代管理のバックアップから、その世代を開いた時点のワールドを復元する。
+    Driveの現在の内容に、その世代以降に退避された最も古い版を重ねて当時の
+    Drive上の状態を組み立て、当時のマニフェストに従って展開する"""
+    instance_path = config["curseforge_instance_path"]
+    local_path = os.path.join(instance_path, "saves", config["world_name"])
+    generations = _backup_dirs(config)
+    if generations is None or generation not in generations:
+        print(f"[エラー] バックアップが見つかりません: {generation}")
+        return False
+
+    # 相対パス -> その版が入っている退避フォルダ（古いものを優先）
+    sources = {}
+    for gen in generations[generations.index(generation):]:
+        uploads = _backup_dirs(config, gen)
+        if uploads is None:
+            print(f"[エラー] バックアップの一覧を取得できませんでした: {gen}")
+            return False
+        for upload in uploads:
+            folder = f"{gen}/{upload}"
+            out = _rclone_output(config, ["lsf", _remote_backups(config, folder),
+                                          "--recursive", "--files-only"],
+                                 timeout=300)
+            if out is None:
+                print(f"[エラー] バックアップの一覧を取得できませんでした: {folder}")
+                return False
+            for rel in out.splitlines():
+                if rel.strip():
+                    sources.setdefault(rel.strip(), folder)
+
+    state_dir = get_state_dir(config)
+    staging = os.path.join(state_dir, "restore_staging")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    print(f"\n[復元] {generation} を開いた時点のワールドを復元中 "
+          f"（退避された版 {len(sources)}件）")
+    if not _run_rclone(config, ["copy", _remote_world(config), staging],
+                       op="download"):
+        return False
+    by_dir = {}
+    for rel, folder in sources.items():
+        by_dir.setdefault(folder, []).append(rel)
+    for folder, rels in sorted(by_dir.items()):
+        list_path = _write_list(os.path.join(state_dir, "restore.txt"), sorted(rels))
+        if not _run_rclone(config, ["copy", _remote_backups(config, folder), staging,
+                                    "--files-from", list_path, "--no-traverse"],
+                           op="download"):
+            return False
+
+    restored = os.path.join(state_dir, "restore_world")
+    shutil.rmtree(restored, ignore_errors=True)
     try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=30,
-            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0,
-        )
-        if result.returncode != 0:
-            return
-        dirs = sorted([
-            d.strip().rstrip("/")
-            for d in result.stdout.strip().split("\n") if d.strip()
-        ])
-        if len(dirs) <= max_generations:
-            return
-        dirs_to_delete = dirs[: len(dirs) - max_generations]
-        for d in dirs_to_delete:
-            print(f"[バックアップ] 古いバックアップを削除: backups/{world_name}/{d}")
-            delete_cmd = [
-                rclone_exe, "purge",
-                f"{remote_name}:backups/{world_name}/{d}",
-                "--config", rclone_conf,
-                "--drive-root-folder-id", folder_id,
-            ]
-            subprocess.run(
-                delete_cmd, capture_output=True, text=True, timeout=60,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0,
-            )
-    except Exception as e:
-        print(f"[警告] バックアップのクリーンアップに失敗しました: {e}")
+        _expand_remote_tree(config, staging, restored)
+    except (OSError, ValueError, KeyError, tarfile.TarError) as e:
+        print(f"[エラー] バックアップの展開に失敗しました: {e}")
+        return False
+    shutil.rmtree(local_path, ignore_errors=True)
+    shutil.move(restored, local_path)
+    shutil.rmtree(staging, ignore_errors=True)
+    print(f"[復元] 完了: {generation}")
+    return True
+
+
+def _expand_remote_tree(config: dict, tree: str, dest: str) -> None:
+    """Driveと同じ構成のフォルダ（バンドル・圧縮ファイル・リージョン差分を含む）を
+    マニフェストに従ってワールドに展開する。マニフェストに無いファイルは含めない"""
+    remote = _load_json(os.path.join(tree, _MANIFEST))
+    os.makedirs(dest, exist_ok=True)
+    if remote is None:
+        # マニフェストが無いワールドは全体同期なので、そのままコピー
+        shutil.copytree(tree, dest, dirs_exist_ok=True,
+                        ignore=lambda d, names: [META_DIR] if d == tree else [])
+    else:
+        packs = remote.get("packs", {})
+        encoded = remote.get("encoded", {})
+        for pack_id, p in packs.items():
+            packer.extract_bundle(os.path.join(tree, _bundle_name(pack_id)), dest,
+                                  p["files"])
+        packed = _pack_locations(packs)
+        for rel, entry in remote["files"].items():
+            if rel in packed:
+                continue
+            dst = os.path.join(dest, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if rel in encoded:
+                region_codec.decode(os.path.join(tree, _codec_name(rel)), dst)
+                os.utime(dst, ns=(entry[1], entry[1]))
+            else:
+                shutil.copy2(os.path.join(tree, rel), dst)
+    index = _load_json(os.path.join(tree, _REGIONS))
+    if not config.get("region_delta") or index is None:
+        return
+    for rel, entry in index.get("regions", {}).items():
+        chunks = region_delta.read_chunks(os.path.join(tree, rel))
+        for seq in range(1, entry["patches"] + 1):
+            with open(os.path.join(tree, _patch_name(rel, entry["gen"], seq)),
+                      "rb") as f:
+                region_delta.apply_patch(chunks, f.read())
+        dst = os.path.join(dest, rel)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        region_delta.write_region(dst, chunks)
+
+
+def _backup_dirs(config: dict, rel: str = "") -> list[str] | None:
+    """backups/<world>/（relを指定するとその下）の、時刻名のフォルダ（古い順）"""
+    out = _rclone_output(config, ["lsf", _remote_backups(config, rel),
+                                  "--dirs-only", "--max-depth", "1"],
+                         timeout=30)
+    if out is None:
+        return None
+    return sorted([
+        d.strip().rstrip("/")
+        for d in out.strip().split("\n")
+        if d.strip() and d.strip()[:4].isdigit()
+    ])
+
+
+def _cleanup_old_backups(config: dict, max_generations: int) -> None:
+    world_name = config["world_name"]
+
+    dirs = _backup_dirs(config)
+    if dirs is None:
+        return
+    if len(dirs) <= max_generations:
+        return
+    dirs_to_delete = dirs[: len(dirs) - max_generations]
+    for d in dirs_to_delete:
+        print(f"[バックアップ] 古いバックアップを削除: backups/{world_name}/{d}")
+        if not _run_rclone(config, ["purge", _remote_backups(config, d)],
+                           show_progress=False):
+            print("[警告] バックアップのクリーンアップに失敗しました。")
 
 
 def archive_world(config: dict) -> bool:
@@ -162,14 +1594,11 @@ def archive_world(config: dict) -> bool:
 
     print(f"\n[アーカイブ] {world_name} → backups/{world_name}_archived_{timestamp}")
 
-    success = _run_rclone(config, ["copy", src, dst], show_progress=False)
-    if not success:
-        print("[エラー] アーカイブのコピーに失敗しました。")
-        return False
-
-    success = _run_rclone(config, ["purge", src], show_progress=False)
+    # 同じリモート内の移動はフォルダごとのサーバー側移動になる（ファイル数に依存しない）
+    success = _run_rclone(config, ["move", src, dst, "--delete-empty-src-dirs"],
+                          show_progress=False)
     if not success:
-        print("[警告] 元データの削除に失敗しました（バックアップは作成済み）。")
+        print("[エラー] アーカイブの移動に失敗しました。")
         return False
 
     print(f"[アーカイブ] 完了: {world_name}")
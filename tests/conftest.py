@@ -0,0 +1,32 @@
+"""共通のフィクスチャ"""
+
+import shutil
+
+import pytest
+
+RCLONE = shutil.which("rclone")
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """ローカルのフォルダをDriveに見立てたrcloneリモートを使う設定を作る"""
+    if RCLONE is None:
+        pytest.skip("rcloneがインストールされていません")
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    conf = tmp_path / "rclone.conf"
+    conf.write_text(f"[test]\ntype = alias\nremote = {remote}\n", encoding="utf-8")
+
+    def make(instance, **options):
+        config = {
+            "rclone_exe_path": RCLONE,
+            "rclone_config_path": str(conf),
+            "rclone_drive_folder_id": "unused",
+            "rclone_remote_name": "test",
+            "world_name": "W",
+            "curseforge_instance_path": str(tmp_path / instance),
+            "adaptive_tuning": False,
+        }
+        config.update(options)
+        return config
+    return make
@@ -0,0 +1,76 @@
+"""world_sync.py: 重複排除バックアップの作成・整理・復元"""
+
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from modules import world_sync
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # 世代名は秒単位の時刻なので、呼ぶたびに1秒進める
+    times = iter(datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=s)
+                 for s in range(1000))
+
+    class FakeDatetime:
+        @staticmethod
+        def now(tz=None):
+            return next(times)
+
+    monkeypatch.setattr(world_sync, "datetime", FakeDatetime)
+
+
+def _write(root, files):
+    for rel, data in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+
+def _read(root):
+    return {p.relative_to(root).as_posix(): p.read_bytes()
+            for p in root.rglob("*") if p.is_file()}
+
+
+def test_dedup_backup_prune_and_restore(make_config, tmp_path):
+    config = make_config("A", backup_generations=2)
+    world = tmp_path / "A" / "saves" / "W"
+    _write(world, {"level.dat": b"v1", "playerdata/p0.dat": b"p0" * 10,
+                   "region/r.0.0.mca": b"region" * 100})
+    assert world_sync.upload_world(config)
+    backups = tmp_path / "remote" / "backups" / "W"
+
+    states = []
+    for version in (b"v1", b"v2", b"v3"):
+        (world / "level.dat").write_bytes(version)
+        states.append(_read(world))
+        assert world_sync.create_backup(config)
+        if version == b"v1":
+            # 最初の世代の前に、それまでのDrive上のワールドもコピーで残す
+            legacy = [p.name for p in backups.iterdir() if p.name != "store"]
+            assert len(legacy) == 1
+            assert (backups / legacy[0] / "level.dat").read_bytes() == b"v1"
+
+    store = backups / "store"
+    index = json.loads((store / "index.json").read_text())
+    assert len(index["generations"]) == 2
+    assert sorted(p.stem for p in (store / "gens").iterdir()) == index["generations"]
+    # 変わらないファイルは共有され、どの世代からも参照されないブロブは消える
+    on_disk = {p.name for p in (store / "blobs").rglob("*") if p.is_file()}
+    assert on_disk == set(index["blobs"])
+    assert len(on_disk) == 4
+    assert all(count == 2 for md5, (size, count) in index["blobs"].items()
+               if size != 2)
+    # 重複排除の世代が揃うと、以前の形式のバックアップは整理される
+    assert [p.name for p in backups.iterdir()] == ["store"]
+
+    (world / "level.dat").write_bytes(b"broken")
+    (world / "extra.dat").write_bytes(b"extra")
+    assert world_sync.restore_backup(config, index["generations"][0])
+    assert _read(world) == states[1]
+
+
+def test_restore_unknown_generation_fails(make_config):
+    assert not world_sync.restore_backup(make_config("A"), "2000-01-01_000000")
@@ -0,0 +1,78 @@
+"""world_sync.py: ホスト開始を早めるダウンロードと衝突の扱い"""
+
+import json
+import zlib
+
+import pytest
+
+from modules import manifest, region_delta, world_sync
+
+
+def _write_region(path, seed):
+    chunks = {i: (1000 + i, b"\x02" + zlib.compress(bytes([seed, i]) * 3000))
+              for i in range(seed, seed + 8)}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    region_delta.write_region(str(path), chunks)
+
+
+def _make_world(root):
+    (root / "playerdata").mkdir(parents=True)
+    (root / "playerdata" / "p0.dat").write_bytes(b"p0" * 50)
+    (root / "level.dat").write_bytes(b"level" * 100)
+    _write_region(root / "region" / "r.0.0.mca", 1)
+    _write_region(root / "region" / "r.0.1.mca", 2)
+    _write_region(root / "DIM-1" / "region" / "r.0.0.mca", 3)
+
+
+def _md5(path):
+    return manifest.file_md5(str(path))
+
+
+@pytest.mark.parametrize("delta", [False, True])
+def test_early_ready_never_prefers_regions_the_server_created(make_config,
+                                                              tmp_path, delta):
+    a = make_config("A", region_delta=delta)
+    b = make_config("B", region_delta=delta)
+    world_a = tmp_path / "A" / "saves" / "W"
+    world_b = tmp_path / "B" / "saves" / "W"
+    _make_world(world_a)
+    assert world_sync.upload_world(a)
+    assert world_sync.download_world(b)
+
+    # Bのネザーは古く、r.0.1はローカルに無い。r.5.5はDriveにだけある
+    _write_region(world_a / "DIM-1" / "region" / "r.0.0.mca", 9)
+    _write_region(world_a / "region" / "r.5.5.mca", 7)
+    assert world_sync.upload_world(a)
+    (world_b / "region" / "r.0.1.mca").unlink()
+
+    seen = {}
+
+    def on_ready():
+        # ローカルにあった古いリージョンはホスト開始前にDriveと一致している
+        seen["stale_synced"] = (_md5(world_b / "DIM-1" / "region" / "r.0.0.mca")
+                                == _md5(world_a / "DIM-1" / "region" / "r.0.0.mca"))
+        # 取得する前にサーバーがリージョンを生成する
+        _write_region(world_b / "region" / "r.0.1.mca", 42)
+
+    assert world_sync.download_world(b, on_ready=on_ready)
+    assert seen == {"stale_synced": True}
+    generated = _md5(world_b / "region" / "r.0.1.mca")
+    assert generated != _md5(world_a / "region" / "r.0.1.mca")
+    assert _md5(world_b / "region" / "r.5.5.mca") == _md5(world_a / "region" / "r.5.5.mca")
+    state = tmp_path / "B" / ".mcmultidrive" / "W"
+    assert json.loads((state / "conflicts.json").read_text()) == {
+        "files": ["region/r.0.1.mca"]}
+
+    # 衝突したリージョンはアップロードせず、Driveの版が残る
+    assert world_sync.upload_world(b)
+    c = make_config("C", region_delta=delta)
+    assert world_sync.download_world(c)
+    world_c = tmp_path / "C" / "saves" / "W"
+    assert _md5(world_c / "region" / "r.0.1.mca") == _md5(world_a / "region" / "r.0.1.mca")
+
+    # ホスト終了後、サーバーの版を退避してDriveの版に置き換える
+    assert world_sync.resolve_conflicts(b)
+    assert _md5(world_b / "region" / "r.0.1.mca") == _md5(world_a / "region" / "r.0.1.mca")
+    aside = list((state / "conflicts").glob("*/region/r.0.1.mca"))
+    assert len(aside) == 1 and _md5(aside[0]) == generated
+    assert not (state / "conflicts.json").exists()
@@ -0,0 +1,50 @@
+"""journal.py: 中断したセッション終了処理の再開"""
+
+import pytest
+
+from modules import journal
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, "get_data_dir", lambda: str(tmp_path))
+    return tmp_path
+
+
+def test_resume_from_the_first_unfinished_step():
+    journal.begin("W", "alice")
+    journal.complete("W", "backup")
+
+    # アプリが落ちた後の次回起動
+    (entry,) = journal.pending()
+    assert entry["world_name"] == "W" and entry["player_name"] == "alice"
+    assert journal.remaining(entry) == ["upload", "set_offline"]
+
+    journal.complete("W", "upload")
+    journal.complete("W", "upload")
+    (entry,) = journal.pending()
+    assert journal.remaining(entry) == ["set_offline"]
+
+    journal.complete("W", "set_offline")
+    assert journal.pending() == []
+    journal.finish("W")
+    journal.finish("W")
+    assert journal.pending() == []
+
+
+def test_custom_steps_and_world_names_with_separators():
+    journal.begin("team/W", "bob", steps=["upload", "set_offline"])
+    (entry,) = journal.pending()
+    assert entry["world_name"] == "team/W"
+    assert journal.remaining(entry) == ["upload", "set_offline"]
+
+
+def test_broken_and_partial_files_are_ignored(data_dir):
+    journal.begin("W", "alice")
+    folder = data_dir / "journal"
+    (folder / "broken.json").write_text("{", encoding="utf-8")
+    (folder / "W.json.tmp").write_text("{}", encoding="utf-8")
+    assert [e["world_name"] for e in journal.pending()] == ["W"]
+    # 完了の記録は開始していないワールドには作らない
+    journal.complete("other", "backup")
+    assert not (folder / "other.json").exists()
@@ -0,0 +1,85 @@
+"""local_backup.py: ローカル世代の作成・整理・復元"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from modules import local_backup
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    # 世代名は秒単位の時刻なので、呼ぶたびに1秒進める
+    clock = iter(datetime(2026, 1, 1) + timedelta(seconds=s) for s in range(100))
+
+    class FakeDatetime:
+        @staticmethod
+        def now():
+            return next(clock)
+
+    monkeypatch.setattr(local_backup, "datetime", FakeDatetime)
+    world = tmp_path / "saves" / "W"
+    (world / "region").mkdir(parents=True)
+    (world / "level.dat").write_bytes(b"v1")
+    (world / "region" / "r.0.0.mca").write_bytes(b"region-v1")
+    return {"curseforge_instance_path": str(tmp_path), "world_name": "W",
+            "local_generations": 2}
+
+
+def _world(config):
+    return os.path.join(config["curseforge_instance_path"], "saves", "W")
+
+
+def test_unchanged_files_are_shared_with_the_previous_generation(config):
+    first = local_backup.create_generation(config)
+    world = _world(config)
+    with open(os.path.join(world, "level.dat"), "wb") as f:
+        f.write(b"v2")
+    second = local_backup.create_generation(config)
+
+    generations = local_backup.list_generations(config)
+    assert [g["name"] for g in generations] == [second, first]
+    assert generations[0]["files"] == 2
+    assert generations[0]["new_bytes"] == len(b"v2")
+
+    root = os.path.join(config["curseforge_instance_path"], ".mcmultidrive", "W",
+                        "generations")
+    assert os.path.samefile(os.path.join(root, first, "region", "r.0.0.mca"),
+                            os.path.join(root, second, "region", "r.0.0.mca"))
+    # ワールド側をその場で書き換えても世代は変わらない
+    with open(os.path.join(world, "region", "r.0.0.mca"), "r+b") as f:
+        f.write(b"XX")
+    with open(os.path.join(root, first, "region", "r.0.0.mca"), "rb") as f:
+        assert f.read() == b"region-v1"
+
+
+def test_old_generations_are_pruned(config):
+    names = [local_backup.create_generation(config) for _ in range(3)]
+    assert [g["name"] for g in local_backup.list_generations(config)] == names[:0:-1]
+
+
+def test_restore_round_trip_keeps_the_state_before_restoring(config):
+    first = local_backup.create_generation(config)
+    world = _world(config)
+    with open(os.path.join(world, "level.dat"), "wb") as f:
+        f.write(b"v2")
+    with open(os.path.join(world, "new.dat"), "wb") as f:
+        f.write(b"new")
+
+    assert local_backup.restore_generation(config, first)
+    with open(os.path.join(world, "level.dat"), "rb") as f:
+        assert f.read() == b"v1"
+    assert not os.path.exists(os.path.join(world, "new.dat"))
+
+    # 復元前の状態も世代として残る
+    before = local_backup.list_generations(config)[0]["name"]
+    assert before != first
+    assert local_backup.restore_generation(config, before)
+    with open(os.path.join(world, "new.dat"), "rb") as f:
+        assert f.read() == b"new"
+
+
+def test_disabled_and_missing_generations(config):
+    assert local_backup.create_generation({**config, "local_generations": 0}) is None
+    assert not local_backup.restore_generation(config, "2000-01-01_000000")
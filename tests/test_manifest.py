@@ -0,0 +1,75 @@
+"""manifest.py: 差分・走査・検証"""
+
+import os
+
+from modules import manifest
+
+
+def _entry(size, mtime, md5):
+    return [size, mtime, md5]
+
+
+def test_diff_detects_changed_new_and_removed():
+    source = {
+        "same.dat": _entry(10, 1, "a"),
+        "resized.dat": _entry(11, 1, "b"),
+        "rehashed.dat": _entry(10, 1, "c2"),
+        "new.dat": _entry(5, 1, "d"),
+    }
+    target = {
+        "same.dat": _entry(10, 1, "a"),
+        "resized.dat": _entry(10, 1, "b"),
+        "rehashed.dat": _entry(10, 1, "c1"),
+        "gone.dat": _entry(3, 1, "e"),
+    }
+    changed, removed = manifest.diff(source, target)
+    assert changed == ["new.dat", "rehashed.dat", "resized.dat"]
+    assert removed == ["gone.dat"]
+
+
+def test_diff_ignores_mtime_only_changes():
+    # 更新時刻だけが違うファイル（別のPCでダウンロードしたもの）は転送しない
+    source = {"level.dat": _entry(10, 111, "a")}
+    target = {"level.dat": _entry(10, 222, "a")}
+    assert manifest.diff(source, target) == ([], [])
+
+
+def test_scan_reuses_hashes_for_unchanged_files(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "a.dat").write_bytes(b"aaa")
+    (tmp_path / "level.dat").write_bytes(b"level")
+    first = manifest.scan(str(tmp_path))
+    assert set(first) == {"data/a.dat", "level.dat"}
+    assert first["level.dat"][2] == manifest.file_md5(str(tmp_path / "level.dat"))
+
+    # サイズと更新時刻が同じなら前回のハッシュをそのまま使う
+    previous = {"files": {rel: [e[0], e[1], "cached"] for rel, e in first.items()}}
+    assert {e[2] for e in manifest.scan(str(tmp_path), previous).values()} == {"cached"}
+
+    (tmp_path / "level.dat").write_bytes(b"changed")
+    rescanned = manifest.scan(str(tmp_path), previous)
+    assert rescanned["data/a.dat"][2] == "cached"
+    assert rescanned["level.dat"][2] == manifest.file_md5(str(tmp_path / "level.dat"))
+
+
+def test_scan_include_filter(tmp_path):
+    (tmp_path / "r.0.0.mca").write_bytes(b"region")
+    (tmp_path / "level.dat").write_bytes(b"level")
+    files = manifest.scan(str(tmp_path), include=lambda rel: not rel.endswith(".mca"))
+    assert set(files) == {"level.dat"}
+
+
+def test_verify_reports_mismatched_and_missing(tmp_path):
+    (tmp_path / "ok.dat").write_bytes(b"ok")
+    (tmp_path / "bad.dat").write_bytes(b"bad")
+    expected = {
+        "ok.dat": manifest.file_md5(str(tmp_path / "ok.dat")),
+        "bad.dat": "0" * 32,
+        "missing.dat": "1" * 32,
+    }
+    bad, cache = manifest.verify(str(tmp_path), expected, {})
+    assert bad == ["bad.dat", "missing.dat"]
+    # 一致したファイルだけをキャッシュする
+    assert set(cache) == {"ok.dat"}
+    st = os.stat(tmp_path / "ok.dat")
+    assert cache["ok.dat"] == [st.st_size, st.st_mtime_ns, expected["ok.dat"]]
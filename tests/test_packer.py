@@ -0,0 +1,82 @@
+"""packer.py: 小さいファイルのバンドル"""
+
+import pytest
+
+from modules import manifest, packer
+
+
+def _world(tmp_path):
+    root = tmp_path / "world"
+    (root / "playerdata").mkdir(parents=True)
+    for i in range(3):
+        (root / "playerdata" / f"p{i}.dat").write_bytes(bytes([i]) * 100)
+    (root / "region").mkdir()
+    (root / "region" / "r.0.0.mca").write_bytes(b"r" * 100)
+    (root / "data").mkdir()
+    (root / "data" / "only.dat").write_bytes(b"x")
+    (root / "level.dat").write_bytes(b"level")
+    return root
+
+
+def test_plan_groups_small_files_by_folder(tmp_path):
+    files = manifest.scan(str(_world(tmp_path)))
+    packs = packer.plan(files)
+    # 直下のファイル・リージョン・1件だけのフォルダはバンドルしない
+    assert packs == {"playerdata": ["playerdata/p0.dat", "playerdata/p1.dat",
+                                    "playerdata/p2.dat"]}
+
+
+def test_plan_skips_large_files(tmp_path):
+    files = manifest.scan(str(_world(tmp_path)))
+    assert packer.plan(files, max_file=50) == {}
+
+
+def test_digest_changes_with_member_content(tmp_path):
+    root = _world(tmp_path)
+    files = manifest.scan(str(root))
+    rels = packer.plan(files)["playerdata"]
+    before = packer.digest(files, rels)
+    assert packer.digest(files, list(reversed(rels))) == before
+
+    (root / "playerdata" / "p1.dat").write_bytes(b"changed")
+    assert packer.digest(manifest.scan(str(root)), rels) != before
+    assert packer.digest(files, rels + ["playerdata/missing.dat"]) is None
+
+
+def test_bundle_round_trip(tmp_path):
+    root = _world(tmp_path)
+    rels = packer.plan(manifest.scan(str(root)))["playerdata"]
+    bundle = tmp_path / "staging" / packer.bundle_filename("playerdata")
+    packer.write_bundle(str(root), rels, str(bundle))
+
+    out = tmp_path / "out"
+    packer.extract_bundle(str(bundle), str(out), rels)
+    for rel in rels:
+        src, dst = root / rel, out / rel
+        assert dst.read_bytes() == src.read_bytes()
+        assert int(dst.stat().st_mtime) == int(src.stat().st_mtime)
+
+
+def test_extract_subset_leaves_other_members_alone(tmp_path):
+    root = _world(tmp_path)
+    rels = packer.plan(manifest.scan(str(root)))["playerdata"]
+    bundle = tmp_path / packer.bundle_filename("playerdata")
+    packer.write_bundle(str(root), rels, str(bundle))
+
+    (root / "playerdata" / "p0.dat").write_bytes(b"local")
+    packer.extract_bundle(str(bundle), str(root), rels[1:])
+    assert (root / "playerdata" / "p0.dat").read_bytes() == b"local"
+
+
+def test_extract_rejects_bundle_that_does_not_match_index(tmp_path):
+    root = _world(tmp_path)
+    rels = packer.plan(manifest.scan(str(root)))["playerdata"]
+    bundle = tmp_path / packer.bundle_filename("playerdata")
+    packer.write_bundle(str(root), rels[:2], str(bundle))
+    with pytest.raises(ValueError):
+        packer.extract_bundle(str(bundle), str(tmp_path / "out"), rels)
+
+
+def test_bundle_filename_is_flat():
+    name = packer.bundle_filename("DIM-1/data#3")
+    assert "/" not in name and name.endswith(".tar.gz")
@@ -0,0 +1,112 @@
+"""rclone_rc.py: 引数の変換と、実際のrclone rcdを使った転送"""
+
+import hashlib
+import shutil
+
+import pytest
+
+from modules import rclone_rc
+
+
+def test_translate_copy_with_filters():
+    kind, method, params = rclone_rc.translate([
+        "copy", "/tmp/world", "gdrive:worlds/W",
+        "--files-from", "list.txt", "--no-traverse", "--transfers", "4",
+        "--drive-chunk-size", "16M", "--use-json-log",
+    ])
+    assert (kind, method) == ("job", "sync/copy")
+    assert params["srcFs"] == "/tmp/world"
+    assert params["dstFs"] == "gdrive,chunk_size=16M:worlds/W"
+    assert params["_filter"] == {"FilesFrom": ["list.txt"]}
+    assert params["_config"] == {"Transfers": 4, "NoTraverse": True}
+
+
+def test_translate_copyto_splits_file_paths():
+    kind, method, params = rclone_rc.translate(
+        ["copyto", "/tmp/m.json", "gdrive:worlds/W/.mcmd/manifest.json"])
+    assert (kind, method) == ("call", "operations/copyfile")
+    assert (params["srcFs"], params["srcRemote"]) == ("/tmp", "m.json")
+    assert (params["dstFs"], params["dstRemote"]) == ("gdrive:worlds/W/.mcmd",
+                                                      "manifest.json")
+
+
+def test_translate_rejects_unsupported_arguments():
+    # 対応していないフラグ・再帰的な一覧はサブプロセスで実行する
+    assert rclone_rc.translate(["copy", "a", "gdrive:b", "--checksum"]) is None
+    assert rclone_rc.translate(["lsf", "gdrive:b", "--max-depth", "2"]) is None
+    assert rclone_rc.translate(["lsf", "gdrive:b", "--recursive"]) is None
+    assert rclone_rc.translate([]) is None
+
+
+# -- 実際のrclone rcd（ローカルのフォルダをリモートとして使う）--
+
+RCLONE = shutil.which("rclone")
+
+
+@pytest.fixture
+def rcd(tmp_path):
+    if RCLONE is None:
+        pytest.skip("rcloneがインストールされていません")
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    conf = tmp_path / "rclone.conf"
+    conf.write_text(f"[test]\ntype = alias\nremote = {remote}\n", encoding="utf-8")
+    if not rclone_rc.start_daemon(RCLONE, str(conf), "unused"):
+        pytest.fail("rclone rcdを起動できませんでした")
+    yield remote
+    rclone_rc.stop_daemon()
+
+
+def _make_world(root):
+    files = {
+        "level.dat": b"level" * 100,
+        "playerdata/p0.dat": b"p0" * 50,
+        "region/r.0.0.mca": bytes(range(256)) * 64,
+    }
+    for rel, data in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return files
+
+
+def test_rcd_copy_list_and_md5(rcd, tmp_path):
+    world = tmp_path / "world"
+    files = _make_world(world)
+
+    stats = []
+    assert rclone_rc.run(["copy", str(world), "test:worlds/W"], stats.append) == (True, "")
+    for rel, data in files.items():
+        assert (rcd / "worlds" / "W" / rel).read_bytes() == data
+
+    handled, out = rclone_rc.output(["lsf", "test:worlds/W", "--max-depth", "1"])
+    assert handled
+    assert sorted(out.split()) == ["level.dat", "playerdata/", "region/"]
+
+    handled, out = rclone_rc.output(["md5sum", "test:worlds/W"])
+    assert handled
+    md5s = {}
+    for line in out.splitlines():
+        md5, _, rel = line.partition("  ")
+        md5s[rel] = md5
+    assert md5s == {rel: hashlib.md5(data).hexdigest() for rel, data in files.items()}
+
+    handled, out = rclone_rc.output(["cat", "test:worlds/W/level.dat"])
+    assert handled and out == files["level.dat"].decode()
+
+
+def test_rcd_copy_files_from(rcd, tmp_path):
+    world = tmp_path / "world"
+    _make_world(world)
+    listing = tmp_path / "list.txt"
+    listing.write_text("level.dat\n", encoding="utf-8")
+    ok, _ = rclone_rc.run(["copy", str(world), "test:worlds/W",
+                           "--files-from", str(listing), "--no-traverse"])
+    assert ok
+    copied = [p.relative_to(rcd).as_posix() for p in rcd.rglob("*") if p.is_file()]
+    assert copied == ["worlds/W/level.dat"]
+
+
+def test_rcd_missing_file_is_handled_as_failure(rcd):
+    handled, out = rclone_rc.output(["cat", "test:worlds/W/missing.json"])
+    assert handled and out is None
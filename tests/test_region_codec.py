@@ -0,0 +1,56 @@
+"""region_codec.py: エンコードとデコードでバイト単位で元のファイルに戻る"""
+
+import os
+import random
+import zlib
+
+import pytest
+
+from modules import region_codec, region_delta
+
+
+def _make_region(path):
+    rnd = random.Random(0)
+    chunks = {}
+    for i in range(0, 64, 3):
+        data = bytes(rnd.getrandbits(8) for _ in range(64)) * 50
+        # Minecraftの既定レベルと、それ以外のレベルで圧縮したチャンク
+        level = 6 if i % 2 else 9
+        chunks[i] = (1000 + i, b"\x02" + zlib.compress(data, level))
+    chunks[2] = (1002, b"\x03" + os.urandom(300))   # 非圧縮形式はそのまま保存
+    region_delta.write_region(str(path), chunks)
+
+
+@pytest.mark.parametrize("codec", ["lzma", "zstd"])
+def test_encode_decode_is_byte_exact(tmp_path, codec):
+    if codec == "zstd" and region_codec.zstandard is None:
+        pytest.skip("zstandardがインストールされていません")
+    src = tmp_path / "r.0.0.mca"
+    _make_region(src)
+    # 末尾の空きセクタ（ゴミ）も元のまま戻る
+    with open(src, "ab") as f:
+        f.write(os.urandom(1000))
+
+    encoded = tmp_path / "enc" / "r.0.0.mcz"
+    size = region_codec.encode(str(src), str(encoded), codec)
+    assert size == encoded.stat().st_size < src.stat().st_size
+
+    out = tmp_path / "out.mca"
+    region_codec.decode(str(encoded), str(out))
+    assert out.read_bytes() == src.read_bytes()
+
+
+def test_decode_rejects_corrupt_input(tmp_path):
+    src = tmp_path / "r.0.0.mca"
+    _make_region(src)
+    encoded = tmp_path / "r.0.0.mcz"
+    region_codec.encode(str(src), str(encoded), "lzma")
+    data = bytearray(encoded.read_bytes())
+    data[10] ^= 1   # ヘッダーの元のサイズ
+    encoded.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        region_codec.decode(str(encoded), str(tmp_path / "out.mca"))
+    bad = tmp_path / "bad.mcz"
+    bad.write_bytes(b"nope")
+    with pytest.raises(ValueError):
+        region_codec.decode(str(bad), str(tmp_path / "out.mca"))
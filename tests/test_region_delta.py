@@ -0,0 +1,52 @@
+"""region_delta.py: チャンク単位のパッチの作成と適用"""
+
+import zlib
+
+import pytest
+
+from modules import region_delta
+
+
+def _chunk(i, version=0):
+    return (1000 + i + version, b"\x02" + zlib.compress(bytes([i % 256, version]) * 2000))
+
+
+def test_write_and_read_region_round_trip(tmp_path):
+    chunks = {i: _chunk(i) for i in (0, 5, 31, 1023)}
+    path = tmp_path / "r.0.0.mca"
+    region_delta.write_region(str(path), chunks)
+    assert region_delta.read_chunks(str(path)) == chunks
+    assert region_delta.read_timestamps(str(path)) == {i: ts for i, (ts, _) in chunks.items()}
+
+
+def test_patch_round_trip_reproduces_the_new_region(tmp_path):
+    base = {i: _chunk(i) for i in range(10)}
+    table = region_delta.chunk_table(base)
+
+    new = dict(base)
+    new[3] = _chunk(3, version=1)       # 変更
+    new[42] = _chunk(42)                # 追加
+    del new[7]                          # 削除
+    changed, removed = region_delta.diff_chunks(new, table)
+    assert (changed, removed) == ([3, 42], [7])
+
+    patch = region_delta.build_patch(new, changed, removed)
+    restored = dict(base)
+    region_delta.apply_patch(restored, patch)
+    assert restored == new
+
+    # ファイルに書き出しても同じチャンク表になる
+    path = tmp_path / "r.0.0.mca"
+    region_delta.write_region(str(path), restored)
+    assert region_delta.chunk_table(region_delta.read_chunks(str(path))) == \
+        region_delta.chunk_table(new)
+
+
+def test_unchanged_region_produces_no_diff():
+    chunks = {i: _chunk(i) for i in range(4)}
+    assert region_delta.diff_chunks(chunks, region_delta.chunk_table(chunks)) == ([], [])
+
+
+def test_apply_patch_rejects_other_data():
+    with pytest.raises(ValueError):
+        region_delta.apply_patch({}, b"not a patch")
@@ -0,0 +1,47 @@
+"""snapshot.py: 取得後に元のワールドが書き換えられてもスナップショットが変わらない"""
+
+import os
+
+from modules import snapshot
+
+
+def _make_world(root):
+    files = {
+        "level.dat": b"level" * 20,
+        "playerdata/p0.dat": b"p0" * 20,
+        "data/raids.dat": b"raids" * 20,
+        "data/mymod/state.dat": b"mod" * 20,
+        "region/r.0.0.mca": b"region" * 20,
+    }
+    for rel, data in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return files
+
+
+def test_snapshot_survives_in_place_and_atomic_writes(tmp_path):
+    src = tmp_path / "world"
+    dest = tmp_path / "snap"
+    files = _make_world(src)
+    result = snapshot.take_snapshot(str(src), str(dest), str(tmp_path / "index.json"))
+    assert result["files"] == len(files)
+
+    # 一時ファイル+リネームで保存されるファイルだけをハードリンクする
+    assert os.path.samefile(src / "level.dat", dest / "level.dat")
+    assert os.path.samefile(src / "playerdata" / "p0.dat", dest / "playerdata" / "p0.dat")
+    for rel in ("data/raids.dat", "data/mymod/state.dat", "region/r.0.0.mca"):
+        assert not os.path.samefile(src / rel, dest / rel)
+
+    # その場での書き換え（data/・Mod・リージョン）
+    for rel in ("data/raids.dat", "data/mymod/state.dat", "region/r.0.0.mca"):
+        with open(src / rel, "r+b") as f:
+            f.write(b"XXXX")
+    # 一時ファイル+リネームでの保存（level.dat・playerdata）
+    for rel in ("level.dat", "playerdata/p0.dat"):
+        tmp = src / (rel + "_tmp")
+        tmp.write_bytes(b"rewritten")
+        os.replace(tmp, src / rel)
+
+    for rel, data in files.items():
+        assert (dest / rel).read_bytes() == data
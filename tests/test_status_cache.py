@@ -0,0 +1,67 @@
+"""status_mgr._apply_list: ワールド一覧キャッシュへの差分反映"""
+
+from modules import status_mgr
+
+
+def _row(name, status="offline", host=""):
+    return {"world_name": name, "status": status, "host": host}
+
+
+def _apply(cache, data):
+    with cache.lock:
+        status_mgr._apply_list(cache, data)
+    return cache.snapshot()
+
+
+def test_full_list_replaces_cache():
+    cache = status_mgr._WorldCache()
+    _apply(cache, {"worlds": [_row("old")], "version": 1})
+    worlds = _apply(cache, {"worlds": [_row("a"), _row("b")], "version": 2})
+    assert [w["world_name"] for w in worlds] == ["a", "b"]
+    assert cache.version == 2
+    assert cache.fetched > 0
+
+
+def test_partial_list_updates_changed_rows_only():
+    cache = status_mgr._WorldCache()
+    _apply(cache, {"worlds": [_row("a"), _row("b")], "version": 1})
+    worlds = _apply(cache, {
+        "partial": True,
+        "worlds": [_row("b", "online", "alice")],
+        "names": ["a", "b"],
+        "version": 2,
+    })
+    assert worlds == [_row("a"), _row("b", "online", "alice")]
+
+
+def test_partial_list_drops_deleted_worlds_and_follows_order():
+    cache = status_mgr._WorldCache()
+    _apply(cache, {"worlds": [_row("a"), _row("b"), _row("c")], "version": 1})
+    worlds = _apply(cache, {"partial": True, "worlds": [], "names": ["c", "a"],
+                            "version": 2})
+    assert [w["world_name"] for w in worlds] == ["c", "a"]
+    assert set(cache.rows) == {"a", "c"}
+
+
+def test_not_modified_keeps_rows_and_refreshes_age():
+    cache = status_mgr._WorldCache()
+    _apply(cache, {"worlds": [_row("a")], "version": 3})
+    cache.invalidate()
+    worlds = _apply(cache, {"not_modified": True})
+    assert worlds == [_row("a")]
+    assert cache.version == 3
+    assert cache.fetched > 0
+
+
+def test_snapshot_is_a_copy():
+    cache = status_mgr._WorldCache()
+    worlds = _apply(cache, {"worlds": [_row("a")], "version": 1})
+    worlds[0]["status"] = "online"
+    assert cache.snapshot() == [_row("a")]
+
+
+def test_legacy_gas_without_version():
+    cache = status_mgr._WorldCache()
+    _apply(cache, {"worlds": [_row("a")]})
+    # 版数の無いGASには毎回全件を要求する
+    assert cache.version is None
@@ -0,0 +1,60 @@
+"""world_sync.py: 最初のアップロード（Driveにマニフェストが無いワールド）"""
+
+import json
+
+import pytest
+
+from modules import world_sync
+
+
+def _make_world(root):
+    files = {
+        "level.dat": b"level" * 100,
+        "playerdata/p0.dat": b"p0" * 50,
+        "playerdata/p1.dat": b"p1" * 50,
+        "region/r.0.0.mca": bytes(range(256)) * 64,
+    }
+    for rel, data in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return files
+
+
+def _remote_files(root):
+    return sorted(p.relative_to(root).as_posix() for p in root.rglob("*")
+                  if p.is_file())
+
+
+def test_first_upload_bundles_small_files(make_config, tmp_path):
+    files = _make_world(tmp_path / "A" / "saves" / "W")
+    assert world_sync.upload_world(make_config("A"))
+
+    drive = tmp_path / "remote" / "worlds" / "W"
+    remote = json.loads((drive / ".mcmd" / "manifest.json").read_text())
+    assert remote["version"] == 1
+    assert sorted(remote["files"]) == sorted(files)
+    packed = {rel for p in remote["packs"].values() for rel in p["files"]}
+    assert {"playerdata/p0.dat", "playerdata/p1.dat"} <= packed
+    # バンドルしたファイルはバラで送らない
+    assert not (drive / "playerdata").exists()
+
+    assert world_sync.download_world(make_config("B"))
+    world_b = tmp_path / "B" / "saves" / "W"
+    for rel, data in files.items():
+        assert (world_b / rel).read_bytes() == data
+
+
+@pytest.mark.parametrize("options", [{}, {"region_codec": True}])
+def test_existing_world_without_manifest_is_replaced(make_config, tmp_path,
+                                                     options):
+    # 以前の版が全体同期したワールド（マニフェスト無し）
+    drive = tmp_path / "remote" / "worlds" / "W"
+    (drive / "old").mkdir(parents=True)
+    (drive / "old" / "stale.dat").write_bytes(b"stale")
+    files = _make_world(tmp_path / "A" / "saves" / "W")
+    assert world_sync.upload_world(make_config("A", **options))
+
+    assert world_sync.download_world(make_config("B", **options))
+    world_b = tmp_path / "B" / "saves" / "W"
+    assert _remote_files(world_b) == sorted(files)